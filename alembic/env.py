@@ -22,7 +22,7 @@ if config.config_file_name is not None:
 # In previous usages of Alembic, i had to do some `sys.path` manipulation to make it
 # so I could import my models, but now this can be done automatically by using alembic.ini
 # with the `prepend_sys_path` option.
-from furaffinity_scrape import db_model, utils, constants
+from furaffinity_scrape import db_model, utils, constants, partition_utils
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -39,6 +39,24 @@ logger.setLevel("INFO")
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+def include_object(object, name, type_, reflected, compare_to):
+    '''
+    the partitions of the partitioned tables (and the indexes and foreign keys postgres clones onto them)
+    are created at runtime by partition_utils, so they aren't in the models and autogenerate should
+    leave them alone
+    '''
+
+    if type_ == "table":
+        return not partition_utils.PartitionUtils.is_submission_partition_name(name)
+
+    if type_ == "index" and object.table is not None:
+        return not partition_utils.PartitionUtils.is_submission_partition_name(object.table.name)
+
+    if type_ == "foreign_key_constraint":
+        return not partition_utils.PartitionUtils.is_submission_partition_name(object.referred_table.name)
+
+    return True
+
 def get_our_own_sqla_url():
     '''
     Load our own application config and use it to get the SQLAlchemy URL
@@ -96,6 +114,7 @@ def run_async_migrations_with_existing_engine(connection:sqlalchemy.ext.asyncio.
     context.configure(
         connection=connection,
         target_metadata=target_metadata,
+        include_object=include_object,
         render_as_batch=True
     )
 
@@ -122,6 +141,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -0,0 +1,68 @@
+"""add submission_webpage_blob table for deduplicated webpages
+
+Revision ID: 35271223d4a6
+Revises: f904059dfcee
+Create Date: 2026-10-19 09:00:12.481516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from sqlalchemy_utils.types.arrow import ArrowType
+
+
+# revision identifiers, used by Alembic.
+revision = '35271223d4a6'
+down_revision = 'f904059dfcee'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    op.create_table('submission_webpage_blob',
+        sa.Column('blob_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('date_added', ArrowType(), nullable=False),
+        sa.Column('original_data_sha512', sa.Unicode(), nullable=False),
+        sa.Column('compressed_data_sha512', sa.Unicode(), nullable=False),
+        sa.Column('raw_compressed_webpage_data', sa.LargeBinary(), nullable=False),
+        sa.Column('reference_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('blob_id', name='PK-submission_webpage_blob-blob_id')
+    )
+
+    with op.batch_alter_table('submission_webpage_blob', schema=None) as batch_op:
+        batch_op.create_index('IXUQ-submission_webpage_blob-original_data_sha512', ['original_data_sha512'], unique=True)
+        batch_op.create_index('IX-submission_webpage_blob-compressed_data_sha512', ['compressed_data_sha512'], unique=False)
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'FK-submission_webpage-blob_id-submission_webpage_blob-blob_id',
+            'submission_webpage_blob',
+            ['blob_id'], ['blob_id'])
+        batch_op.create_index('IX-submission_webpage-blob_id', ['blob_id'], unique=False)
+        batch_op.alter_column('raw_compressed_webpage_data',
+               existing_type=sa.LargeBinary(),
+               nullable=True)
+
+
+def downgrade() -> None:
+
+    # put the data back inline for any rows that reference a blob before we drop the blob table
+    op.execute(
+        'UPDATE submission_webpage SET raw_compressed_webpage_data = submission_webpage_blob.raw_compressed_webpage_data '
+        'FROM submission_webpage_blob WHERE submission_webpage.blob_id = submission_webpage_blob.blob_id')
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.alter_column('raw_compressed_webpage_data',
+               existing_type=sa.LargeBinary(),
+               nullable=False)
+        batch_op.drop_index('IX-submission_webpage-blob_id')
+        batch_op.drop_constraint('FK-submission_webpage-blob_id-submission_webpage_blob-blob_id', type_='foreignkey')
+        batch_op.drop_column('blob_id')
+
+    with op.batch_alter_table('submission_webpage_blob', schema=None) as batch_op:
+        batch_op.drop_index('IX-submission_webpage_blob-compressed_data_sha512')
+        batch_op.drop_index('IXUQ-submission_webpage_blob-original_data_sha512')
+
+    op.drop_table('submission_webpage_blob')
@@ -0,0 +1,62 @@
+"""add compression_scheme columns and recompress_checkpoint table
+
+Revision ID: 8c1d5e7a42b9
+Revises: 35271223d4a6
+Create Date: 2026-10-19 09:30:41.207734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from sqlalchemy_utils.types.arrow import ArrowType
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d5e7a42b9'
+down_revision = '35271223d4a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    # everything stored before this was tar.xz, the server default fills that in for the existing rows
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('compression_scheme', sa.Unicode(), server_default='tar_xz', nullable=False))
+
+    with op.batch_alter_table('submission_webpage_blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('compression_scheme', sa.Unicode(), server_default='tar_xz', nullable=False))
+
+    op.create_table('recompress_checkpoint',
+        sa.Column('checkpoint_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('job_name', sa.Unicode(), nullable=False),
+        sa.Column('source', sa.Unicode(), nullable=False),
+        sa.Column('target_format', sa.Unicode(), nullable=False),
+        sa.Column('last_row_id', sa.Integer(), nullable=True),
+        sa.Column('last_file_path', sa.Unicode(), nullable=True),
+        sa.Column('items_done', sa.Integer(), nullable=False),
+        sa.Column('items_failed', sa.Integer(), nullable=False),
+        sa.Column('bytes_before', sa.BigInteger(), nullable=False),
+        sa.Column('bytes_after', sa.BigInteger(), nullable=False),
+        sa.Column('claimed_by', sa.Unicode(), nullable=True),
+        sa.Column('lease_expires', ArrowType(), nullable=True),
+        sa.Column('date_updated', ArrowType(), nullable=False),
+        sa.PrimaryKeyConstraint('checkpoint_id', name='PK-recompress_checkpoint-checkpoint_id')
+    )
+
+    with op.batch_alter_table('recompress_checkpoint', schema=None) as batch_op:
+        batch_op.create_index('IXUQ-recompress_checkpoint-job_name', ['job_name'], unique=True)
+
+
+def downgrade() -> None:
+
+    with op.batch_alter_table('recompress_checkpoint', schema=None) as batch_op:
+        batch_op.drop_index('IXUQ-recompress_checkpoint-job_name')
+
+    op.drop_table('recompress_checkpoint')
+
+    with op.batch_alter_table('submission_webpage_blob', schema=None) as batch_op:
+        batch_op.drop_column('compression_scheme')
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.drop_column('compression_scheme')
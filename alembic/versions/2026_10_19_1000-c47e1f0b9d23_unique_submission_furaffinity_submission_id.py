@@ -0,0 +1,54 @@
+"""make submission.furaffinity_submission_id unique
+
+Revision ID: c47e1f0b9d23
+Revises: 8c1d5e7a42b9
+Create Date: 2026-10-19 10:00:03.918273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e1f0b9d23'
+down_revision = '8c1d5e7a42b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    # before this there was nothing stopping two workers from creating a row for the same submission,
+    # keep one row per submission (a finished one if there is one, otherwise the oldest), point the
+    # webpages at it, and delete the rest
+    op.execute('''
+        CREATE TEMPORARY TABLE submission_dedupe ON COMMIT DROP AS
+        SELECT submission_id, first_value(submission_id) OVER (
+            PARTITION BY furaffinity_submission_id
+            ORDER BY (processed_status = 'finished') DESC, submission_id ASC) AS keep_submission_id
+        FROM submission
+    ''')
+
+    op.execute('''
+        UPDATE submission_webpage SET submission_id = submission_dedupe.keep_submission_id
+        FROM submission_dedupe
+        WHERE submission_webpage.submission_id = submission_dedupe.submission_id
+        AND submission_dedupe.submission_id <> submission_dedupe.keep_submission_id
+    ''')
+
+    op.execute('''
+        DELETE FROM submission USING submission_dedupe
+        WHERE submission.submission_id = submission_dedupe.submission_id
+        AND submission_dedupe.submission_id <> submission_dedupe.keep_submission_id
+    ''')
+
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.drop_index('IX-submission-furaffinity_submission_id')
+        batch_op.create_index('IXUQ-submission-furaffinity_submission_id', ['furaffinity_submission_id'], unique=True)
+
+
+def downgrade() -> None:
+
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.drop_index('IXUQ-submission-furaffinity_submission_id')
+        batch_op.create_index('IX-submission-furaffinity_submission_id', ['furaffinity_submission_id'], unique=False)
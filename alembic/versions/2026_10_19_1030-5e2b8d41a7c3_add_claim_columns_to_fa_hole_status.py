@@ -0,0 +1,35 @@
+"""add claimed_by and lease_expires to fa_hole_status
+
+Revision ID: 5e2b8d41a7c3
+Revises: c47e1f0b9d23
+Create Date: 2026-10-19 10:30:12.552961
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from sqlalchemy_utils.types.arrow import ArrowType
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2b8d41a7c3'
+down_revision = 'c47e1f0b9d23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    with op.batch_alter_table('fa_hole_status', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_by', sa.Unicode(), nullable=True))
+        batch_op.add_column(sa.Column('lease_expires', ArrowType(), nullable=True))
+
+
+def downgrade() -> None:
+
+    # anything that was claimed goes back to being todo
+    op.execute("UPDATE fa_hole_status SET processed_status = 'todo' WHERE processed_status = 'in_progress'")
+
+    with op.batch_alter_table('fa_hole_status', schema=None) as batch_op:
+        batch_op.drop_column('lease_expires')
+        batch_op.drop_column('claimed_by')
@@ -0,0 +1,182 @@
+"""range partition submission and fa_scrape_attempt by furaffinity_submission_id
+
+Revision ID: 9a7c3f25e8d1
+Revises: 5e2b8d41a7c3
+Create Date: 2026-10-19 11:00:27.340512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from sqlalchemy_utils.types.arrow import ArrowType
+
+
+# revision identifiers, used by Alembic.
+revision = '9a7c3f25e8d1'
+down_revision = '5e2b8d41a7c3'
+branch_labels = None
+depends_on = None
+
+# copied from constants at the time of this migration, partition_utils creates the partitions after this
+PARTITION_SIZE = 1000000
+PARTITIONS_AHEAD = 2
+
+
+def _submission_columns() -> list:
+
+    return [
+        sa.Column('submission_id', sa.Integer(), server_default=sa.text("nextval('submission_submission_id_seq'::regclass)"), nullable=False),
+        sa.Column('furaffinity_submission_id', sa.Integer(), nullable=False),
+        sa.Column('date_visited', ArrowType(), nullable=False),
+        sa.Column('submission_status', sa.Unicode(), nullable=False),
+        sa.Column('processed_status', sa.Unicode(), nullable=False),
+        sa.Column('claimed_by', sa.Unicode(), nullable=False),
+    ]
+
+def _fa_scrape_attempt_columns() -> list:
+
+    return [
+        sa.Column('scrape_attempt_id', sa.Integer(), server_default=sa.text("nextval('fa_scrape_attempt_scrape_attempt_id_seq'::regclass)"), nullable=False),
+        sa.Column('furaffinity_submission_id', sa.Integer(), nullable=False),
+        sa.Column('date_visited', ArrowType(), nullable=False),
+        sa.Column('processed_status', sa.Unicode(), nullable=False),
+        sa.Column('claimed_by', sa.Unicode(), nullable=False),
+        sa.Column('error_string', sa.Unicode(), nullable=True),
+    ]
+
+def _create_submission_indexes():
+
+    with op.batch_alter_table('submission', schema=None) as batch_op:
+        batch_op.create_index('IXUQ-submission-furaffinity_submission_id', ['furaffinity_submission_id'], unique=True)
+        batch_op.create_index('IX-submission-date_visited', ['date_visited'], unique=False)
+        batch_op.create_index('IX-submission-submission_status', ['submission_status'], unique=False)
+        batch_op.create_index('IX-submission-processed_status', ['processed_status'], unique=False)
+        batch_op.create_index('IX-submission-claimed_by', ['claimed_by'], unique=False)
+
+def _create_fa_scrape_attempt_indexes():
+
+    with op.batch_alter_table('fa_scrape_attempt', schema=None) as batch_op:
+        batch_op.create_index('IX-fa_scrape_attempt-furaffinity_submission_id', ['furaffinity_submission_id'], unique=False)
+        batch_op.create_index('IX-fa_scrape_attempt-furaffinity_submission_id-processed_status', ['furaffinity_submission_id', 'processed_status'], unique=False)
+
+def _swap_table(table_name:str, id_column_name:str, column_list:list, primary_key_constraint, create_indexes_function, **table_kwargs):
+    '''
+    replaces the table with a new one with the same columns (the only difference being the primary key
+    and whether it is partitioned), reusing the id sequence so the ids keep going where they were
+    '''
+
+    sequence_name = f"{table_name}_{id_column_name}_seq"
+    old_table_name = f"{table_name}_old"
+
+    # so dropping the old table doesn't drop the sequence
+    op.execute(f'ALTER SEQUENCE "{sequence_name}" OWNED BY NONE')
+    op.execute(f'ALTER TABLE "{table_name}" RENAME TO "{old_table_name}"')
+
+    op.create_table(table_name, *column_list, primary_key_constraint, **table_kwargs)
+
+    if "postgresql_partition_by" in table_kwargs:
+        _create_partitions(table_name, old_table_name)
+
+    column_names = ", ".join(f'"{iter_column.name}"' for iter_column in column_list)
+    op.execute(f'INSERT INTO "{table_name}" ({column_names}) SELECT {column_names} FROM "{old_table_name}"')
+
+    # the index names are the same on both, so the old table has to go before the new indexes are created
+    op.execute(f'DROP TABLE "{old_table_name}"')
+    op.execute(f'ALTER SEQUENCE "{sequence_name}" OWNED BY "{table_name}"."{id_column_name}"')
+
+    create_indexes_function()
+
+def _create_partitions(table_name:str, old_table_name:str):
+    '''
+    creates the partitions that cover the existing rows, plus PARTITIONS_AHEAD empty ones
+    '''
+
+    bounds_row = op.get_bind().execute(sa.text(
+        f'SELECT min(furaffinity_submission_id), max(furaffinity_submission_id) FROM "{old_table_name}"')).one()
+
+    lowest_id = bounds_row[0] if bounds_row[0] is not None else 0
+    highest_id = bounds_row[1] if bounds_row[1] is not None else 0
+
+    first_lower_bound = (lowest_id // PARTITION_SIZE) * PARTITION_SIZE
+    last_lower_bound = (highest_id // PARTITION_SIZE) * PARTITION_SIZE + PARTITIONS_AHEAD * PARTITION_SIZE
+
+    for iter_lower_bound in range(first_lower_bound, last_lower_bound + PARTITION_SIZE, PARTITION_SIZE):
+
+        op.execute(f'CREATE TABLE "{table_name}_p{iter_lower_bound}" PARTITION OF "{table_name}" '
+            f'FOR VALUES FROM ({iter_lower_bound}) TO ({iter_lower_bound + PARTITION_SIZE})')
+
+
+def upgrade() -> None:
+
+    # foreign keys to a partitioned table have to include the partition key, so these get replaced
+    # by ones that include furaffinity_submission_id
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.drop_constraint('FK-submission_webpage-submission_id-submission-submission_id', type_='foreignkey')
+
+    with op.batch_alter_table('fa_scrape_content', schema=None) as batch_op:
+        batch_op.drop_constraint('FK-fa_scrape_content-a_id-fa_scrape_attempt-scrape_attempt_id', type_='foreignkey')
+
+    # unique constraints on a partitioned table have to include the partition key too
+    _swap_table('submission', 'submission_id', _submission_columns(),
+        sa.PrimaryKeyConstraint('submission_id', 'furaffinity_submission_id', name='PK-submission-submission_id-furaffinity_submission_id'),
+        _create_submission_indexes,
+        postgresql_partition_by='RANGE (furaffinity_submission_id)')
+
+    _swap_table('fa_scrape_attempt', 'scrape_attempt_id', _fa_scrape_attempt_columns(),
+        sa.PrimaryKeyConstraint('scrape_attempt_id', 'furaffinity_submission_id', name='PK-fa_scrape_attempt-scrape_attempt_id-fa_submission_id'),
+        _create_fa_scrape_attempt_indexes,
+        postgresql_partition_by='RANGE (furaffinity_submission_id)')
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('furaffinity_submission_id', sa.Integer(), nullable=True))
+
+    op.execute('''
+        UPDATE submission_webpage SET furaffinity_submission_id = submission.furaffinity_submission_id
+        FROM submission WHERE submission_webpage.submission_id = submission.submission_id
+    ''')
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.alter_column('furaffinity_submission_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('FK-submission_webpage-submission-submission', 'submission',
+            ['submission_id', 'furaffinity_submission_id'], ['submission_id', 'furaffinity_submission_id'])
+
+    with op.batch_alter_table('fa_scrape_content', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('furaffinity_submission_id', sa.Integer(), nullable=True))
+
+    op.execute('''
+        UPDATE fa_scrape_content SET furaffinity_submission_id = fa_scrape_attempt.furaffinity_submission_id
+        FROM fa_scrape_attempt WHERE fa_scrape_content.attempt_id = fa_scrape_attempt.scrape_attempt_id
+    ''')
+
+    with op.batch_alter_table('fa_scrape_content', schema=None) as batch_op:
+        batch_op.alter_column('furaffinity_submission_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('FK-fa_scrape_content-attempt-fa_scrape_attempt', 'fa_scrape_attempt',
+            ['attempt_id', 'furaffinity_submission_id'], ['scrape_attempt_id', 'furaffinity_submission_id'])
+
+
+def downgrade() -> None:
+
+    with op.batch_alter_table('fa_scrape_content', schema=None) as batch_op:
+        batch_op.drop_constraint('FK-fa_scrape_content-attempt-fa_scrape_attempt', type_='foreignkey')
+        batch_op.drop_column('furaffinity_submission_id')
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.drop_constraint('FK-submission_webpage-submission-submission', type_='foreignkey')
+        batch_op.drop_column('furaffinity_submission_id')
+
+    # dropping the partitioned tables drops their partitions too
+    _swap_table('fa_scrape_attempt', 'scrape_attempt_id', _fa_scrape_attempt_columns(),
+        sa.PrimaryKeyConstraint('scrape_attempt_id', name='PK-fa_scrape_attempt-scrape_attempt_id'),
+        _create_fa_scrape_attempt_indexes)
+
+    _swap_table('submission', 'submission_id', _submission_columns(),
+        sa.PrimaryKeyConstraint('submission_id', name='PK-submission-submission_id'),
+        _create_submission_indexes)
+
+    with op.batch_alter_table('fa_scrape_content', schema=None) as batch_op:
+        batch_op.create_foreign_key('FK-fa_scrape_content-a_id-fa_scrape_attempt-scrape_attempt_id', 'fa_scrape_attempt',
+            ['attempt_id'], ['scrape_attempt_id'])
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.create_foreign_key('FK-submission_webpage-submission_id-submission-submission_id', 'submission',
+            ['submission_id'], ['submission_id'])
@@ -0,0 +1,74 @@
+"""add finished_submission_range table and merge function
+
+Revision ID: 2f6d9b1c4e07
+Revises: 9a7c3f25e8d1
+Create Date: 2026-10-19 11:30:48.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6d9b1c4e07'
+down_revision = '9a7c3f25e8d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    op.create_table('finished_submission_range',
+        sa.Column('range_start', sa.Integer(), nullable=False),
+        sa.Column('range_end', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('range_start', name='PK-finished_submission_range-range_start')
+    )
+
+    with op.batch_alter_table('finished_submission_range', schema=None) as batch_op:
+        batch_op.create_index('IX-finished_submission_range-range_end', ['range_end'], unique=False)
+
+    # merges [p_range_start, p_range_end] with every range it overlaps or touches, writers are
+    # serialized with an advisory lock so two of them can't both merge with the same neighbours
+    op.execute('''
+        CREATE OR REPLACE FUNCTION merge_finished_submission_range(p_range_start integer, p_range_end integer)
+        RETURNS void AS $$
+        DECLARE
+            v_range_start integer := p_range_start;
+            v_range_end integer := p_range_end;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('finished_submission_range'));
+
+            SELECT least(v_range_start, min(range_start)), greatest(v_range_end, max(range_end))
+            INTO v_range_start, v_range_end
+            FROM finished_submission_range
+            WHERE range_end >= p_range_start - 1 AND range_start <= p_range_end + 1;
+
+            DELETE FROM finished_submission_range
+            WHERE range_end >= p_range_start - 1 AND range_start <= p_range_end + 1;
+
+            INSERT INTO finished_submission_range (range_start, range_end) VALUES (v_range_start, v_range_end);
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+
+    # backfill from the attempts that are already finished, gaps and islands
+    op.execute('''
+        INSERT INTO finished_submission_range (range_start, range_end)
+        SELECT min(furaffinity_submission_id), max(furaffinity_submission_id)
+        FROM (
+            SELECT furaffinity_submission_id,
+                furaffinity_submission_id - row_number() OVER (ORDER BY furaffinity_submission_id) AS island
+            FROM (SELECT DISTINCT furaffinity_submission_id FROM fa_scrape_attempt WHERE processed_status = 'finished') AS finished_ids
+        ) AS numbered_ids
+        GROUP BY island
+    ''')
+
+
+def downgrade() -> None:
+
+    op.execute('DROP FUNCTION merge_finished_submission_range(integer, integer)')
+
+    with op.batch_alter_table('finished_submission_range', schema=None) as batch_op:
+        batch_op.drop_index('IX-finished_submission_range-range_end')
+
+    op.drop_table('finished_submission_range')
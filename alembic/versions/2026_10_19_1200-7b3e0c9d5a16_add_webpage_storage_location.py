@@ -0,0 +1,59 @@
+"""add storage_location to the webpage tables so the blobs can live outside of the database
+
+Revision ID: 7b3e0c9d5a16
+Revises: 2f6d9b1c4e07
+Create Date: 2026-10-19 12:00:21.570412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy_utils.types.choice import ChoiceType
+
+from furaffinity_scrape import model
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3e0c9d5a16'
+down_revision = '2f6d9b1c4e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_location',
+            ChoiceType(model.BlobStorageLocation, impl=sa.Unicode()),
+            server_default='database', nullable=False))
+
+    with op.batch_alter_table('submission_webpage_blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_location',
+            ChoiceType(model.BlobStorageLocation, impl=sa.Unicode()),
+            server_default='database', nullable=False))
+        batch_op.alter_column('raw_compressed_webpage_data',
+            existing_type=sa.LargeBinary(),
+            nullable=True)
+
+
+def downgrade() -> None:
+
+    # the data for these rows only exists in the blob store, refuse rather than leave rows with no data
+    op.execute('''
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM submission_webpage WHERE storage_location = 'blob_store')
+                OR EXISTS (SELECT 1 FROM submission_webpage_blob WHERE storage_location = 'blob_store') THEN
+                RAISE EXCEPTION 'some webpages are only in the blob store, move them back into the database before downgrading';
+            END IF;
+        END
+        $$
+    ''')
+
+    with op.batch_alter_table('submission_webpage_blob', schema=None) as batch_op:
+        batch_op.alter_column('raw_compressed_webpage_data',
+            existing_type=sa.LargeBinary(),
+            nullable=False)
+        batch_op.drop_column('storage_location')
+
+    with op.batch_alter_table('submission_webpage', schema=None) as batch_op:
+        batch_op.drop_column('storage_location')
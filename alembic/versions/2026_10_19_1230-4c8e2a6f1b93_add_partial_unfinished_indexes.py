@@ -0,0 +1,46 @@
+"""add partial indexes that only cover the rows that still have work to do
+
+Revision ID: 4c8e2a6f1b93
+Revises: 7b3e0c9d5a16
+Create Date: 2026-10-19 12:30:44.102938
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from furaffinity_scrape.migration_utils import MigrationUtils
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e2a6f1b93'
+down_revision = '7b3e0c9d5a16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    # almost every row ends up `finished`, so these stay small no matter how big the tables get
+    #
+    # built concurrently so the scrapers can keep writing to these tables while they build
+
+    MigrationUtils.create_index_concurrently('IX-submission-furaffinity_submission_id-unfinished',
+        'submission', ['furaffinity_submission_id'],
+        postgresql_where="processed_status IN ('todo', 'error')")
+
+    MigrationUtils.create_index_concurrently('IX-fa_scrape_attempt-furaffinity_submission_id-unfinished',
+        'fa_scrape_attempt', ['furaffinity_submission_id'],
+        postgresql_where="processed_status IN ('todo', 'error')")
+
+    # FindFaHoles.claim_batch also reclaims `in_progress` rows whose lease expired, so those have to be
+    # in here too or the claim query can't use it
+    MigrationUtils.create_index_concurrently('IX-fa_hole_status-item_id-run_id-claimable',
+        'fa_hole_status', ['item_id', 'run_id'],
+        postgresql_where="processed_status IN ('todo', 'in_progress', 'error')")
+
+
+def downgrade() -> None:
+
+    MigrationUtils.drop_index_concurrently('IX-fa_hole_status-item_id-run_id-claimable', 'fa_hole_status')
+    MigrationUtils.drop_index_concurrently('IX-fa_scrape_attempt-furaffinity_submission_id-unfinished', 'fa_scrape_attempt')
+    MigrationUtils.drop_index_concurrently('IX-submission-furaffinity_submission_id-unfinished', 'submission')
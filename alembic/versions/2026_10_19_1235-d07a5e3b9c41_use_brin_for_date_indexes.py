@@ -0,0 +1,59 @@
+"""replace the b-tree indexes on the visited / added dates with BRIN indexes
+
+Revision ID: d07a5e3b9c41
+Revises: 4c8e2a6f1b93
+Create Date: 2026-10-19 12:35:10.447213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from furaffinity_scrape.migration_utils import MigrationUtils
+
+
+# revision identifiers, used by Alembic.
+revision = 'd07a5e3b9c41'
+down_revision = '4c8e2a6f1b93'
+branch_labels = None
+depends_on = None
+
+# these rows are only ever appended with the current time, so the dates follow the physical order of
+# the table and a BRIN index (a min / max per block range) is a tiny fraction of the size of a b-tree
+# and almost free to keep up to date
+#
+# `submission.date_visited` keeps its b-tree, the claim upsert in prebuilt_statements rewrites it every
+# time a submission is claimed again, and the new row versions go wherever there is free space
+DATE_INDEX_LIST = [
+    ('submission_webpage', 'IX-submission_webpage-date_visited', 'date_visited'),
+    ('user', 'IX-user-date_added', 'date_added'),
+]
+
+
+def swap_index(table_name:str, index_name:str, column_name:str, postgresql_using:str|None, temp_suffix:str):
+    '''
+    builds the new index under a temporary name next to the old one, then drops the old one and renames
+    the new one into its place, so queries by the date always have one of them to use
+
+    every step is safe to run again if the migration was interrupted
+    '''
+
+    temp_index_name = f"{index_name}-{temp_suffix}"
+
+    MigrationUtils.create_index_concurrently(temp_index_name, table_name, [column_name], postgresql_using=postgresql_using)
+    MigrationUtils.drop_index_concurrently(index_name, table_name)
+    MigrationUtils.run_with_lock_timeout(lambda: op.execute(
+        f"ALTER INDEX IF EXISTS {MigrationUtils.quote(temp_index_name)} RENAME TO {MigrationUtils.quote(index_name)}"))
+
+
+def upgrade() -> None:
+
+    for iter_table_name, iter_index_name, iter_column_name in DATE_INDEX_LIST:
+
+        swap_index(iter_table_name, iter_index_name, iter_column_name, postgresql_using='brin', temp_suffix='brin')
+
+
+def downgrade() -> None:
+
+    for iter_table_name, iter_index_name, iter_column_name in reversed(DATE_INDEX_LIST):
+
+        swap_index(iter_table_name, iter_index_name, iter_column_name, postgresql_using=None, temp_suffix='btree')
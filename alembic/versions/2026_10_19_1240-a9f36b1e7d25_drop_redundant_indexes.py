@@ -0,0 +1,105 @@
+"""drop the indexes that nothing queries by, or that a partial index now covers
+
+Revision ID: a9f36b1e7d25
+Revises: d07a5e3b9c41
+Create Date: 2026-10-19 12:40:37.861055
+
+"""
+import logging
+
+from alembic import op
+from alembic import context
+import sqlalchemy as sa
+
+from furaffinity_scrape.migration_utils import MigrationUtils
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9f36b1e7d25'
+down_revision = 'd07a5e3b9c41'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+ALLOW_DROP_USED_INDEXES_X_ARGUMENT_NAME = "allow_drop_used_indexes"
+
+# (table, index name, columns)
+#
+# `IX-submission-submission_status` and `IX-submission-claimed_by`: no query filters on these columns
+# `IX-submission-processed_status`: replaced by `IX-submission-furaffinity_submission_id-unfinished`
+# `IX-fa_scrape_attempt-furaffinity_submission_id-processed_status`: `IX-fa_scrape_attempt-furaffinity_submission_id`
+#   already covers lookups by submission id, and `IX-fa_scrape_attempt-furaffinity_submission_id-unfinished`
+#   the unfinished ones
+# `IX-fa_hole_status-run_id-processed_status`: replaced by `IX-fa_hole_status-item_id-run_id-claimable`
+REDUNDANT_INDEX_LIST = [
+    ('submission', 'IX-submission-submission_status', ['submission_status']),
+    ('submission', 'IX-submission-processed_status', ['processed_status']),
+    ('submission', 'IX-submission-claimed_by', ['claimed_by']),
+    ('fa_scrape_attempt', 'IX-fa_scrape_attempt-furaffinity_submission_id-processed_status', ['furaffinity_submission_id', 'processed_status']),
+    ('fa_hole_status', 'IX-fa_hole_status-run_id-processed_status', ['run_id', 'processed_status']),
+]
+
+
+def get_index_scan_count(index_name:str) -> int:
+    '''
+    how many scans postgres has recorded for the index since the statistics were last reset, summed
+    over the partitions for the partitioned tables
+    '''
+
+    return int(op.get_bind().execute(sa.text('''
+        SELECT COALESCE(SUM(stat.idx_scan), 0)
+        FROM pg_stat_user_indexes AS stat
+        WHERE stat.indexrelid = to_regclass(:index_name)
+            OR stat.indexrelid IN (
+                SELECT inh.inhrelid FROM pg_inherits AS inh WHERE inh.inhparent = to_regclass(:index_name))
+    '''), {"index_name": f'"{index_name}"'}).scalar_one())
+
+
+def check_indexes_are_unused():
+    '''
+    checks every index before anything is dropped, and stops the migration if any of them have been
+    scanned, since then something does query by it and dropping it would slow that down
+
+    pass `-x {ALLOW_DROP_USED_INDEXES_X_ARGUMENT_NAME}=true` to drop them anyway
+    '''
+
+    used_index_list = []
+
+    for iter_table_name, iter_index_name, iter_column_list in REDUNDANT_INDEX_LIST:
+
+        scan_count = get_index_scan_count(iter_index_name)
+
+        logger.info("`%s` has `%s` recorded scans since the statistics were last reset", iter_index_name, scan_count)
+
+        if scan_count > 0:
+            used_index_list.append((iter_index_name, scan_count))
+
+    if not used_index_list:
+        return
+
+    x_arguments = context.get_x_argument(as_dictionary=True)
+
+    if x_arguments.get(ALLOW_DROP_USED_INDEXES_X_ARGUMENT_NAME, "").lower() == "true":
+        logger.warning("dropping the indexes even though they have scans, because `-x %s=true` was passed: `%s`",
+            ALLOW_DROP_USED_INDEXES_X_ARGUMENT_NAME, used_index_list)
+        return
+
+    raise Exception(f"not dropping any indexes, these have recorded scans: `{used_index_list}`. find what queries " \
+        f"them, or pass `-x {ALLOW_DROP_USED_INDEXES_X_ARGUMENT_NAME}=true` to drop them anyway")
+
+
+def upgrade() -> None:
+
+    check_indexes_are_unused()
+
+    for iter_table_name, iter_index_name, iter_column_list in REDUNDANT_INDEX_LIST:
+
+        MigrationUtils.drop_index_concurrently(iter_index_name, iter_table_name)
+
+
+def downgrade() -> None:
+
+    for iter_table_name, iter_index_name, iter_column_list in reversed(REDUNDANT_INDEX_LIST):
+
+        MigrationUtils.create_index_concurrently(iter_index_name, iter_table_name, iter_column_list)
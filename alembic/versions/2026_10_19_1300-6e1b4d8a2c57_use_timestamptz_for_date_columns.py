@@ -0,0 +1,57 @@
+"""change the ArrowType date columns to native timestamptz
+
+Revision ID: 6e1b4d8a2c57
+Revises: a9f36b1e7d25
+Create Date: 2026-10-19 13:00:52.318804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1b4d8a2c57'
+down_revision = 'a9f36b1e7d25'
+branch_labels = None
+depends_on = None
+
+# (table, column, nullable)
+DATE_COLUMN_LIST = [
+    ('submission_webpage', 'date_visited', False),
+    ('submission_webpage_blob', 'date_added', False),
+    ('submission', 'date_visited', False),
+    ('user', 'date_added', False),
+    ('fa_scrape_attempt', 'date_visited', False),
+    ('fa_hole_status', 'lease_expires', True),
+    ('recompress_checkpoint', 'lease_expires', True),
+    ('recompress_checkpoint', 'date_updated', False),
+]
+
+
+def upgrade() -> None:
+
+    # ArrowType stored naive timestamps that are in UTC. with the session time zone set to UTC,
+    # postgres (12+) knows `timestamp` -> `timestamptz` doesn't change the stored values and skips
+    # rewriting the tables, so this is quick even on the big ones
+    op.execute("SET LOCAL TimeZone = 'UTC'")
+
+    for iter_table_name, iter_column_name, iter_nullable in DATE_COLUMN_LIST:
+
+        with op.batch_alter_table(iter_table_name, schema=None) as batch_op:
+            batch_op.alter_column(iter_column_name,
+                existing_type=sa.DateTime(),
+                type_=sa.DateTime(timezone=True),
+                existing_nullable=iter_nullable)
+
+
+def downgrade() -> None:
+
+    op.execute("SET LOCAL TimeZone = 'UTC'")
+
+    for iter_table_name, iter_column_name, iter_nullable in reversed(DATE_COLUMN_LIST):
+
+        with op.batch_alter_table(iter_table_name, schema=None) as batch_op:
+            batch_op.alter_column(iter_column_name,
+                existing_type=sa.DateTime(timezone=True),
+                type_=sa.DateTime(),
+                existing_nullable=iter_nullable)
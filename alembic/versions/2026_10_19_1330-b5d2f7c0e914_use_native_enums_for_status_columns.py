@@ -0,0 +1,102 @@
+"""store the status columns as native postgres enums instead of strings
+
+Revision ID: b5d2f7c0e914
+Revises: 6e1b4d8a2c57
+Create Date: 2026-10-19 13:30:05.772190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d2f7c0e914'
+down_revision = '6e1b4d8a2c57'
+branch_labels = None
+depends_on = None
+
+# the labels are the values of the enums in `model` as of this migration
+ENUM_TYPE_LIST = [
+    postgresql.ENUM('todo', 'in_progress', 'finished', 'error', name='processed_status_enum'),
+    postgresql.ENUM('unknown', 'exists', 'deleted', 'gdpr_deleted', name='submission_status_enum'),
+    postgresql.ENUM('decoded_ok', 'unicode_decode_error', name='encoding_status_enum'),
+    postgresql.ENUM('present', 'deleted', 'cloudflare', 'maintenance', 'unknown', name='furaffinity_submission_status_enum'),
+]
+
+# (table, column, enum type name)
+STATUS_COLUMN_LIST = [
+    ('submission', 'processed_status', 'processed_status_enum'),
+    ('submission', 'submission_status', 'submission_status_enum'),
+    ('fa_scrape_attempt', 'processed_status', 'processed_status_enum'),
+    ('fa_hole_status', 'processed_status', 'processed_status_enum'),
+    ('fa_hole_status', 'fa_submission_status', 'furaffinity_submission_status_enum'),
+    ('submission_webpage', 'encoding_status', 'encoding_status_enum'),
+]
+
+# (table, index name, columns, predicate), see the `add_partial_unfinished_indexes` migration. postgres
+# would rebuild these with the predicate still comparing text, so they are dropped and created again
+PARTIAL_INDEX_LIST = [
+    ('submission', 'IX-submission-furaffinity_submission_id-unfinished',
+        ['furaffinity_submission_id'], "processed_status IN ('todo', 'error')"),
+    ('fa_scrape_attempt', 'IX-fa_scrape_attempt-furaffinity_submission_id-unfinished',
+        ['furaffinity_submission_id'], "processed_status IN ('todo', 'error')"),
+    ('fa_hole_status', 'IX-fa_hole_status-item_id-run_id-claimable',
+        ['item_id', 'run_id'], "processed_status IN ('todo', 'in_progress', 'error')"),
+]
+
+
+def drop_partial_indexes():
+
+    for iter_table_name, iter_index_name, iter_column_list, iter_predicate in PARTIAL_INDEX_LIST:
+
+        with op.batch_alter_table(iter_table_name, schema=None) as batch_op:
+            batch_op.drop_index(iter_index_name)
+
+def create_partial_indexes():
+
+    for iter_table_name, iter_index_name, iter_column_list, iter_predicate in PARTIAL_INDEX_LIST:
+
+        with op.batch_alter_table(iter_table_name, schema=None) as batch_op:
+            batch_op.create_index(iter_index_name, iter_column_list, unique=False,
+                postgresql_where=sa.text(iter_predicate))
+
+
+def upgrade() -> None:
+
+    drop_partial_indexes()
+
+    for iter_enum_type in ENUM_TYPE_LIST:
+        iter_enum_type.create(op.get_bind())
+
+    enum_type_dict = {iter_enum_type.name: iter_enum_type for iter_enum_type in ENUM_TYPE_LIST}
+
+    for iter_table_name, iter_column_name, iter_type_name in STATUS_COLUMN_LIST:
+
+        with op.batch_alter_table(iter_table_name, schema=None) as batch_op:
+            batch_op.alter_column(iter_column_name,
+                existing_type=sa.Unicode(),
+                type_=enum_type_dict[iter_type_name],
+                existing_nullable=False,
+                postgresql_using=f'"{iter_column_name}"::{iter_type_name}')
+
+    create_partial_indexes()
+
+
+def downgrade() -> None:
+
+    drop_partial_indexes()
+
+    for iter_table_name, iter_column_name, iter_type_name in reversed(STATUS_COLUMN_LIST):
+
+        with op.batch_alter_table(iter_table_name, schema=None) as batch_op:
+            batch_op.alter_column(iter_column_name,
+                existing_type=sa.Enum(name=iter_type_name),
+                type_=sa.Unicode(),
+                existing_nullable=False,
+                postgresql_using=f'"{iter_column_name}"::text')
+
+    for iter_enum_type in reversed(ENUM_TYPE_LIST):
+        iter_enum_type.drop(op.get_bind())
+
+    create_partial_indexes()
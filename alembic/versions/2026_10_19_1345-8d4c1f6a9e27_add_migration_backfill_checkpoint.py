@@ -0,0 +1,32 @@
+"""add migration_backfill_checkpoint for MigrationUtils.batched_backfill
+
+Revision ID: 8d4c1f6a9e27
+Revises: b5d2f7c0e914
+Create Date: 2026-10-19 13:45:12.640381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4c1f6a9e27'
+down_revision = 'b5d2f7c0e914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    op.create_table('migration_backfill_checkpoint',
+        sa.Column('backfill_name', sa.Unicode(), nullable=False),
+        sa.Column('last_key', sa.BigInteger(), nullable=False),
+        sa.Column('rows_done', sa.BigInteger(), nullable=False),
+        sa.Column('date_updated', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('backfill_name', name='PK-migration_backfill_checkpoint-backfill_name')
+    )
+
+
+def downgrade() -> None:
+
+    op.drop_table('migration_backfill_checkpoint')
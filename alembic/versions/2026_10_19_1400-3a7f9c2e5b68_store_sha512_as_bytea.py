@@ -0,0 +1,195 @@
+"""store the sha512 columns as 64 raw bytes instead of the 128 character hex string
+
+Revision ID: 3a7f9c2e5b68
+Revises: 8d4c1f6a9e27
+Create Date: 2026-10-19 14:00:39.205117
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+from furaffinity_scrape.migration_utils import MigrationUtils
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7f9c2e5b68'
+down_revision = '8d4c1f6a9e27'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# (table, key column, [(column, nullable, [(index name, unique)])])
+#
+# the key column is what batched_backfill walks the table by
+SHA512_TABLE_LIST = [
+    ('submission_webpage', 'submission_webpage_id', [
+        ('original_data_sha512', False, [('IX-submission_webpage-original_data_sha512', False)]),
+        ('compressed_data_sha512', False, [('IX-submission_webpage-compressed_data_sha512', False)]),
+    ]),
+    ('submission_webpage_blob', 'blob_id', [
+        ('original_data_sha512', False, [('IXUQ-submission_webpage_blob-original_data_sha512', True)]),
+        ('compressed_data_sha512', False, [('IX-submission_webpage_blob-compressed_data_sha512', False)]),
+    ]),
+    ('fa_scrape_content', 'content_id', [
+        ('content_sha512', False, []),
+    ]),
+    ('fa_hole_status', 'item_id', [
+        ('warc_sha512', True, []),
+    ]),
+]
+
+
+def get_column_data_type(table_name:str, column_name:str) -> str|None:
+
+    return op.get_bind().execute(sa.text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :table_name AND column_name = :column_name"),
+        {"table_name": table_name, "column_name": column_name}).scalar_one_or_none()
+
+
+def convert_columns(
+    table_name:str,
+    key_column_name:str,
+    column_list:list,
+    new_type_sql:str,
+    new_data_type:str,
+    convert_sql:str,
+    suffix:str):
+    '''
+    changes the type of the columns without rewriting the table under an ACCESS EXCLUSIVE lock, so the
+    scrapers can keep running:
+
+    * adds a nullable `<column>_<suffix>` column for each one, and a trigger that fills it in from the old
+      column on every insert / update
+    * fills in the existing rows with MigrationUtils.batched_backfill
+    * builds the indexes on the new columns concurrently, under `<index name>-<suffix>`
+    * for the NOT NULL columns, adds a `CHECK (... IS NOT NULL) NOT VALID` and validates it, which scans
+      the table without blocking writes, so the SET NOT NULL at the end doesn't have to
+    * then in one short statement with the lock timeout retries: drops the trigger and the old columns
+      and renames the new columns and indexes into their place
+
+    every step can be run again if the migration was interrupted
+
+    @param new_data_type - the `information_schema.columns.data_type` of new_type_sql, to tell if the
+    table was already converted
+    @param convert_sql - the SQL that converts the old value, with `{column}` where the column goes
+    '''
+
+    quote = MigrationUtils.quote
+    quoted_table_name = quote(table_name)
+    sync_name = f"{table_name}-sha512_{suffix}-sync"
+
+    def _new_column_name(column_name:str) -> str:
+        return f"{column_name}_{suffix}"
+
+    def _check_name(column_name:str) -> str:
+        return f"CK-{table_name}-{column_name}-{suffix}"
+
+    # the swap at the end already ran, but alembic didn't get to record it
+    first_column_name = column_list[0][0]
+    if get_column_data_type(table_name, first_column_name) == new_data_type \
+            and get_column_data_type(table_name, _new_column_name(first_column_name)) is None:
+        logger.info("`%s` is already converted, skipping it", table_name)
+        return
+
+    logger.info("converting the sha512 columns of `%s` to `%s`", table_name, new_type_sql)
+
+    add_column_sql = "; ".join(
+        f"ALTER TABLE {quoted_table_name} ADD COLUMN IF NOT EXISTS {quote(_new_column_name(iter_column_name))} {new_type_sql}"
+        for iter_column_name, iter_nullable, iter_index_list in column_list)
+
+    sync_sql = " ".join(
+        f"NEW.{quote(_new_column_name(iter_column_name))} := {convert_sql.format(column=f'NEW.{quote(iter_column_name)}')};"
+        for iter_column_name, iter_nullable, iter_index_list in column_list)
+
+    MigrationUtils.run_with_lock_timeout(lambda: op.execute(f'''
+        DO $do$ BEGIN
+            {add_column_sql};
+            CREATE OR REPLACE FUNCTION {quote(sync_name)}() RETURNS trigger LANGUAGE plpgsql AS $sync$
+                BEGIN {sync_sql} RETURN NEW; END
+            $sync$;
+            DROP TRIGGER IF EXISTS {quote(sync_name)} ON {quoted_table_name};
+            CREATE TRIGGER {quote(sync_name)} BEFORE INSERT OR UPDATE ON {quoted_table_name}
+                FOR EACH ROW EXECUTE FUNCTION {quote(sync_name)}();
+        END $do$
+    '''))
+
+    # the rows written from here on are kept in sync by the trigger, this does the ones from before it
+    MigrationUtils.batched_backfill(
+        backfill_name=f"{table_name}-sha512_{suffix}",
+        table_name=table_name,
+        key_column_name=key_column_name,
+        set_sql=", ".join(
+            f"{quote(_new_column_name(iter_column_name))} = {convert_sql.format(column=quote(iter_column_name))}"
+            for iter_column_name, iter_nullable, iter_index_list in column_list),
+        where_sql=" OR ".join(
+            f"({quote(_new_column_name(iter_column_name))} IS NULL AND {quote(iter_column_name)} IS NOT NULL)"
+            for iter_column_name, iter_nullable, iter_index_list in column_list))
+
+    for iter_column_name, iter_nullable, iter_index_list in column_list:
+
+        for iter_index_name, iter_unique in iter_index_list:
+            MigrationUtils.create_index_concurrently(
+                f"{iter_index_name}-{suffix}", table_name, [_new_column_name(iter_column_name)], unique=iter_unique)
+
+        if not iter_nullable:
+
+            check_name = _check_name(iter_column_name)
+
+            # postgres has no ADD CONSTRAINT IF NOT EXISTS
+            MigrationUtils.run_with_lock_timeout(lambda: op.execute(f'''
+                DO $do$ BEGIN
+                    ALTER TABLE {quoted_table_name} ADD CONSTRAINT {quote(check_name)}
+                        CHECK ({quote(_new_column_name(iter_column_name))} IS NOT NULL) NOT VALID;
+                EXCEPTION WHEN duplicate_object THEN NULL;
+                END $do$
+            '''))
+
+            MigrationUtils.run_with_lock_timeout(lambda: op.execute(
+                f"ALTER TABLE {quoted_table_name} VALIDATE CONSTRAINT {quote(check_name)}"))
+
+    swap_sql_list = [
+        f"DROP TRIGGER {quote(sync_name)} ON {quoted_table_name}",
+        f"DROP FUNCTION {quote(sync_name)}()",
+    ]
+
+    for iter_column_name, iter_nullable, iter_index_list in column_list:
+
+        # dropping the old column drops its indexes too
+        swap_sql_list.append(f"ALTER TABLE {quoted_table_name} DROP COLUMN {quote(iter_column_name)}")
+        swap_sql_list.append(f"ALTER TABLE {quoted_table_name} RENAME COLUMN {quote(_new_column_name(iter_column_name))} TO {quote(iter_column_name)}")
+
+        if not iter_nullable:
+            # uses the validated check constraint instead of scanning the table
+            swap_sql_list.append(f"ALTER TABLE {quoted_table_name} ALTER COLUMN {quote(iter_column_name)} SET NOT NULL")
+            swap_sql_list.append(f"ALTER TABLE {quoted_table_name} DROP CONSTRAINT {quote(_check_name(iter_column_name))}")
+
+        for iter_index_name, iter_unique in iter_index_list:
+            swap_sql_list.append(f"ALTER INDEX {quote(f'{iter_index_name}-{suffix}')} RENAME TO {quote(iter_index_name)}")
+
+    # one statement, so it is all or nothing
+    MigrationUtils.run_with_lock_timeout(lambda: op.execute(
+        f"DO $do$ BEGIN {'; '.join(swap_sql_list)}; END $do$"))
+
+
+def upgrade() -> None:
+
+    # the scrapers can keep running through this, but once a table is swapped, the ones still on the old
+    # code fail to write hex strings into it (and requeue their work), so move them onto the new code as
+    # soon as it finishes
+
+    for iter_table_name, iter_key_column_name, iter_column_list in SHA512_TABLE_LIST:
+
+        convert_columns(iter_table_name, iter_key_column_name, iter_column_list,
+            new_type_sql="bytea", new_data_type="bytea", convert_sql="decode({column}, 'hex')", suffix="bin")
+
+
+def downgrade() -> None:
+
+    for iter_table_name, iter_key_column_name, iter_column_list in reversed(SHA512_TABLE_LIST):
+
+        convert_columns(iter_table_name, iter_key_column_name, iter_column_list,
+            new_type_sql="varchar", new_data_type="character varying", convert_sql="encode({column}, 'hex')", suffix="hex")
@@ -0,0 +1,33 @@
+"""add fa_scrape_attempt_error_history for compact_attempts
+
+Revision ID: c2e8a5d7f310
+Revises: 3a7f9c2e5b68
+Create Date: 2026-10-19 15:00:27.913566
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e8a5d7f310'
+down_revision = '3a7f9c2e5b68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+
+    op.create_table('fa_scrape_attempt_error_history',
+        sa.Column('furaffinity_submission_id', sa.Integer(), nullable=False),
+        sa.Column('error_count', sa.Integer(), nullable=False),
+        sa.Column('first_error_date', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_error_date', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_error_string', sa.Unicode(), nullable=True),
+        sa.PrimaryKeyConstraint('furaffinity_submission_id', name='PK-fa_scrape_attempt_error_history-fa_submission_id')
+    )
+
+
+def downgrade() -> None:
+
+    op.drop_table('fa_scrape_attempt_error_history')
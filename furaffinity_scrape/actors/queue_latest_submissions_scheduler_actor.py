@@ -23,7 +23,7 @@ from furaffinity_scrape import utils
 from furaffinity_scrape import db_model
 from furaffinity_scrape import model
 from furaffinity_scrape import constants
-from furaffinity_scrape.actors.sqlalchemy_actor import GetLatestFuraffinitySubmissionInDatabase
+from furaffinity_scrape.actors.sqlalchemy_actor import GetLatestFuraffinitySubmissionInDatabase, EnsureSubmissionPartitions
 from furaffinity_scrape.actors.common_actor_messages import PleaseStop
 from furaffinity_scrape.actors.http_actor import DownloadUrlResult, DownloadUrlRequest
 from furaffinity_scrape.actors.rabbitmq_publish_actor import PublishRangeOfMessages
@@ -176,6 +176,16 @@ class QueueLatestSubmissionsSchedulerActor(Actor):
 
         latest_id:int = self.get_latest_submission_id_from_soup(soup)
 
+        # the workers can't insert rows for these submissions unless their partitions exist
+        partitions_result:DataMessage = await self.sqla_actor.ask(
+            DataMessage(
+                data=EnsureSubmissionPartitions(
+                    lowest_submission_id=latest_result_in_db.latest_submission+1,
+                    highest_submission_id=latest_id),
+                sender=self))
+
+        logger.info("partitions created for the submissions we are about to queue: `%s`", partitions_result.data)
+
         # send the rabbitmq publish actor to publish the range of messages
         publish_obj = PublishRangeOfMessages(
             start_submission_number=latest_result_in_db.latest_submission+1,
@@ -14,6 +14,8 @@ from actorio_ng import Actor, Message, DataMessage, ask, EndMainLoop
 from furaffinity_scrape import utils
 from furaffinity_scrape import db_model
 from furaffinity_scrape import model
+from furaffinity_scrape import partition_utils
+from furaffinity_scrape import prebuilt_statements
 from furaffinity_scrape.actors.common_actor_messages import PleaseStop
 
 logger = logging.getLogger(__name__)
@@ -32,6 +34,17 @@ class GetLatestFuraffinitySubmissionInDatabaseResult:
 
     latest_submission:int
 
+@attr.define(frozen=True)
+class EnsureSubmissionPartitions:
+
+    lowest_submission_id:int
+    highest_submission_id:int
+
+@attr.define(frozen=True)
+class EnsureSubmissionPartitionsResult:
+
+    created_partition_list:list[str]
+
 class SqlalchemyActor(Actor):
 
     def __init__(self, config:model.Settings):
@@ -46,7 +59,7 @@ class SqlalchemyActor(Actor):
 
         logger.debug("setting up sqlalchemy actor")
 
-        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url)
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
 
         # expire_on_commit=False will prevent attributes from being expired
         # after commit.
@@ -59,8 +72,7 @@ class SqlalchemyActor(Actor):
         logger.debug("fetching latest FA submission")
         async with self.async_sessionmaker() as sqla_session:
 
-            statement = select(db_model.FAScrapeAttempt.furaffinity_submission_id).\
-                order_by(desc(db_model.FAScrapeAttempt.furaffinity_submission_id)).limit(1)
+            statement = prebuilt_statements.LATEST_ATTEMPT_FURAFFINITY_SUBMISSION_ID
 
             logger.debug("executing sql statement: `%s`", statement)
 
@@ -73,6 +85,17 @@ class SqlalchemyActor(Actor):
 
 
 
+    async def ensure_submission_partitions(self, lowest_submission_id:int, highest_submission_id:int) -> list[str]:
+
+        logger.debug("making sure there are partitions for submissions `%s` to `%s`", lowest_submission_id, highest_submission_id)
+
+        async with self.async_sessionmaker() as sqla_session:
+
+            async with sqla_session.begin():
+
+                return await partition_utils.PartitionUtils.ensure_submission_partitions(
+                    sqla_session, lowest_submission_id, highest_submission_id)
+
     async def shutdown(self):
 
         logger.info("Closing Sqlachemy Engine: `%s`", self.sqla_engine)
@@ -91,6 +114,12 @@ class SqlalchemyActor(Actor):
             result_msg = GetLatestFuraffinitySubmissionInDatabaseResult(latest_submission=top_id)
             await message.sender.tell(DataMessage(data=result_msg, sender=self))
 
+        elif d.__class__ == EnsureSubmissionPartitions:
+
+            created_partition_list = await self.ensure_submission_partitions(d.lowest_submission_id, d.highest_submission_id)
+            result_msg = EnsureSubmissionPartitionsResult(created_partition_list=created_partition_list)
+            await message.sender.tell(DataMessage(data=result_msg, sender=self))
+
         elif  d.__class__ == PleaseStop:
 
             logger.info("being asked to stop")
@@ -0,0 +1,123 @@
+import logging
+import abc
+import asyncio
+import os
+import pathlib
+import tempfile
+
+from furaffinity_scrape import model
+from furaffinity_scrape import utils
+
+logger = logging.getLogger(__name__)
+
+class BlobStore(abc.ABC):
+    '''
+    somewhere to keep the compressed webpages outside of the database, keyed by the sha512 of the
+    compressed data
+
+    since the key is the hash of the data, putting the same key twice is harmless and a blob never
+    changes once it is written
+    '''
+
+    @abc.abstractmethod
+    async def put(self, key:str, data:bytes):
+        pass
+
+    @abc.abstractmethod
+    async def get(self, key:str) -> bytes:
+        '''
+        @return the data for the key, raises FileNotFoundError if it isn't in the store
+        '''
+        pass
+
+    @abc.abstractmethod
+    def describe(self) -> str:
+        pass
+
+
+class LocalFilesystemBlobStore(BlobStore):
+    '''
+    stores every blob as its own file, `<folder>/<first two characters>/<next two characters>/<key>`,
+    so no single folder ends up with millions of files
+
+    this is also what a S3 compatible bucket mounted with something like s3fs or rclone looks like
+
+    files are written to a temp file in the same folder, fsynced and then renamed into place, so a
+    reader never sees half of a blob
+    '''
+
+    def __init__(self, folder:pathlib.Path):
+
+        self.folder = folder
+
+    def get_path(self, key:str) -> pathlib.Path:
+
+        return self.folder / key[0:2] / key[2:4] / key
+
+    def _put_sync(self, key:str, data:bytes):
+
+        final_path = self.get_path(key)
+
+        if final_path.exists():
+            return
+
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+
+        temp_fd, temp_path_str = tempfile.mkstemp(dir=final_path.parent, prefix=f".{key}.", suffix=".tmp")
+
+        try:
+
+            with os.fdopen(temp_fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temp_path_str, final_path)
+
+        except Exception as e:
+            pathlib.Path(temp_path_str).unlink(missing_ok=True)
+            raise e
+
+        # fsync the folder so the rename itself survives a crash
+        folder_fd = os.open(final_path.parent, os.O_RDONLY)
+
+        try:
+            os.fsync(folder_fd)
+        finally:
+            os.close(folder_fd)
+
+    def _get_sync(self, key:str) -> bytes:
+
+        data = self.get_path(key).read_bytes()
+
+        if utils.sha512_hexdigest(data) != key:
+            raise Exception(f"blob `{key}` in `{self.folder}` doesn't match its sha512, the file is corrupt")
+
+        return data
+
+    async def put(self, key:str, data:bytes):
+
+        await asyncio.get_running_loop().run_in_executor(None, self._put_sync, key, data)
+
+    async def get(self, key:str) -> bytes:
+
+        return await asyncio.get_running_loop().run_in_executor(None, self._get_sync, key)
+
+    def describe(self) -> str:
+
+        return f"local filesystem blob store at `{self.folder}`"
+
+
+def create_blob_store(blob_store_settings:model.BlobStoreSettings) -> BlobStore|None:
+    '''
+    @return the BlobStore for the settings, or None if the webpages are stored in the database
+    '''
+
+    if blob_store_settings.store_type == model.BlobStoreType.DATABASE:
+        return None
+
+    elif blob_store_settings.store_type == model.BlobStoreType.LOCAL_FILESYSTEM:
+        return LocalFilesystemBlobStore(blob_store_settings.local_folder)
+
+    else:
+        raise Exception(f"unknown blob store type `{blob_store_settings.store_type}`")
@@ -0,0 +1,269 @@
+import logging
+import pathlib
+import subprocess
+import tempfile
+import tarfile
+import lzma
+import gzip
+import io
+import hashlib
+
+import zstandard
+
+from furaffinity_scrape import model
+from furaffinity_scrape import constants
+
+logger = logging.getLogger(__name__)
+
+class CompressionUtils:
+    '''
+    blocking compress / decompress functions for the compression schemes we store data in,
+    used by the benchmark and migration subcommands, run these in a thread or process
+    '''
+
+    @staticmethod
+    def compress(
+        scheme:model.CompressionScheme,
+        level:int,
+        data:bytes,
+        sevenzip_path:pathlib.Path|None=None,
+        zstd_dict:zstandard.ZstdCompressionDict|None=None) -> bytes:
+        '''
+        compresses the data with the given scheme and level
+
+        @param scheme - the CompressionScheme to use
+        @param level - the level / preset, the meaning depends on the scheme
+        @param data - the data to compress
+        @param sevenzip_path - path to 7z, only needed for SEVENZIP
+        @param zstd_dict - the zstd dictionary, only needed for ZSTD_WITH_DICTIONARY
+        @return the compressed bytes
+        '''
+
+        if scheme == model.CompressionScheme.GZIP:
+            return gzip.compress(data, compresslevel=level, mtime=0)
+
+        elif scheme == model.CompressionScheme.XZ:
+            return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+
+        elif scheme == model.CompressionScheme.ZSTD:
+            return zstandard.ZstdCompressor(level=level).compress(data)
+
+        elif scheme == model.CompressionScheme.ZSTD_WITH_DICTIONARY:
+            if zstd_dict is None:
+                raise Exception("the ZSTD_WITH_DICTIONARY scheme needs a zstd dictionary")
+            return zstandard.ZstdCompressor(level=level, dict_data=zstd_dict).compress(data)
+
+        elif scheme == model.CompressionScheme.TAR_XZ:
+            return CompressionUtils._compress_tar_xz(data, level)
+
+        elif scheme == model.CompressionScheme.SEVENZIP:
+            if sevenzip_path is None:
+                raise Exception("the SEVENZIP scheme needs the path to 7z")
+            return CompressionUtils._compress_sevenzip(sevenzip_path, level, data)
+
+        else:
+            raise Exception(f"unknown compression scheme `{scheme}`")
+
+    @staticmethod
+    def decompress(
+        scheme:model.CompressionScheme,
+        data:bytes,
+        sevenzip_path:pathlib.Path|None=None,
+        zstd_dict:zstandard.ZstdCompressionDict|None=None) -> bytes:
+        '''
+        decompresses data that was compressed with the given scheme
+
+        @param scheme - the CompressionScheme the data was compressed with
+        @param data - the compressed data
+        @param sevenzip_path - path to 7z, only needed for SEVENZIP
+        @param zstd_dict - the zstd dictionary, only needed for ZSTD_WITH_DICTIONARY
+        @return the decompressed bytes
+        '''
+
+        if scheme == model.CompressionScheme.GZIP:
+            # gzip.decompress handles files with multiple members, like a `.warc.gz`
+            return gzip.decompress(data)
+
+        elif scheme == model.CompressionScheme.XZ:
+            return lzma.decompress(data, format=lzma.FORMAT_XZ)
+
+        elif scheme in (model.CompressionScheme.ZSTD, model.CompressionScheme.ZSTD_WITH_DICTIONARY):
+            if scheme == model.CompressionScheme.ZSTD_WITH_DICTIONARY and zstd_dict is None:
+                raise Exception("the ZSTD_WITH_DICTIONARY scheme needs a zstd dictionary")
+
+            decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dict) if zstd_dict else zstandard.ZstdDecompressor()
+
+            # read_across_frames so this also works for a `.warc.zst` that has one frame per record
+            with decompressor.stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+                return reader.read()
+
+        elif scheme == model.CompressionScheme.TAR_XZ:
+            return CompressionUtils._decompress_tar_xz(data)
+
+        elif scheme == model.CompressionScheme.SEVENZIP:
+            if sevenzip_path is None:
+                raise Exception("the SEVENZIP scheme needs the path to 7z")
+            return CompressionUtils._decompress_sevenzip(sevenzip_path, data)
+
+        else:
+            raise Exception(f"unknown compression scheme `{scheme}`")
+
+    @staticmethod
+    def get_scheme_for_path(path:pathlib.Path) -> model.CompressionScheme|None:
+        '''
+        returns the compression scheme of a file based on its name, or None if it isn't compressed
+        '''
+
+        name = path.name
+
+        if name.endswith(constants.TAR_XZ_SUFFIX):
+            return model.CompressionScheme.TAR_XZ
+        elif name.endswith(constants.SEVENZIP_SUFFIX):
+            return model.CompressionScheme.SEVENZIP
+        elif name.endswith(constants.WARC_FILE_SUFFIX + constants.WARC_GZ_SUFFIX):
+            return model.CompressionScheme.GZIP
+        elif name.endswith(constants.WARC_FILE_SUFFIX + constants.WARC_ZST_SUFFIX):
+            return model.CompressionScheme.ZSTD
+        elif name.endswith(constants.XZ_SUFFIX):
+            return model.CompressionScheme.XZ
+
+        return None
+
+    @staticmethod
+    def _compress_tar_xz(data:bytes, level:int) -> bytes:
+        '''
+        the same single member tar.xz that utils.compress_and_hash_text_data creates
+        '''
+
+        tar_fileobj = io.BytesIO()
+
+        with tarfile.open(mode="w:xz", fileobj=tar_fileobj, preset=level) as tf:
+
+            tarinfo = tarfile.TarInfo(name="webpage_data.txt")
+            tarinfo.size = len(data)
+            tf.addfile(tarinfo, io.BytesIO(data))
+
+        return tar_fileobj.getvalue()
+
+    @staticmethod
+    def _decompress_tar_xz(data:bytes) -> bytes:
+
+        with tarfile.open(mode="r:xz", fileobj=io.BytesIO(data)) as tf:
+
+            # we only ever store one file per tar
+            member = next(iter_member for iter_member in tf.getmembers() if iter_member.isfile())
+            return tf.extractfile(member).read()
+
+    @staticmethod
+    def _compress_sevenzip(sevenzip_path:pathlib.Path, level:int, data:bytes) -> bytes:
+
+        with tempfile.TemporaryDirectory(prefix="fascrape_7z_") as d:
+
+            temp_folder = pathlib.Path(d)
+            input_path = temp_folder / "data"
+            archive_path = temp_folder / "data.7z"
+            input_path.write_bytes(data)
+
+            CompressionUtils.run_sevenzip_and_wait(sevenzip_path, [
+                "a",                                    # add to archive
+                "-t7z",                                 # 7z file type
+                "-bd",                                  # disable progress indicator
+                "-bso0",                                # disable output
+                "-bsp0",                                # disable progress output
+                f"-mx={level}",                         # compression level
+                archive_path,
+                input_path])
+
+            return archive_path.read_bytes()
+
+    @staticmethod
+    def _decompress_sevenzip(sevenzip_path:pathlib.Path, data:bytes) -> bytes:
+
+        with tempfile.TemporaryDirectory(prefix="fascrape_7z_") as d:
+
+            archive_path = pathlib.Path(d) / "data.7z"
+            archive_path.write_bytes(data)
+
+            return CompressionUtils.run_sevenzip_and_wait(sevenzip_path, ["x", "-so", archive_path])
+
+    @staticmethod
+    def run_sevenzip_and_wait(sevenzip_path:pathlib.Path, argument_list:list) -> bytes:
+        '''
+        runs 7z, blocking until it exits
+
+        @return the stdout of the 7z process
+        '''
+
+        completed_process = subprocess.run(
+            [sevenzip_path, *argument_list],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+
+        if completed_process.returncode not in constants.SEVENZIP_EXPECTED_RETURN_CODES:
+            raise Exception(f"7z with arguments `{argument_list}` returned `{completed_process.returncode}`")
+
+        return completed_process.stdout
+
+    @staticmethod
+    def extract_sevenzip_to_file(sevenzip_path:pathlib.Path, archive_path:pathlib.Path, output_path:pathlib.Path):
+        '''
+        extracts the single file in a 7z archive to output_path, streaming it to disk
+        instead of holding it in memory
+        '''
+
+        with open(output_path, "wb") as f:
+
+            completed_process = subprocess.run(
+                [sevenzip_path, "x", "-so", archive_path],
+                stdout=f,
+                stderr=subprocess.DEVNULL)
+
+        if completed_process.returncode not in constants.SEVENZIP_EXPECTED_RETURN_CODES:
+            raise Exception(f"7z failed to extract `{archive_path}`, returned `{completed_process.returncode}`")
+
+    @staticmethod
+    def sha512_of_decompressed_file(scheme:model.CompressionScheme, path:pathlib.Path) -> str:
+        '''
+        decompresses a `.gz` or `.zst` file in chunks and returns the sha512 of the decompressed data,
+        this handles files with more than one gzip member / zstd frame like a per record compressed warc
+        '''
+
+        hasher = hashlib.sha512()
+
+        with open(path, "rb") as f:
+
+            if scheme == model.CompressionScheme.GZIP:
+                reader = gzip.GzipFile(fileobj=f, mode="rb")
+            elif scheme == model.CompressionScheme.ZSTD:
+                reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            else:
+                raise Exception(f"streaming decompression isn't supported for `{scheme}`")
+
+            with reader:
+                while True:
+                    iter_data = reader.read(constants.WARC_RECORD_READ_CHUNK_SIZE)
+
+                    if not iter_data:
+                        break
+
+                    hasher.update(iter_data)
+
+        return hasher.hexdigest()
+
+    @staticmethod
+    def load_uncompressed_data(path:pathlib.Path, sevenzip_path:pathlib.Path|None=None) -> bytes:
+        '''
+        reads a file from disk, decompressing it if it is one of the formats we store data in
+
+        @param path - a `.warc`, `.warc.gz`, `.warc.zst`, `.warc.7z`, `.tar.xz` or uncompressed file
+        @param sevenzip_path - path to 7z, only needed for `.7z` files
+        @return the uncompressed bytes
+        '''
+
+        scheme = CompressionUtils.get_scheme_for_path(path)
+        data = path.read_bytes()
+
+        if scheme is None:
+            return data
+
+        return CompressionUtils.decompress(scheme, data, sevenzip_path=sevenzip_path)
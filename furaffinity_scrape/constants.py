@@ -44,6 +44,7 @@ HOCON_CONFIG_WGET_PATH = "wget_path"
 HOCON_CONFIG_SEVENZIP_PATH = "7zip_path"
 HOCON_CONFIG_OPERATOR_NAME = "operator_name"
 HOCON_CONFIG_USER_AGENT = "user_agent"
+HOCON_CONFIG_WARC_COMPRESSION_FORMAT = "warc_compression_format"
 
 
 HOCON_CONFIG_DATABASE_GROUP = "database"
@@ -55,6 +56,32 @@ HOCON_CONFIG_KEY_DATABASE_PORT = "port"
 HOCON_CONFIG_KEY_DATABASE_DATABASE = "database"
 HOCON_CONFIG_KEY_DATABASE_QUERY = "query"
 
+# optional, inside the database group
+HOCON_CONFIG_KEY_DATABASE_POOL_GROUP = "pool"
+HOCON_CONFIG_KEY_DATABASE_POOL_SIZE = "pool_size"
+HOCON_CONFIG_KEY_DATABASE_POOL_MAX_OVERFLOW = "max_overflow"
+HOCON_CONFIG_KEY_DATABASE_POOL_TIMEOUT_SECONDS = "pool_timeout_seconds"
+HOCON_CONFIG_KEY_DATABASE_POOL_PRE_PING = "pool_pre_ping"
+HOCON_CONFIG_KEY_DATABASE_POOL_RECYCLE_SECONDS = "pool_recycle_seconds"
+HOCON_CONFIG_KEY_DATABASE_POOL_PREPARED_STATEMENT_CACHE_SIZE = "prepared_statement_cache_size"
+HOCON_CONFIG_KEY_DATABASE_POOL_STATEMENT_CACHE_SIZE = "statement_cache_size"
+HOCON_CONFIG_KEY_DATABASE_POOL_METRICS_LOG_INTERVAL_SECONDS = "metrics_log_interval_seconds"
+
+# the same as the sqlalchemy / asyncpg defaults
+DATABASE_POOL_DEFAULT_SIZE = 5
+DATABASE_POOL_DEFAULT_MAX_OVERFLOW = 10
+DATABASE_POOL_DEFAULT_TIMEOUT_SECONDS = 30.0
+DATABASE_POOL_DEFAULT_PRE_PING = False
+DATABASE_POOL_DEFAULT_RECYCLE_SECONDS = -1
+DATABASE_POOL_DEFAULT_PREPARED_STATEMENT_CACHE_SIZE = 100
+DATABASE_POOL_DEFAULT_STATEMENT_CACHE_SIZE = 100
+DATABASE_POOL_DEFAULT_METRICS_LOG_INTERVAL_SECONDS = 300.0
+
+# optional, where the compressed webpages are stored, defaults to inline in the database
+HOCON_CONFIG_KEY_BLOB_STORE_GROUP = "blob_store"
+HOCON_CONFIG_KEY_BLOB_STORE_TYPE = "type"
+HOCON_CONFIG_KEY_BLOB_STORE_LOCAL_FOLDER = "local_folder"
+
 HOCON_CONFIG_KEY_RABBITMQ_GROUP = "rabbitmq"
 HOCON_CONFIG_KEY_RABBITMQ_SCHEME = "scheme"
 HOCON_CONFIG_KEY_RABBITMQ_USERNAME = "username"
@@ -106,6 +133,83 @@ SUBMISSION_DOESNT_EXIST_TEXT = "The submission you are trying to find is not in
 
 WARCINFO_RECORD_FURAFFINITY_VIEW_URL_REGEX = re.compile(r"^https://www.furaffinity.net/view/[0-9]+/")
 
+WARC_FILE_SUFFIX = ".warc"
+WARC_GZ_SUFFIX = ".gz"
+WARC_ZST_SUFFIX = ".zst"
+# sidecar file next to a per record compressed warc that has the offset of every record
+WARC_RECORD_INDEX_SUFFIX = ".idx.jsonl"
+WARC_GZIP_COMPRESSION_LEVEL = 9
+WARC_ZSTD_COMPRESSION_LEVEL = 19
+WARC_RECORD_READ_CHUNK_SIZE = 1024 * 1024
+WARC_RECORD_TRAILER = b"\r\n\r\n"
+
+TAR_XZ_SUFFIX = ".tar.xz"
+XZ_SUFFIX = ".xz"
+SEVENZIP_SUFFIX = ".7z"
+
+# the same size that misc/train_dict_test.py used
+ZSTD_DICTIONARY_SIZE = 1024 * 1024
+
+BENCHMARK_COMPRESSION_DEFAULT_SEVENZIP_LEVELS = [1, 5, 9]
+BENCHMARK_COMPRESSION_DEFAULT_XZ_PRESETS = [0, 6, 9]
+BENCHMARK_COMPRESSION_DEFAULT_ZSTD_LEVELS = [3, 9, 19]
+BENCHMARK_COMPRESSION_DEFAULT_GZIP_LEVELS = [6, 9]
+
+# compression levels recompress_archive uses if --level isn't given, keyed by CompressionScheme value
+RECOMPRESS_ARCHIVE_DEFAULT_LEVELS = {
+    "gzip": 9,
+    "xz": 9,
+    "tar_xz": 6,
+    "zstd": 19,
+}
+RECOMPRESS_ARCHIVE_DEFAULT_BATCH_SIZE = 100
+# how long a machine owns a recompress job without checkpointing before another machine can take it over
+RECOMPRESS_ARCHIVE_LEASE_SECONDS = 15 * 60
+RECOMPRESS_ARCHIVE_PARTIAL_SUFFIX = ".partial"
+
+# matches the file names that FileUtils.download_submission_using_wget creates (`sid`), and the
+# older ones that ExtractFilesFromDb wrote out of the database (`cid`)
+CONTENT_FILE_NAME_ATTEMPT_ID_KEY = "attempt_id"
+CONTENT_FILE_NAME_RE = re.compile(f"^fascrape_content_(?:sid|cid)-[0-9]+_aid-(?P<{CONTENT_FILE_NAME_ATTEMPT_ID_KEY}>[0-9]+)\\.")
+
+SCRAPE_USERS_DEFAULT_USER_FLUSH_SIZE = 25
+SCRAPE_USERS_DEFAULT_USER_FLUSH_INTERVAL_SECONDS = 60
+# postgres has a limit of 32767 bind parameters per statement, and every user is 2
+USER_UPSERT_CHUNK_SIZE = 5000
+
+KNOWN_USER_CACHE_DEFAULT_LRU_SIZE = 100000
+KNOWN_USER_CACHE_FALSE_POSITIVE_RATE = 0.01
+# size the bloom filter for this many times the users in the table at startup
+KNOWN_USER_CACHE_GROWTH_FACTOR = 1.5
+KNOWN_USER_CACHE_MINIMUM_CAPACITY = 100000
+
+VERIFY_ARCHIVE_DEFAULT_THREADS_PER_DISK = 2
+VERIFY_ARCHIVE_DEFAULT_BATCH_SIZE = 500
+
+FIND_FA_HOLES_PRESCAN_DEFAULT_BATCH_SIZE = 50000
+
+# `submission` and `fa_scrape_attempt` are range partitioned by furaffinity_submission_id, this many ids per partition
+SUBMISSION_PARTITION_SIZE = 1000000
+# how many empty partitions to keep ahead of the highest submission id we have queued
+SUBMISSION_PARTITIONS_AHEAD = 2
+SUBMISSION_PARTITIONED_TABLE_NAMES = ["submission", "fa_scrape_attempt"]
+
+EXTRACT_FILES_FROM_DB_DEFAULT_BATCH_SIZE = 200
+EXTRACT_FILES_FROM_DB_DEFAULT_WORKERS = 4
+# the extracted files go into a folder named after this many characters of the sha512
+EXTRACT_FILES_FROM_DB_SHA_PREFIX_LENGTH = 3
+
+FIND_FA_HOLES_DEFAULT_BATCH_SIZE = 20
+FIND_FA_HOLES_DEFAULT_WORKERS = 4
+FIND_FA_HOLES_DEFAULT_LEASE_SECONDS = 30 * 60
+
+# WARC header names, lowercased since header names are case insensitive
+WARC_HEADER_CONTENT_LENGTH = "content-length"
+WARC_HEADER_RECORD_ID = "warc-record-id"
+WARC_HEADER_TYPE = "warc-type"
+WARC_HEADER_CONTENT_TYPE = "content-type"
+WARC_HEADER_TARGET_URI = "warc-target-uri"
+
 class HoconTypesEnum(enum.Enum):
     STRING = "string"
     INT = "int"
@@ -114,3 +218,24 @@ class HoconTypesEnum(enum.Enum):
     BOOLEAN = "boolean"
     CONFIG = "config"
     ANY = "any"
+
+SHOW_FINISHED_RANGES_DEFAULT_MAX_GAPS = 50
+
+MOVE_BLOBS_TO_STORE_DEFAULT_BATCH_SIZE = 200
+MOVE_BLOBS_TO_STORE_DEFAULT_CONCURRENCY = 8
+
+SCRAPE_SUBMISSIONS_DEFAULT_FLUSH_SIZE = 10
+SCRAPE_SUBMISSIONS_DEFAULT_FLUSH_INTERVAL_SECONDS = 30
+
+# submission ids per batch
+COMPACT_ATTEMPTS_DEFAULT_BATCH_SIZE = 10000
+COMPACT_ATTEMPTS_DEFAULT_SLEEP_SECONDS = 0.5
+# TODO attempts younger than this might still be in progress, so they are left alone
+COMPACT_ATTEMPTS_DEFAULT_MIN_AGE_HOURS = 24
+
+# see migration_utils
+MIGRATION_DEFAULT_LOCK_TIMEOUT_MILLISECONDS = 2000
+MIGRATION_DEFAULT_LOCK_RETRY_ATTEMPTS = 30
+MIGRATION_DEFAULT_LOCK_RETRY_SLEEP_SECONDS = 2
+MIGRATION_BACKFILL_DEFAULT_BATCH_SIZE = 5000
+MIGRATION_BACKFILL_DEFAULT_SLEEP_SECONDS = 0.2
@@ -4,73 +4,182 @@ import pathlib
 from furaffinity_scrape import model
 
 import attr
-from sqlalchemy import Column, Index, Integer, Unicode, LargeBinary, ForeignKey, UniqueConstraint, PrimaryKeyConstraint
+from sqlalchemy import text, TypeDecorator, Column, Index, Integer, DateTime, Enum, BigInteger, Unicode, LargeBinary, ForeignKey, ForeignKeyConstraint, UniqueConstraint, PrimaryKeyConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy_repr import RepresentableBase
 from sqlalchemy_utils.types.url import URLType
-from sqlalchemy_utils.types.arrow import ArrowType
 from sqlalchemy_utils.types.choice import ChoiceType
 
 logger = logging.getLogger(__name__)
 
 CustomDeclarativeBase = declarative_base(cls=RepresentableBase, name="CustomDeclarativeBase")
 
+def native_enum(enum_class, type_name:str) -> Enum:
+    '''
+    a native postgres ENUM for one of the enums in `model`, 4 bytes per row and index entry instead of
+    the string, and compared as an integer
+
+    the labels are the enum values (not the names), so the columns hold the same text that ChoiceType
+    stored and read back as the same members of the python enum
+
+    @param enum_class - the enum class from `model`
+    @param type_name - the name of the type in postgres
+    '''
+
+    return Enum(enum_class, name=type_name, values_callable=lambda x: [iter_member.value for iter_member in x])
+
+class Sha512Digest(TypeDecorator):
+    '''
+    a sha512 stored as the 64 raw bytes in a `bytea` column, half the size of the hex string in the
+    row and in the index
+
+    the rest of the code keeps using the lowercase hex string (logs, blob store keys, file names), the
+    conversion only happens here on the way in and out of the database
+    '''
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+
+        if value is None or isinstance(value, bytes):
+            return value
+
+        return bytes.fromhex(value)
+
+    def process_result_value(self, value, dialect):
+
+        if value is None:
+            return None
+
+        return value.hex()
+
 class SubmissionWebpage(CustomDeclarativeBase):
 
     __tablename__ = "submission_webpage"
 
     submission_webpage_id = Column(Integer, nullable=False, autoincrement=True)
 
-    submission_id = Column(Integer,
-        ForeignKey("submission.submission_id",
-            name="FK-submission_webpage-submission_id-submission-submission_id"),
-        nullable=False)
+    # `submission` is partitioned by furaffinity_submission_id, so it has to be part of the foreign key
+    submission_id = Column(Integer, nullable=False)
+
+    furaffinity_submission_id = Column(Integer, nullable=False)
 
     submission = relationship("Submission")
 
-    date_visited = Column(ArrowType, nullable=False)
+    date_visited = Column(DateTime(timezone=True), nullable=False)
+
+    # NULL for rows that reference a deduplicated blob in `submission_webpage_blob` instead,
+    # older rows still have the data inline
+    raw_compressed_webpage_data = Column(LargeBinary, nullable=True)
+
+    blob_id = Column(Integer,
+        ForeignKey("submission_webpage_blob.blob_id",
+            name="FK-submission_webpage-blob_id-submission_webpage_blob-blob_id"),
+        nullable=True)
+
+    blob = relationship("SubmissionWebpageBlob")
 
-    raw_compressed_webpage_data = Column(LargeBinary, nullable=False)
+    encoding_status = Column(native_enum(model.EncodingStatusEnum, "encoding_status_enum"), nullable=False)
 
-    encoding_status = Column(ChoiceType(model.EncodingStatusEnum, impl=Unicode()), nullable=False)
+    original_data_sha512 = Column(Sha512Digest, nullable=False)
 
-    original_data_sha512 = Column(Unicode, nullable=False)
+    compressed_data_sha512 = Column(Sha512Digest, nullable=False)
 
-    compressed_data_sha512 = Column(Unicode, nullable=False)
+    # how raw_compressed_webpage_data is compressed, everything before recompress_archive was tar.xz
+    compression_scheme = Column(ChoiceType(model.CompressionScheme, impl=Unicode()), nullable=False,
+        default=model.CompressionScheme.TAR_XZ, server_default=model.CompressionScheme.TAR_XZ.value)
+
+    # for inline rows, whether the data is still in raw_compressed_webpage_data or was moved to the
+    # blob store by move_blobs_to_store
+    storage_location = Column(ChoiceType(model.BlobStorageLocation, impl=Unicode()), nullable=False,
+        default=model.BlobStorageLocation.DATABASE, server_default=model.BlobStorageLocation.DATABASE.value)
 
 
     __table_args__ = (
         PrimaryKeyConstraint("submission_webpage_id", name="PK-submission_webpage-submission_webpage_id"),
-        Index("IX-submission_webpage-date_visited", "date_visited"),
+        ForeignKeyConstraint(
+            ["submission_id", "furaffinity_submission_id"],
+            ["submission.submission_id", "submission.furaffinity_submission_id"],
+            name="FK-submission_webpage-submission-submission"),
+        # BRIN, see the `use_brin_for_date_indexes` migration
+        Index("IX-submission_webpage-date_visited", "date_visited", postgresql_using="brin"),
         Index("IX-submission_webpage-submission_id", "submission_id"),
         Index("IX-submission_webpage-original_data_sha512", "original_data_sha512"),
         Index("IX-submission_webpage-compressed_data_sha512", "compressed_data_sha512"),
+        Index("IX-submission_webpage-blob_id", "blob_id"),
+
+    )
+
+    __repr_blacklist__ = ["raw_compressed_webpage_data"]
+
+class SubmissionWebpageBlob(CustomDeclarativeBase):
+    '''
+    a compressed webpage that is stored once no matter how many times we have scraped the
+    identical page, `submission_webpage` rows point to this through `blob_id`
+
+    reference_count is the number of `submission_webpage` rows that point at this blob, see
+    webpage_blob_utils for the functions that keep it up to date
+    '''
+
+    __tablename__ = "submission_webpage_blob"
+
+    blob_id = Column(Integer, nullable=False, autoincrement=True)
+
+    date_added = Column(DateTime(timezone=True), nullable=False)
 
+    original_data_sha512 = Column(Sha512Digest, nullable=False)
+
+    compressed_data_sha512 = Column(Sha512Digest, nullable=False)
+
+    # NULL once the data is in the blob store, keyed by compressed_data_sha512
+    raw_compressed_webpage_data = Column(LargeBinary, nullable=True)
+
+    reference_count = Column(Integer, nullable=False)
+
+    compression_scheme = Column(ChoiceType(model.CompressionScheme, impl=Unicode()), nullable=False,
+        default=model.CompressionScheme.TAR_XZ, server_default=model.CompressionScheme.TAR_XZ.value)
+
+    storage_location = Column(ChoiceType(model.BlobStorageLocation, impl=Unicode()), nullable=False,
+        default=model.BlobStorageLocation.DATABASE, server_default=model.BlobStorageLocation.DATABASE.value)
+
+    __repr_blacklist__ = ["raw_compressed_webpage_data"]
+
+    __table_args__ = (
+        PrimaryKeyConstraint("blob_id", name="PK-submission_webpage_blob-blob_id"),
+        Index("IXUQ-submission_webpage_blob-original_data_sha512", "original_data_sha512", unique=True),
+        Index("IX-submission_webpage_blob-compressed_data_sha512", "compressed_data_sha512"),
     )
 
 class Submission(CustomDeclarativeBase):
+    '''
+    range partitioned by furaffinity_submission_id, see partition_utils
+    '''
+
     __tablename__ = "submission"
 
     submission_id = Column(Integer, nullable=False, autoincrement=True)
 
     furaffinity_submission_id = Column(Integer, nullable=False)
 
-    date_visited = Column(ArrowType, nullable=False)
+    date_visited = Column(DateTime(timezone=True), nullable=False)
 
-    submission_status = Column(ChoiceType(model.SubmissionStatus, impl=Unicode()), nullable=False)
+    submission_status = Column(native_enum(model.SubmissionStatus, "submission_status_enum"), nullable=False)
 
-    processed_status = Column(ChoiceType(model.ProcessedStatus, impl=Unicode()), nullable=False)
+    processed_status = Column(native_enum(model.ProcessedStatus, "processed_status_enum"), nullable=False)
 
     claimed_by = Column(Unicode, nullable=False)
 
     __table_args__ = (
-        PrimaryKeyConstraint("submission_id", name="PK-submission-submission_id"),
-        Index("IX-submission-furaffinity_submission_id", "furaffinity_submission_id"),
+        PrimaryKeyConstraint("submission_id", "furaffinity_submission_id", name="PK-submission-submission_id-furaffinity_submission_id"),
+        Index("IXUQ-submission-furaffinity_submission_id", "furaffinity_submission_id", unique=True),
+        # stays a b-tree, CLAIM_SUBMISSION updates date_visited so the rows aren't in date order on disk
         Index("IX-submission-date_visited", "date_visited"),
-        Index("IX-submission-submission_status", "submission_status"),
-        Index("IX-submission-processed_status", "processed_status"),
-        Index("IX-submission-claimed_by", "claimed_by"),
+        # only the rows that still need work, almost everything ends up finished
+        Index("IX-submission-furaffinity_submission_id-unfinished", "furaffinity_submission_id",
+            postgresql_where=text("processed_status IN ('todo', 'error')")),
+        {"postgresql_partition_by": "RANGE (furaffinity_submission_id)"},
     )
 
 class User(CustomDeclarativeBase):
@@ -79,18 +188,21 @@ class User(CustomDeclarativeBase):
     # primary key column
     user_id = Column(Integer, nullable=False, autoincrement=True)
 
-    date_added = Column(ArrowType, nullable=False)
+    date_added = Column(DateTime(timezone=True), nullable=False)
 
     user_name = Column(Unicode, nullable=False)
 
     __table_args__ = (
         PrimaryKeyConstraint("user_id", name="PK-user-user_id"),
-        Index("IX-user-date_added", "date_added"),
+        Index("IX-user-date_added", "date_added", postgresql_using="brin"),
         Index("IXUQ-user-user_name", "user_name", unique=True),
     )
 
 
 class FAScrapeAttempt(CustomDeclarativeBase):
+    '''
+    range partitioned by furaffinity_submission_id, see partition_utils
+    '''
 
     __tablename__ = "fa_scrape_attempt"
 
@@ -98,18 +210,44 @@ class FAScrapeAttempt(CustomDeclarativeBase):
 
     furaffinity_submission_id = Column(Integer, nullable=False)
 
-    date_visited = Column(ArrowType, nullable=False)
+    date_visited = Column(DateTime(timezone=True), nullable=False)
 
-    processed_status = Column(ChoiceType(model.ProcessedStatus, impl=Unicode()), nullable=False)
+    processed_status = Column(native_enum(model.ProcessedStatus, "processed_status_enum"), nullable=False)
 
     claimed_by = Column(Unicode, nullable=False)
 
     error_string = Column(Unicode, nullable=True)
 
     __table_args__ = (
-        PrimaryKeyConstraint("scrape_attempt_id", name="PK-fa_scrape_attempt-scrape_attempt_id"),
+        PrimaryKeyConstraint("scrape_attempt_id", "furaffinity_submission_id", name="PK-fa_scrape_attempt-scrape_attempt_id-fa_submission_id"),
         Index("IX-fa_scrape_attempt-furaffinity_submission_id", "furaffinity_submission_id"),
-        Index("IX-fa_scrape_attempt-furaffinity_submission_id-processed_status", "furaffinity_submission_id", "processed_status"),
+        Index("IX-fa_scrape_attempt-furaffinity_submission_id-unfinished", "furaffinity_submission_id",
+            postgresql_where=text("processed_status IN ('todo', 'error')")),
+        {"postgresql_partition_by": "RANGE (furaffinity_submission_id)"},
+    )
+
+
+class FAScrapeAttemptErrorHistory(CustomDeclarativeBase):
+    '''
+    the failed fa_scrape_attempt rows that compact_attempts removed, rolled up into one row per
+    submission, so fa_scrape_attempt stays at about one row per submission
+    '''
+
+    __tablename__ = "fa_scrape_attempt_error_history"
+
+    furaffinity_submission_id = Column(Integer, nullable=False)
+
+    # how many failed attempts were rolled up into this row
+    error_count = Column(Integer, nullable=False)
+
+    # the date_visited of the first and last of those attempts
+    first_error_date = Column(DateTime(timezone=True), nullable=False)
+    last_error_date = Column(DateTime(timezone=True), nullable=False)
+
+    last_error_string = Column(Unicode, nullable=True)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("furaffinity_submission_id", name="PK-fa_scrape_attempt_error_history-fa_submission_id"),
     )
 
 
@@ -118,13 +256,13 @@ class FAScrapeContent(CustomDeclarativeBase):
 
     content_id = Column(Integer, nullable=False, autoincrement=True)
 
-    attempt_id = Column(Integer,
-        ForeignKey("fa_scrape_attempt.scrape_attempt_id",
-            name="FK-fa_scrape_content-a_id-fa_scrape_attempt-scrape_attempt_id"),
-        nullable=False)
+    # `fa_scrape_attempt` is partitioned by furaffinity_submission_id, so it has to be part of the foreign key
+    attempt_id = Column(Integer, nullable=False)
+
+    furaffinity_submission_id = Column(Integer, nullable=False)
 
     content_length = Column(Integer, nullable=False)
-    content_sha512 = Column(Unicode, nullable=False)
+    content_sha512 = Column(Sha512Digest, nullable=False)
     content_binary = Column(LargeBinary, nullable=True)
 
     attempt = relationship("FAScrapeAttempt")
@@ -136,35 +274,114 @@ class FAScrapeContent(CustomDeclarativeBase):
 
     __table_args__ = (
         PrimaryKeyConstraint("content_id", name="PK-fa_scrape_content-content_id"),
+        ForeignKeyConstraint(
+            ["attempt_id", "furaffinity_submission_id"],
+            ["fa_scrape_attempt.scrape_attempt_id", "fa_scrape_attempt.furaffinity_submission_id"],
+            name="FK-fa_scrape_content-attempt-fa_scrape_attempt"),
         Index("IX-fa_scrape_content-attempt_id", "attempt_id"),
 
 
     )
 
+class FinishedSubmissionRange(CustomDeclarativeBase):
+    '''
+    the furaffinity submission ids that have a finished fa_scrape_attempt, stored as merged, non
+    overlapping ranges (both ends inclusive), so finding out what is done or what the gaps are reads
+    a few rows instead of scanning fa_scrape_attempt
+
+    only written by the `merge_finished_submission_range` function, see submission_range_utils
+    '''
+
+    __tablename__ = "finished_submission_range"
+
+    range_start = Column(Integer, nullable=False)
+    range_end = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("range_start", name="PK-finished_submission_range-range_start"),
+        Index("IX-finished_submission_range-range_end", "range_end"),
+    )
+
 class FuraffinityHoleStatus(CustomDeclarativeBase):
 
     __tablename__ = "fa_hole_status"
 
     item_id = Column(Integer, nullable=False, autoincrement=True)
     run_id = Column(Integer, nullable=False)
-    processed_status = Column(ChoiceType(model.ProcessedStatus, impl=Unicode()), nullable=False)
+    processed_status = Column(native_enum(model.ProcessedStatus, "processed_status_enum"), nullable=False)
     file_path = Column(Unicode, nullable=False)
-    warc_sha512 = Column(Unicode, nullable=True)
-    fa_submission_status = Column(ChoiceType(model.FuraffinitySubmissionStatus, impl=Unicode()), nullable=False)
+    warc_sha512 = Column(Sha512Digest, nullable=True)
+    fa_submission_status = Column(native_enum(model.FuraffinitySubmissionStatus, "furaffinity_submission_status_enum"), nullable=False)
+    # set while a find_fa_holes worker has the row IN_PROGRESS, the row can be reclaimed once the lease expires
+    claimed_by = Column(Unicode, nullable=True)
+    lease_expires = Column(DateTime(timezone=True), nullable=True)
 
 
     __table_args__ = (
         PrimaryKeyConstraint("item_id", name="PK-fa_hole_status-item_id"),
-        Index("IX-fa_hole_status-run_id-processed_status", "run_id", "processed_status"),
+        # what FindFaHoles.claim_batch scans, `in_progress` is included since expired leases get reclaimed
+        Index("IX-fa_hole_status-item_id-run_id-claimable", "item_id", "run_id",
+            postgresql_where=text("processed_status IN ('todo', 'in_progress', 'error')")),
 
     )
 
 
+class RecompressCheckpoint(CustomDeclarativeBase):
+    '''
+    how far a recompress_archive job has gotten, so it can be stopped and resumed,
+    possibly on a different machine
+
+    the job is owned by `claimed_by` until `lease_expires`, every checkpoint extends the lease
+    '''
+
+    __tablename__ = "recompress_checkpoint"
+
+    checkpoint_id = Column(Integer, nullable=False, autoincrement=True)
+    job_name = Column(Unicode, nullable=False)
+    source = Column(ChoiceType(model.RecompressSource, impl=Unicode()), nullable=False)
+    target_format = Column(Unicode, nullable=False)
+    # the keyset position, last_row_id for the row sources, last_file_path for the file source
+    last_row_id = Column(Integer, nullable=True)
+    last_file_path = Column(Unicode, nullable=True)
+    items_done = Column(Integer, nullable=False)
+    items_failed = Column(Integer, nullable=False)
+    bytes_before = Column(BigInteger, nullable=False)
+    bytes_after = Column(BigInteger, nullable=False)
+    claimed_by = Column(Unicode, nullable=True)
+    lease_expires = Column(DateTime(timezone=True), nullable=True)
+    date_updated = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("checkpoint_id", name="PK-recompress_checkpoint-checkpoint_id"),
+        Index("IXUQ-recompress_checkpoint-job_name", "job_name", unique=True),
+    )
+
+
+class MigrationBackfillCheckpoint(CustomDeclarativeBase):
+    '''
+    how far a `MigrationUtils.batched_backfill` has gotten, so an interrupted migration resumes after
+    the last committed batch. the row is deleted once the backfill finishes
+    '''
+
+    __tablename__ = "migration_backfill_checkpoint"
+
+    backfill_name = Column(Unicode, nullable=False)
+    # the key of the last row of the last committed batch
+    last_key = Column(BigInteger, nullable=False)
+    rows_done = Column(BigInteger, nullable=False)
+    date_updated = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("backfill_name", name="PK-migration_backfill_checkpoint-backfill_name"),
+    )
+
 
 @attr.s(auto_attribs=True, frozen=True, kw_only=True)
 class WgetDownloadResult:
 
     fa_scrape_content:FAScrapeContent = attr.ib()
     compressed_warc_file_path:pathlib.Path = attr.ib()
+    # only set when the warc was compressed per record, see warc_utils
+    record_index_file_path:pathlib.Path|None = attr.ib(default=None)
 
 
@@ -3,6 +3,8 @@ import asyncio
 import pathlib
 import typing
 import hashlib
+import mmap
+import os
 
 import arrow
 import aiofiles
@@ -15,6 +17,7 @@ from furaffinity_scrape import db_model
 from furaffinity_scrape import constants
 from furaffinity_scrape import utils
 from furaffinity_scrape import rsync_utils
+from furaffinity_scrape import warc_utils
 
 logger = logging.getLogger(__name__)
 
@@ -163,6 +166,54 @@ class FileUtils:
         original_file_size = original_file_stat.st_size
         original_file_size_string = bitmath.Byte(original_file_size).best_prefix().format(constants.BITMATH_FORMATTING_STRING)
 
+        record_index_filepath = None
+
+        if settings.warc_compression_format == model.WarcCompressionFormat.SEVENZIP:
+
+            compressed_warc_filepath = await FileUtils.compress_warc_file_with_sevenzip(
+                warc_file_to_compress=warc_file_to_compress,
+                settings=settings)
+
+        else:
+
+            compressed_warc_filepath, record_index_filepath = await FileUtils.compress_warc_file_per_record(
+                warc_file_to_compress=warc_file_to_compress,
+                compression_format=settings.warc_compression_format)
+
+        # hashing is blocking, don't do it on the event loop
+        content_sha512, content_length = await asyncio.to_thread(
+            FileUtils.sha512_and_length_of_file,
+            compressed_warc_filepath)
+
+        compressed_file_size_string = bitmath.Byte(content_length).best_prefix().format(constants.BITMATH_FORMATTING_STRING)
+
+        logger.info("Compressed `%s` (`%s` -> `%s`)",
+            warc_file_to_compress.name, original_file_size_string, compressed_file_size_string)
+
+        # explicitly set content_bytes to be None as we are no longer
+        # storing the file in the database
+        scrape_content = db_model.FAScrapeContent(
+            content_length=content_length,
+            content_sha512=content_sha512,
+            content_binary=None)
+
+        wget_dl_result = db_model.WgetDownloadResult(
+            fa_scrape_content=scrape_content,
+            compressed_warc_file_path=compressed_warc_filepath,
+            record_index_file_path=record_index_filepath)
+
+        return wget_dl_result
+
+    @staticmethod
+    async def compress_warc_file_with_sevenzip(
+        warc_file_to_compress:pathlib.Path,
+        settings:model.Settings) -> pathlib.Path:
+        '''
+        compresses the whole warc file into one solid 7z archive
+
+        @return the path to the 7z file
+        '''
+
         compressed_warc_filepath = warc_file_to_compress.with_suffix(warc_file_to_compress.suffix + ".7z")
 
         sevenzip_compress_arg_list = [
@@ -190,47 +241,66 @@ class FileUtils:
             logger.exception("Failed to compress warc file `%s`", warc_file_to_compress)
             raise e
 
-        hasher = hashlib.sha512()
-        content_length = 0
-        content_bytes = bytearray()
+        return compressed_warc_filepath
 
-        # now load the file that was created
-        async with aiofiles.open(compressed_warc_filepath, "rb") as compressed_warc_fileobj:
+    @staticmethod
+    async def compress_warc_file_per_record(
+        warc_file_to_compress:pathlib.Path,
+        compression_format:model.WarcCompressionFormat) -> tuple[pathlib.Path, pathlib.Path]:
+        '''
+        compresses every record of the warc file on its own (`.warc.gz` / `.warc.zst`) and writes the
+        sidecar index with the offset of every record so a reader can seek straight to one record
 
-            # read the 7z file into memory and hash it
-            while True:
+        @return a tuple of the compressed warc path and the record index path
+        '''
 
-                iter_data = await compressed_warc_fileobj.read(64 * 1024)
+        compressed_warc_filepath = warc_file_to_compress.with_name(
+            warc_file_to_compress.name + warc_utils.WarcUtils.get_per_record_compressed_suffix(compression_format))
+        record_index_filepath = warc_utils.WarcUtils.get_record_index_path(compressed_warc_filepath)
 
-                if not iter_data:
-                    break
+        logger.debug("Compressing `%s` per record as `%s`", warc_file_to_compress, compression_format)
 
-                hasher.update(iter_data)
-                content_length += len(iter_data)
-                content_bytes += iter_data
+        # compressing is cpu bound and blocking, don't do it on the event loop
+        index_entry_list = await asyncio.to_thread(
+            warc_utils.WarcUtils.write_per_record_compressed_warc,
+            warc_file_to_compress,
+            compressed_warc_filepath,
+            compression_format)
 
+        await asyncio.to_thread(
+            warc_utils.WarcUtils.write_record_index,
+            record_index_filepath,
+            index_entry_list)
 
-        compressed_file_size_string = bitmath.Byte(content_length).best_prefix().format(constants.BITMATH_FORMATTING_STRING)
+        logger.debug("wrote record index `%s` with `%s` records", record_index_filepath, len(index_entry_list))
 
-        logger.info("Compressed `%s` (`%s` -> `%s`)",
-            warc_file_to_compress.name, original_file_size_string, compressed_file_size_string)
+        return (compressed_warc_filepath, record_index_filepath)
 
-        # explicitly set content_bytes to be None as we are no longer
-        # storing the file in the database
-        scrape_content = db_model.FAScrapeContent(
-            content_length=content_length,
-            content_sha512=hasher.hexdigest(),
-            content_binary=None)
+    @staticmethod
+    def sha512_and_length_of_file(file_path:pathlib.Path) -> tuple[str, int]:
+        '''
+        hashes a file by memory mapping it, so the kernel reads ahead for us and the whole
+        file goes to hashlib in one call (which releases the GIL), this lets several of these
+        run at once on a thread pool
 
-        wget_dl_result = db_model.WgetDownloadResult(
-            fa_scrape_content=scrape_content,
-            compressed_warc_file_path=compressed_warc_filepath)
+        this is blocking, so call it with `asyncio.to_thread()` or on an executor
 
-        return wget_dl_result
+        @return a tuple of the sha512 as a hex string and the length of the file in bytes
+        '''
 
+        hasher = hashlib.sha512()
 
+        with open(file_path, "rb") as f:
 
+            file_length = os.fstat(f.fileno()).st_size
 
+            # you can't mmap an empty file
+            if file_length == 0:
+                return (hasher.hexdigest(), 0)
 
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
 
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+                hasher.update(mm)
 
+        return (hasher.hexdigest(), file_length)
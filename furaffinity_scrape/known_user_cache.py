@@ -0,0 +1,194 @@
+import logging
+import math
+import hashlib
+import collections
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from furaffinity_scrape import db_model
+from furaffinity_scrape import constants
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    '''
+    a plain bloom filter over strings, sized for an expected number of items and false positive rate
+
+    `in` returning False means the item was definitely never added, True means it probably was
+    '''
+
+    def __init__(self, expected_number_of_items:int, false_positive_rate:float):
+
+        expected_number_of_items = max(expected_number_of_items, 1)
+
+        # the standard formulas for the optimal number of bits and hash functions
+        self.number_of_bits = max(8, math.ceil(-expected_number_of_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.number_of_hashes = max(1, round(self.number_of_bits / expected_number_of_items * math.log(2)))
+        self.bit_array = bytearray(math.ceil(self.number_of_bits / 8))
+        self.number_of_items = 0
+
+    def _bit_indexes(self, item:str):
+
+        # double hashing, two 64 bit halves of one digest make all of the k indexes
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        hash_one = int.from_bytes(digest[:8], "little")
+        hash_two = int.from_bytes(digest[8:], "little") | 1
+
+        for i in range(self.number_of_hashes):
+            yield (hash_one + i * hash_two) % self.number_of_bits
+
+    def add(self, item:str):
+
+        for iter_index in self._bit_indexes(item):
+            self.bit_array[iter_index >> 3] |= 1 << (iter_index & 7)
+
+        self.number_of_items += 1
+
+    def __contains__(self, item:str) -> bool:
+
+        return all(self.bit_array[iter_index >> 3] & (1 << (iter_index & 7)) for iter_index in self._bit_indexes(item))
+
+    def size_in_bytes(self) -> int:
+        return len(self.bit_array)
+
+
+class KnownUserCache:
+    '''
+    remembers which usernames are already in the `user` table so the user sink only has to send the
+    real unknowns to the database
+
+    * a bloom filter of every user, warmed from the `user` table at startup with a COPY
+      * not in the bloom filter: definitely a new user
+    * a LRU of the users we have confirmed recently (the popular artists and commenters)
+      * in the LRU: definitely already in the database
+    * in the bloom filter but not in the LRU: probably in the database, we confirm these with one
+      batched select, since trusting a false positive would mean never inserting that user
+
+    memory is bounded by the size of the bloom filter, which is fixed at startup, and the LRU size
+    '''
+
+    def __init__(self, lru_size:int, false_positive_rate:float=constants.KNOWN_USER_CACHE_FALSE_POSITIVE_RATE):
+
+        self.lru_size = lru_size
+        self.false_positive_rate = false_positive_rate
+        self.bloom_filter = None
+        self.lru_dict = collections.OrderedDict()
+
+        self.lru_hits = 0
+        self.bloom_negatives = 0
+        self.database_lookups = 0
+
+    async def warm(self, sqla_session:AsyncSession):
+        '''
+        sizes the bloom filter off of the current size of the `user` table and adds every username to it
+
+        the usernames are streamed with COPY so we don't build millions of result rows
+        '''
+
+        count_result = await sqla_session.execute(select(func.count()).select_from(db_model.User))
+        number_of_users = count_result.scalar_one()
+
+        # leave room for the table to grow while we are running
+        self.bloom_filter = BloomFilter(
+            max(int(number_of_users * constants.KNOWN_USER_CACHE_GROWTH_FACTOR), constants.KNOWN_USER_CACHE_MINIMUM_CAPACITY),
+            self.false_positive_rate)
+
+        sqla_connection = await sqla_session.connection()
+        raw_connection = await sqla_connection.get_raw_connection()
+        asyncpg_connection = raw_connection.driver_connection
+
+        leftover = bytearray()
+
+        async def _on_copy_data(data:bytes):
+
+            # COPY hands us chunks that don't line up with the rows
+            leftover.extend(data)
+            *line_list, remainder = leftover.split(b"\n")
+
+            for iter_line in line_list:
+                self.bloom_filter.add(iter_line.decode("utf-8"))
+
+            leftover[:] = remainder
+
+        user_table = db_model.User.__table__
+
+        await asyncpg_connection.copy_from_query(
+            f'SELECT "{user_table.c.user_name.name}" FROM "{user_table.name}"',
+            output=_on_copy_data,
+            format="text")
+
+        if leftover:
+            self.bloom_filter.add(leftover.decode("utf-8"))
+
+        logger.info("warmed the known user bloom filter with `%s` users, `%s` bytes and `%s` hashes",
+            self.bloom_filter.number_of_items, self.bloom_filter.size_in_bytes(), self.bloom_filter.number_of_hashes)
+
+    def add_known_users(self, user_name_iterable):
+        '''
+        records users that are now definitely in the database, only call this after the
+        transaction that inserted them has committed
+        '''
+
+        for iter_user_name in user_name_iterable:
+
+            if self.bloom_filter is not None:
+                self.bloom_filter.add(iter_user_name)
+
+            self.lru_dict[iter_user_name] = True
+            self.lru_dict.move_to_end(iter_user_name)
+
+        while len(self.lru_dict) > self.lru_size:
+            self.lru_dict.popitem(last=False)
+
+    async def filter_unknown_users(self, sqla_session:AsyncSession, user_name_iterable) -> set[str]:
+        '''
+        returns the users that aren't in the database, only querying the database for the ones
+        the bloom filter says are probably there but aren't in the LRU
+
+        @param sqla_session - the sqlalchemy session, the select runs in whatever transaction it is in
+        @param user_name_iterable - the usernames found
+        @return the set of usernames that need to be inserted
+        '''
+
+        unknown_user_set = set()
+        maybe_known_user_set = set()
+
+        for iter_user_name in user_name_iterable:
+
+            if iter_user_name in self.lru_dict:
+                self.lru_dict.move_to_end(iter_user_name)
+                self.lru_hits += 1
+
+            elif self.bloom_filter is not None and iter_user_name not in self.bloom_filter:
+                unknown_user_set.add(iter_user_name)
+                self.bloom_negatives += 1
+
+            else:
+                maybe_known_user_set.add(iter_user_name)
+
+        if maybe_known_user_set:
+
+            self.database_lookups += len(maybe_known_user_set)
+
+            known_user_set = set()
+            maybe_known_user_list = sorted(maybe_known_user_set)
+
+            # chunk it so we stay under the bind parameter limit
+            for chunk_start in range(0, len(maybe_known_user_list), constants.USER_UPSERT_CHUNK_SIZE):
+
+                select_statement = select(db_model.User.user_name) \
+                    .where(db_model.User.user_name.in_(maybe_known_user_list[chunk_start:chunk_start + constants.USER_UPSERT_CHUNK_SIZE]))
+
+                select_result = await sqla_session.execute(select_statement)
+                known_user_set.update(select_result.scalars().all())
+
+            self.add_known_users(known_user_set)
+
+            # bloom filter false positives, or users added by another worker since we warmed up
+            unknown_user_set.update(maybe_known_user_set.difference(known_user_set))
+
+        logger.debug("known user cache: `%s` lru hits, `%s` bloom filter negatives, `%s` looked up in the database so far",
+            self.lru_hits, self.bloom_negatives, self.database_lookups)
+
+        return unknown_user_set
@@ -13,6 +13,12 @@ from furaffinity_scrape.modules.extract_files_from_db import ExtractFilesFromDb
 from furaffinity_scrape.modules.queue_latest_submissions import QueueLatestSubmissions
 from furaffinity_scrape.modules.find_fa_holes_prescan import FindFaHolesPrescan
 from furaffinity_scrape.modules.find_fa_holes import FindFaHoles
+from furaffinity_scrape.modules.benchmark_compression import BenchmarkCompression
+from furaffinity_scrape.modules.recompress_archive import RecompressArchive
+from furaffinity_scrape.modules.verify_archive import VerifyArchive
+from furaffinity_scrape.modules.show_finished_ranges import ShowFinishedRanges
+from furaffinity_scrape.modules.move_blobs_to_store import MoveBlobsToStore
+from furaffinity_scrape.modules.compact_attempts import CompactAttempts
 
 
 
@@ -63,6 +69,14 @@ class Main():
         FindFaHolesPrescan.create_subparser_command(subparsers)
         FindFaHoles.create_subparser_command(subparsers)
 
+        BenchmarkCompression.create_subparser_command(subparsers)
+        RecompressArchive.create_subparser_command(subparsers)
+        VerifyArchive.create_subparser_command(subparsers)
+
+        ShowFinishedRanges.create_subparser_command(subparsers)
+        MoveBlobsToStore.create_subparser_command(subparsers)
+        CompactAttempts.create_subparser_command(subparsers)
+
         root_logger = logging.getLogger()
 
         try:
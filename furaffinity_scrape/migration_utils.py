@@ -0,0 +1,350 @@
+import logging
+import time
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+from furaffinity_scrape import constants
+
+# under `alembic` so the logging config in alembic.ini shows these next to alembic's own messages
+logger = logging.getLogger("alembic.runtime.migration_utils")
+
+# SQLSTATE for `lock_not_available`, what postgres raises when `lock_timeout` runs out
+POSTGRES_LOCK_NOT_AVAILABLE_SQLSTATE = "55P03"
+
+class MigrationUtils:
+    '''
+    helpers for alembic version scripts that have to run against the big tables while the scrapers are
+    still running, so a schema change doesn't need every scraper to be stopped first
+
+    * `run_with_lock_timeout` - runs DDL with a short `lock_timeout` and retries it, so an ALTER that is
+      stuck behind a long transaction gives up quickly instead of blocking every query queued behind it
+    * `create_index_concurrently` / `drop_index_concurrently` - `CREATE / DROP INDEX CONCURRENTLY`,
+      including the partitioned tables, which postgres doesn't allow CONCURRENTLY on directly
+    * `batched_backfill` - an UPDATE done in small keyset batches, each committed on its own, with a
+      sleep between them and a checkpoint row so an interrupted migration picks up where it left off
+
+    all of these commit whatever the migration did before calling them (they run in alembic's
+    `autocommit_block`), and every statement they run commits on its own, so a migration that uses
+    them isn't atomic anymore and should be written so running it again is harmless
+
+    example, in a version script:
+
+        def upgrade() -> None:
+
+            op.add_column('fa_scrape_content', sa.Column('content_length_kb', sa.Integer(), nullable=True))
+
+            MigrationUtils.batched_backfill(
+                backfill_name='fa_scrape_content-content_length_kb',
+                table_name='fa_scrape_content',
+                key_column_name='content_id',
+                set_sql='content_length_kb = content_length / 1024',
+                where_sql='content_length_kb IS NULL')
+
+            MigrationUtils.create_index_concurrently(
+                'IX-fa_scrape_content-content_length_kb', 'fa_scrape_content', ['content_length_kb'])
+    '''
+
+    @staticmethod
+    def quote(identifier:str) -> str:
+
+        return op.get_bind().dialect.identifier_preparer.quote(identifier)
+
+    @staticmethod
+    def run_with_lock_timeout(
+        func_to_run,
+        lock_timeout_milliseconds:int=constants.MIGRATION_DEFAULT_LOCK_TIMEOUT_MILLISECONDS,
+        max_attempts:int=constants.MIGRATION_DEFAULT_LOCK_RETRY_ATTEMPTS,
+        retry_sleep_seconds:float=constants.MIGRATION_DEFAULT_LOCK_RETRY_SLEEP_SECONDS):
+        '''
+        calls `func_to_run` (which does the `op.*` calls or `op.execute()`s) outside of the migration's
+        transaction with `lock_timeout` set, and if it couldn't get its locks in time, waits and tries again
+
+        this is for the statements that take an ACCESS EXCLUSIVE lock, even the ones that are instant
+        (like dropping a NOT NULL), since while they wait for the lock every other query on the table
+        waits behind them
+
+        @param func_to_run - a function that takes no arguments, it is called once per attempt, so each
+        attempt has to be able to start from scratch
+        @param lock_timeout_milliseconds - how long each attempt waits for its locks
+        @param max_attempts - how many times to try before giving up and raising the error
+        @param retry_sleep_seconds - the wait after the first failed attempt, it grows linearly after that
+        '''
+
+        with op.get_context().autocommit_block():
+
+            sqla_connection = op.get_bind()
+
+            for iter_attempt_number in range(1, max_attempts + 1):
+
+                sqla_connection.exec_driver_sql(f"SET lock_timeout = {int(lock_timeout_milliseconds)}")
+
+                try:
+
+                    func_to_run()
+                    return
+
+                except sa.exc.DBAPIError as e:
+
+                    if getattr(e.orig, "pgcode", None) != POSTGRES_LOCK_NOT_AVAILABLE_SQLSTATE or iter_attempt_number == max_attempts:
+                        raise e
+
+                    sleep_seconds = retry_sleep_seconds * iter_attempt_number
+
+                    logger.warning("couldn't get the locks within `%s` ms (attempt `%s` of `%s`), trying again in `%s` seconds",
+                        lock_timeout_milliseconds, iter_attempt_number, max_attempts, sleep_seconds)
+
+                    time.sleep(sleep_seconds)
+
+                finally:
+                    sqla_connection.exec_driver_sql("RESET lock_timeout")
+
+    @staticmethod
+    def get_partition_name_list(table_name:str) -> list[str]|None:
+        '''
+        @return the names of the partitions of the table, or None if it isn't a partitioned table
+        '''
+
+        sqla_connection = op.get_bind()
+
+        relkind = sqla_connection.execute(
+            sa.text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:table_name)"),
+            {"table_name": MigrationUtils.quote(table_name)}).scalar_one()
+
+        if relkind != "p":
+            return None
+
+        return sqla_connection.execute(sa.text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table_name) ORDER BY child.relname"),
+            {"table_name": MigrationUtils.quote(table_name)}).scalars().all()
+
+    @staticmethod
+    def get_partition_index_name(index_name:str, partition_name:str) -> str:
+        '''
+        the name for the index on one partition, postgres names are at most 63 characters so the parent
+        index name is shortened to a hash
+        '''
+
+        return f"IX-{partition_name}-{hashlib.sha1(index_name.encode('utf-8')).hexdigest()[:12]}"
+
+    @staticmethod
+    def _drop_index_if_invalid(index_name:str):
+        '''
+        an interrupted CREATE INDEX CONCURRENTLY leaves an INVALID index behind, which still has to be
+        kept up to date on every write but is never used, drop it so it can be built again
+        '''
+
+        is_valid = op.get_bind().execute(
+            sa.text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index_name)"),
+            {"index_name": MigrationUtils.quote(index_name)}).scalar_one_or_none()
+
+        if is_valid is False:
+            logger.warning("dropping the invalid index `%s` left over from an earlier attempt", index_name)
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {MigrationUtils.quote(index_name)}")
+
+    @staticmethod
+    def _get_create_index_sql(
+        index_name:str,
+        table_name:str,
+        column_name_list:list[str],
+        unique:bool,
+        postgresql_using:str|None,
+        postgresql_where:str|None,
+        concurrently:bool,
+        only:bool) -> str:
+
+        column_sql = ", ".join(MigrationUtils.quote(iter_column_name) for iter_column_name in column_name_list)
+
+        return " ".join(iter_part for iter_part in [
+            "CREATE",
+            "UNIQUE" if unique else None,
+            "INDEX",
+            "CONCURRENTLY" if concurrently else None,
+            "IF NOT EXISTS",
+            MigrationUtils.quote(index_name),
+            "ON",
+            "ONLY" if only else None,
+            MigrationUtils.quote(table_name),
+            f"USING {postgresql_using}" if postgresql_using else None,
+            f"({column_sql})",
+            f"WHERE {postgresql_where}" if postgresql_where else None,
+        ] if iter_part is not None)
+
+    @staticmethod
+    def create_index_concurrently(
+        index_name:str,
+        table_name:str,
+        column_name_list:list[str],
+        unique:bool=False,
+        postgresql_using:str|None=None,
+        postgresql_where:str|None=None):
+        '''
+        builds the index without blocking writes to the table, safe to run again if it was interrupted
+
+        postgres doesn't allow CONCURRENTLY on a partitioned table, so for those the index is created on
+        the parent only (which doesn't touch the partitions), built concurrently on each partition and
+        attached, and the parent index becomes valid once every partition has one
+
+        @param postgresql_where - the predicate for a partial index, as SQL
+        '''
+
+        partition_name_list = MigrationUtils.get_partition_name_list(table_name)
+
+        with op.get_context().autocommit_block():
+
+            if partition_name_list is None:
+
+                MigrationUtils._drop_index_if_invalid(index_name)
+
+                logger.info("creating index `%s` on `%s` concurrently", index_name, table_name)
+                op.execute(MigrationUtils._get_create_index_sql(
+                    index_name, table_name, column_name_list, unique, postgresql_using, postgresql_where,
+                    concurrently=True, only=False))
+
+                return
+
+        MigrationUtils.run_with_lock_timeout(lambda: op.execute(MigrationUtils._get_create_index_sql(
+            index_name, table_name, column_name_list, unique, postgresql_using, postgresql_where,
+            concurrently=False, only=True)))
+
+        for iter_partition_name in partition_name_list:
+
+            partition_index_name = MigrationUtils.get_partition_index_name(index_name, iter_partition_name)
+
+            with op.get_context().autocommit_block():
+
+                MigrationUtils._drop_index_if_invalid(partition_index_name)
+
+                logger.info("creating index `%s` on partition `%s` concurrently", partition_index_name, iter_partition_name)
+                op.execute(MigrationUtils._get_create_index_sql(
+                    partition_index_name, iter_partition_name, column_name_list, unique, postgresql_using, postgresql_where,
+                    concurrently=True, only=False))
+
+            is_attached = op.get_bind().execute(
+                sa.text("SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child) AND inhparent = to_regclass(:parent))"),
+                {"child": MigrationUtils.quote(partition_index_name), "parent": MigrationUtils.quote(index_name)}).scalar_one()
+
+            if not is_attached:
+                MigrationUtils.run_with_lock_timeout(lambda: op.execute(
+                    f"ALTER INDEX {MigrationUtils.quote(index_name)} ATTACH PARTITION {MigrationUtils.quote(partition_index_name)}"))
+
+    @staticmethod
+    def drop_index_concurrently(index_name:str, table_name:str):
+        '''
+        drops the index without blocking the table
+
+        an index on a partitioned table can't be dropped concurrently, so that one is dropped normally
+        (it is quick, but needs a short exclusive lock on every partition) with the lock timeout retries
+        '''
+
+        if MigrationUtils.get_partition_name_list(table_name) is None:
+
+            with op.get_context().autocommit_block():
+
+                logger.info("dropping index `%s` concurrently", index_name)
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {MigrationUtils.quote(index_name)}")
+
+        else:
+
+            MigrationUtils.run_with_lock_timeout(lambda: op.execute(f"DROP INDEX IF EXISTS {MigrationUtils.quote(index_name)}"))
+
+    @staticmethod
+    def batched_backfill(
+        backfill_name:str,
+        table_name:str,
+        key_column_name:str,
+        set_sql:str,
+        where_sql:str|None=None,
+        batch_size:int=constants.MIGRATION_BACKFILL_DEFAULT_BATCH_SIZE,
+        sleep_seconds:float=constants.MIGRATION_BACKFILL_DEFAULT_SLEEP_SECONDS,
+        lock_timeout_milliseconds:int=constants.MIGRATION_DEFAULT_LOCK_TIMEOUT_MILLISECONDS):
+        '''
+        runs `UPDATE <table> SET <set_sql> [WHERE <where_sql>]` in batches of `batch_size` rows, in the
+        order of `key_column_name`, committing after every batch and sleeping in between so the scrapers
+        (and autovacuum, and any replicas) can keep up
+
+        each batch updates its rows and moves the `migration_backfill_checkpoint` row for `backfill_name`
+        in the same statement, so if the migration is interrupted, running it again starts after the last
+        committed batch. the checkpoint is deleted once the backfill is done
+
+        a batch that can't get its row locks within the lock timeout is retried, see `run_with_lock_timeout`
+
+        @param backfill_name - names the checkpoint, unique per backfill
+        @param key_column_name - a unique, indexed integer column (normally the primary key)
+        @param set_sql - the SET list, as SQL
+        @param where_sql - only update the rows that match, as SQL. with this, a batch that was already
+        done is skipped even without the checkpoint
+        '''
+
+        quoted_table_name = MigrationUtils.quote(table_name)
+        quoted_key_column_name = MigrationUtils.quote(key_column_name)
+
+        batch_statement = sa.text(f'''
+            WITH batch AS (
+                SELECT {quoted_key_column_name} AS batch_key FROM {quoted_table_name}
+                WHERE {quoted_key_column_name} > :last_key {f"AND ({where_sql})" if where_sql else ""}
+                ORDER BY {quoted_key_column_name}
+                LIMIT :batch_size
+            ), updated AS (
+                UPDATE {quoted_table_name} SET {set_sql}
+                FROM batch WHERE {quoted_table_name}.{quoted_key_column_name} = batch.batch_key
+                RETURNING {quoted_table_name}.{quoted_key_column_name} AS updated_key
+            )
+            INSERT INTO migration_backfill_checkpoint (backfill_name, last_key, rows_done, date_updated)
+            SELECT :backfill_name, MAX(updated_key), COUNT(*), now() FROM updated
+            HAVING COUNT(*) > 0
+            ON CONFLICT (backfill_name) DO UPDATE SET
+                last_key = EXCLUDED.last_key,
+                rows_done = migration_backfill_checkpoint.rows_done + EXCLUDED.rows_done,
+                date_updated = EXCLUDED.date_updated
+            RETURNING last_key, rows_done
+        ''')
+
+        sqla_connection = op.get_bind()
+
+        checkpoint_row = sqla_connection.execute(
+            sa.text("SELECT last_key, rows_done FROM migration_backfill_checkpoint WHERE backfill_name = :backfill_name"),
+            {"backfill_name": backfill_name}).one_or_none()
+
+        if checkpoint_row is not None:
+            logger.info("resuming backfill `%s` after key `%s`, `%s` rows were already done", backfill_name, checkpoint_row.last_key, checkpoint_row.rows_done)
+            last_key, rows_done = checkpoint_row.last_key, checkpoint_row.rows_done
+        else:
+            # below any key, the smallest `integer`
+            last_key, rows_done = -2147483648, 0
+
+        start_time = time.monotonic()
+        rows_done_at_start = rows_done
+
+        while True:
+
+            result_list = []
+
+            def _run_one_batch():
+
+                result_list.append(sqla_connection.execute(batch_statement, {
+                    "last_key": last_key, "batch_size": batch_size, "backfill_name": backfill_name}).one_or_none())
+
+            MigrationUtils.run_with_lock_timeout(_run_one_batch, lock_timeout_milliseconds=lock_timeout_milliseconds)
+
+            batch_row = result_list[-1]
+
+            if batch_row is None:
+                break
+
+            last_key, rows_done = batch_row.last_key, batch_row.rows_done
+
+            logger.info("backfill `%s`: `%s` rows done, up to key `%s` (`%.0f` rows/s)",
+                backfill_name, rows_done, last_key, (rows_done - rows_done_at_start) / max(time.monotonic() - start_time, 0.001))
+
+            time.sleep(sleep_seconds)
+
+        with op.get_context().autocommit_block():
+            sqla_connection.execute(
+                sa.text("DELETE FROM migration_backfill_checkpoint WHERE backfill_name = :backfill_name"),
+                {"backfill_name": backfill_name})
+
+        logger.info("backfill `%s` is done, `%s` rows", backfill_name, rows_done)
@@ -16,6 +16,7 @@ class Settings:
     cookie_jar:CookieJar = attr.ib()
     header_jar:HeaderJar = attr.ib()
     sqla_url:URL = attr.ib()
+    database_pool_settings:DatabasePoolSettings = attr.ib()
     logging_config:dict = attr.ib()
     rabbitmq_url:yarl.URL = attr.ib()
     rabbitmq_queue_name:str = attr.ib()
@@ -31,6 +32,30 @@ class Settings:
     operator_name:str = attr.ib()
     user_agent:str = attr.ib()
     queue_latest_submissions_settings:QueueLatestSubmissionsSettings = attr.ib()
+    warc_compression_format:WarcCompressionFormat = attr.ib()
+    blob_store_settings:BlobStoreSettings = attr.ib()
+
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class BlobStoreSettings:
+    store_type:BlobStoreType = attr.ib()
+    # only for BlobStoreType.LOCAL_FILESYSTEM
+    local_folder:pathlib.Path|None = attr.ib()
+
+@attr.s(auto_attribs=True, frozen=True, kw_only=True)
+class DatabasePoolSettings:
+    pool_size:int = attr.ib()
+    max_overflow:int = attr.ib()
+    pool_timeout_seconds:float = attr.ib()
+    pool_pre_ping:bool = attr.ib()
+    # -1 never recycles
+    pool_recycle_seconds:int = attr.ib()
+    # sqlalchemy's per connection cache of asyncpg prepared statements, 0 to disable (needed behind pgbouncer)
+    prepared_statement_cache_size:int = attr.ib()
+    # asyncpg's own statement cache, 0 to disable (needed behind pgbouncer)
+    statement_cache_size:int = attr.ib()
+    # 0 to never log the pool metrics
+    metrics_log_interval_seconds:float = attr.ib()
 
 
 @attr.define(frozen=True)
@@ -126,7 +151,92 @@ class WarcatRecordInformation:
     content_type:str
     warc_target_uri:str
 
+@frozen
+class WarcRecordIndexEntry:
+    '''
+    the location of a single record inside of a per record compressed warc file,
+    offset and length are of the compressed gzip member / zstd frame
+    '''
+    offset:int
+    length:int
+    warc_record_id:str
+    warc_type:str
+    content_type:str|None
+    warc_target_uri:str|None
+
+@frozen
+class WarcRecord:
+    headers:dict
+    block:bytes = field(repr=False)
+
+
+
+@frozen
+class CompressionBenchmarkCase:
+    scheme:CompressionScheme
+    level:int
+
+@frozen
+class CompressionBenchmarkResult:
+    '''
+    the totals for compressing and then decompressing every item in the corpus
+    with one CompressionBenchmarkCase
+    '''
+    case:CompressionBenchmarkCase
+    number_of_items:int
+    original_bytes:int
+    compressed_bytes:int
+    compress_seconds:float
+    decompress_seconds:float
+    # the max resident set size of the worker process, or of the 7z process
+    peak_memory_bytes:int
 
+@frozen
+class RecompressItemResult:
+    '''
+    the result of recompressing one row or file for the recompress_archive subcommand
+
+    item_key is the primary key of the row, or the path of the file relative to the folder
+    '''
+    item_key:int|str
+    old_size:int
+    new_size:int
+    old_compressed_sha512:str|None = None
+    new_compressed_sha512:str|None = None
+    # set for rows
+    new_compressed_data:bytes|None = field(default=None, repr=False)
+    # set for files, these are written next to the original with a partial suffix
+    new_file_path:pathlib.Path|None = None
+    new_record_index_file_path:pathlib.Path|None = None
+    # set if the round trip verification failed, in which case nothing should be swapped
+    error_string:str|None = None
+
+@frozen
+class ArchiveFileHashResult:
+    file_path:pathlib.Path
+    attempt_id:int|None
+    sha512:str
+    length:int
+
+@frozen
+class ArchiveProblem:
+    '''
+    something verify_archive found wrong with a file on the storage host
+    '''
+    problem_type:ArchiveProblemType
+    file_path:pathlib.Path|None
+    attempt_id:int|None
+    expected:str|None = None
+    actual:str|None = None
+
+@frozen
+class SubmissionIdRange:
+    # both ends are inclusive
+    range_start:int
+    range_end:int
+
+    def length(self) -> int:
+        return self.range_end - self.range_start + 1
 
 @attr.s(auto_attribs=True, frozen=True, kw_only=True)
 class RabbitmqMessageInfo:
@@ -142,6 +252,8 @@ class SubmissionStatus(enum.Enum):
 
 class ProcessedStatus(enum.Enum):
     TODO = "todo"
+    # claimed by a worker, see `claimed_by` / `lease_expires` on the row
+    IN_PROGRESS = "in_progress"
     FINISHED = "finished"
     ERROR = "error"
 
@@ -157,6 +269,54 @@ class FuraffinitySubmissionStatus(enum.Enum):
     MAINTENANCE = "maintenance"
     UNKNOWN = "unknown"
 
+class WarcCompressionFormat(enum.Enum):
+    # the whole warc in one solid 7z archive
+    SEVENZIP = "7z"
+    # every warc record is its own gzip member
+    WARC_GZ = "warc_gz"
+    # every warc record is its own zstd frame
+    WARC_ZST = "warc_zst"
+
+class CompressionScheme(enum.Enum):
+    GZIP = "gzip"
+    XZ = "xz"
+    TAR_XZ = "tar_xz"
+    ZSTD = "zstd"
+    ZSTD_WITH_DICTIONARY = "zstd_with_dictionary"
+    SEVENZIP = "7z"
+
+class BlobStoreType(enum.Enum):
+    # keep the compressed webpages inline in the database like before
+    DATABASE = "database"
+    # files in a folder keyed by the compressed sha512, see blob_store
+    LOCAL_FILESYSTEM = "local_filesystem"
+
+class BlobStorageLocation(enum.Enum):
+    # in the row's raw_compressed_webpage_data column
+    DATABASE = "database"
+    # in the blob store, keyed by the row's compressed_data_sha512
+    BLOB_STORE = "blob_store"
+
+class RecompressSource(enum.Enum):
+    # the deduplicated pages in `submission_webpage_blob`
+    WEBPAGE_BLOBS = "webpage_blobs"
+    # older `submission_webpage` rows that still have the page inline
+    WEBPAGES = "webpages"
+    # `.warc.7z` files in a folder
+    WARC_FILES = "warc_files"
+
+class ArchiveProblemType(enum.Enum):
+    # the file's sha512 doesn't match fa_scrape_content.content_sha512
+    SHA512_MISMATCH = "sha512_mismatch"
+    # the file's size doesn't match fa_scrape_content.content_length
+    LENGTH_MISMATCH = "length_mismatch"
+    # a fa_scrape_content row that should be on disk but we didn't find a file for it
+    MISSING_FILE = "missing_file"
+    # a file that doesn't have a fa_scrape_content row
+    ORPHAN_FILE = "orphan_file"
+    # we got an error reading the file
+    UNREADABLE_FILE = "unreadable_file"
+
 class FuraffinitySubmissionType(enum.Enum):
     ART = "art"
     FLASH = "flash"
@@ -0,0 +1,313 @@
+from __future__ import annotations
+import logging
+import asyncio
+import pathlib
+import tempfile
+import resource
+import time
+import concurrent.futures
+
+import bitmath
+import zstandard
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import model
+from furaffinity_scrape import constants
+from furaffinity_scrape import compression_utils
+
+logger = logging.getLogger(__name__)
+
+def run_compression_benchmark_case(
+    case:model.CompressionBenchmarkCase,
+    corpus_path_list:list[pathlib.Path],
+    sevenzip_path:pathlib.Path,
+    zstd_dict_bytes:bytes|None) -> model.CompressionBenchmarkResult:
+    '''
+    compresses and decompresses every item in the corpus with one scheme and level
+
+    this is run in a brand new process for every case, so the max resident set size
+    of the process (or of the 7z child processes) only reflects this case
+
+    @param case - the scheme and level to benchmark
+    @param corpus_path_list - the uncompressed corpus items
+    @param sevenzip_path - path to 7z
+    @param zstd_dict_bytes - the zstd dictionary, or None if we aren't testing dictionaries
+    @return the totals for the whole corpus
+    '''
+
+    cu = compression_utils.CompressionUtils
+
+    zstd_dict = zstandard.ZstdCompressionDict(zstd_dict_bytes) if zstd_dict_bytes is not None else None
+
+    original_bytes = 0
+    compressed_bytes = 0
+    compress_seconds = 0.0
+    decompress_seconds = 0.0
+
+    # one item at a time so the peak memory is the codec, and not all of the compressed output
+    for iter_path in corpus_path_list:
+
+        iter_data = iter_path.read_bytes()
+
+        start_time = time.perf_counter()
+        compressed_data = cu.compress(case.scheme, case.level, iter_data, sevenzip_path=sevenzip_path, zstd_dict=zstd_dict)
+        compress_seconds += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        decompressed_data = cu.decompress(case.scheme, compressed_data, sevenzip_path=sevenzip_path, zstd_dict=zstd_dict)
+        decompress_seconds += time.perf_counter() - start_time
+
+        if decompressed_data != iter_data:
+            raise Exception(f"`{case}` did not round trip the data in `{iter_path}`")
+
+        original_bytes += len(iter_data)
+        compressed_bytes += len(compressed_data)
+
+    # ru_maxrss is in kilobytes on linux, for the in process codecs this includes the interpreter
+    # itself, which is the same for every case, so compare the cases against each other
+    if case.scheme == model.CompressionScheme.SEVENZIP:
+        peak_memory_bytes = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    else:
+        peak_memory_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return model.CompressionBenchmarkResult(
+        case=case,
+        number_of_items=len(corpus_path_list),
+        original_bytes=original_bytes,
+        compressed_bytes=compressed_bytes,
+        compress_seconds=compress_seconds,
+        decompress_seconds=decompress_seconds,
+        peak_memory_bytes=peak_memory_bytes)
+
+class BenchmarkCompression:
+
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("benchmark_compression")
+
+        parser.add_argument("--corpus",
+            dest="corpus",
+            type=utils.isDirectoryType,
+            required=True,
+            help="folder of WARCs (.warc, .warc.gz, .warc.zst, .warc.7z) or stored pages (.tar.xz) to benchmark with")
+
+        parser.add_argument("--max-files",
+            dest="max_files",
+            type=int,
+            default=None,
+            help="only use this many files from the corpus")
+
+        parser.add_argument("--zstd-dict",
+            dest="zstd_dict",
+            type=utils.isFileType(True),
+            default=None,
+            help="zstd dictionary to use, if not given one is trained from the corpus, which makes the results optimistic")
+
+        parser.add_argument("--sevenzip-levels",
+            dest="sevenzip_levels",
+            type=int,
+            nargs="*",
+            default=constants.BENCHMARK_COMPRESSION_DEFAULT_SEVENZIP_LEVELS,
+            help="7z -mx levels to test, pass no values to skip 7z")
+
+        parser.add_argument("--xz-presets",
+            dest="xz_presets",
+            type=int,
+            nargs="*",
+            default=constants.BENCHMARK_COMPRESSION_DEFAULT_XZ_PRESETS,
+            help="xz presets to test")
+
+        parser.add_argument("--zstd-levels",
+            dest="zstd_levels",
+            type=int,
+            nargs="*",
+            default=constants.BENCHMARK_COMPRESSION_DEFAULT_ZSTD_LEVELS,
+            help="zstd levels to test, with and without a dictionary")
+
+        parser.add_argument("--gzip-levels",
+            dest="gzip_levels",
+            type=int,
+            nargs="*",
+            default=constants.BENCHMARK_COMPRESSION_DEFAULT_GZIP_LEVELS,
+            help="gzip levels to test")
+
+        benchmark_obj = BenchmarkCompression()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=benchmark_obj.run)
+
+
+    def __init__(self):
+
+        self.config = None
+        self.stop_event = None
+
+    async def run(self, parsed_args, stop_event):
+
+        self.config = parsed_args.config
+        self.stop_event = stop_event
+
+        self.config.temp_folder.mkdir(exist_ok=True)
+
+        corpus_file_list = self.get_corpus_file_list(parsed_args.corpus, parsed_args.max_files)
+        logger.info("using `%s` files from the corpus at `%s`", len(corpus_file_list), parsed_args.corpus)
+
+        if len(corpus_file_list) == 0:
+            logger.error("no files found in the corpus, nothing to benchmark")
+            return
+
+        with tempfile.TemporaryDirectory(dir=self.config.temp_folder, prefix="benchmark_compression_") as d:
+
+            # decompress the corpus once up front, so every case reads the same uncompressed items
+            uncompressed_path_list = []
+            for idx, iter_path in enumerate(corpus_file_list):
+
+                uncompressed_data = await asyncio.to_thread(
+                    compression_utils.CompressionUtils.load_uncompressed_data,
+                    iter_path,
+                    self.config.sevenzip_path)
+
+                uncompressed_path = pathlib.Path(d) / f"corpus_item_{idx}"
+                uncompressed_path.write_bytes(uncompressed_data)
+                uncompressed_path_list.append(uncompressed_path)
+
+            zstd_dict_bytes = await asyncio.to_thread(self.get_zstd_dict_bytes, parsed_args.zstd_dict, uncompressed_path_list)
+
+            case_list = self.get_benchmark_cases(parsed_args, zstd_dict_bytes is not None)
+
+            result_list = []
+
+            # max_tasks_per_child=1 so every case gets a brand new process, otherwise the
+            # max resident set size would carry over from the previous case
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+
+                for iter_case in case_list:
+
+                    if self.stop_event.is_set():
+                        logger.info("stop event is set, not running the rest of the cases")
+                        break
+
+                    logger.info("benchmarking `%s` level `%s`", iter_case.scheme.value, iter_case.level)
+
+                    iter_result = await asyncio.get_running_loop().run_in_executor(
+                        executor,
+                        run_compression_benchmark_case,
+                        iter_case,
+                        uncompressed_path_list,
+                        self.config.sevenzip_path,
+                        zstd_dict_bytes if iter_case.scheme == model.CompressionScheme.ZSTD_WITH_DICTIONARY else None)
+
+                    result_list.append(iter_result)
+
+        self.log_result_table(result_list)
+
+    def get_corpus_file_list(self, corpus_folder:pathlib.Path, max_files:int|None) -> list[pathlib.Path]:
+
+        result_list = []
+
+        for dirpath, dirnames, filenames in corpus_folder.walk(top_down=True):
+
+            # sort so that runs with --max-files pick the same files every time
+            dirnames.sort()
+
+            for iter_file in sorted(filenames):
+
+                # the record index of a per record compressed warc isn't part of the corpus
+                if iter_file.endswith(constants.WARC_RECORD_INDEX_SUFFIX):
+                    continue
+
+                result_list.append(dirpath / iter_file)
+
+                if max_files is not None and len(result_list) >= max_files:
+                    return result_list
+
+        return result_list
+
+    def get_zstd_dict_bytes(self, zstd_dict_path:pathlib.Path|None, uncompressed_path_list:list[pathlib.Path]) -> bytes|None:
+        '''
+        loads the zstd dictionary from disk if one was given, otherwise trains one from the corpus
+
+        @return the dictionary bytes, or None if we couldn't train one
+        '''
+
+        if zstd_dict_path is not None:
+            logger.info("using zstd dictionary `%s`", zstd_dict_path)
+            return zstd_dict_path.read_bytes()
+
+        logger.warning("no zstd dictionary given, training one from the corpus, the dictionary results will be optimistic")
+
+        sample_list = [iter_path.read_bytes() for iter_path in uncompressed_path_list]
+
+        try:
+            zstd_dict = zstandard.train_dictionary(constants.ZSTD_DICTIONARY_SIZE, sample_list)
+        except Exception as e:
+            logger.warning("failed to train a zstd dictionary with `%s` samples, skipping the dictionary cases: `%s`", len(sample_list), e)
+            return None
+
+        logger.info("trained zstd dictionary `%s`", zstd_dict.dict_id())
+
+        return zstd_dict.as_bytes()
+
+    def get_benchmark_cases(self, parsed_args, have_zstd_dict:bool) -> list[model.CompressionBenchmarkCase]:
+
+        case_list = []
+
+        if parsed_args.sevenzip_levels and not self.config.sevenzip_path.exists():
+            logger.warning("7z was not found at `%s`, skipping the 7z cases", self.config.sevenzip_path)
+        else:
+            case_list.extend(model.CompressionBenchmarkCase(scheme=model.CompressionScheme.SEVENZIP, level=iter_level)
+                for iter_level in parsed_args.sevenzip_levels)
+
+        case_list.extend(model.CompressionBenchmarkCase(scheme=model.CompressionScheme.XZ, level=iter_level)
+            for iter_level in parsed_args.xz_presets)
+
+        case_list.extend(model.CompressionBenchmarkCase(scheme=model.CompressionScheme.ZSTD, level=iter_level)
+            for iter_level in parsed_args.zstd_levels)
+
+        if have_zstd_dict:
+            case_list.extend(model.CompressionBenchmarkCase(scheme=model.CompressionScheme.ZSTD_WITH_DICTIONARY, level=iter_level)
+                for iter_level in parsed_args.zstd_levels)
+
+        case_list.extend(model.CompressionBenchmarkCase(scheme=model.CompressionScheme.GZIP, level=iter_level)
+            for iter_level in parsed_args.gzip_levels)
+
+        return case_list
+
+    def log_result_table(self, result_list:list[model.CompressionBenchmarkResult]):
+
+        def _format_bytes(number_of_bytes):
+            return bitmath.Byte(number_of_bytes).best_prefix().format(constants.BITMATH_FORMATTING_STRING)
+
+        def _format_throughput(number_of_bytes, seconds):
+            if seconds <= 0:
+                return "n/a"
+            return _format_bytes(number_of_bytes / seconds) + "/s"
+
+        row_format = "{:<22} {:>5} {:>9} {:>14} {:>16} {:>16} {:>14}"
+
+        logger.info(row_format.format("scheme", "level", "ratio", "compressed", "compress", "decompress", "peak rss"))
+
+        for iter_result in result_list:
+
+            ratio = iter_result.original_bytes / iter_result.compressed_bytes if iter_result.compressed_bytes else 0
+
+            logger.info(row_format.format(
+                iter_result.case.scheme.value,
+                iter_result.case.level,
+                f"{ratio:.3f}",
+                _format_bytes(iter_result.compressed_bytes),
+                _format_throughput(iter_result.original_bytes, iter_result.compress_seconds),
+                _format_throughput(iter_result.original_bytes, iter_result.decompress_seconds),
+                _format_bytes(iter_result.peak_memory_bytes)))
+
+        if result_list:
+            logger.info("`%s` items, `%s` uncompressed", result_list[0].number_of_items, _format_bytes(result_list[0].original_bytes))
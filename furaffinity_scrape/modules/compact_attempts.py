@@ -0,0 +1,251 @@
+import logging
+import asyncio
+import datetime
+
+from sqlalchemy import select, delete, func, case, or_, and_, bindparam
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert, array_agg, aggregate_order_by
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import constants
+
+logger = logging.getLogger(__name__)
+
+class CompactAttempts:
+    '''
+    every retry of a submission leaves another fa_scrape_attempt row behind, this removes the failed
+    attempts that a newer attempt for the same submission has superseded and rolls them up into
+    `fa_scrape_attempt_error_history` (how many, the first and last date, the last error_string)
+
+    a failed attempt is an ERROR one, or a TODO one older than `--min-age-hours`, since when a scrape
+    fails the message is requeued and its attempt is just left as TODO. the newest attempt of a
+    submission is always kept, and so is any attempt that has fa_scrape_content rows
+
+    it goes through the submission ids a batch at a time, each batch is one statement in its own
+    transaction, with a sleep in between so it can run next to the scrapers
+    '''
+
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("compact_attempts")
+
+        parser.add_argument("--start",
+            dest="start",
+            type=int,
+            default=None,
+            help="the lowest submission id to compact, defaults to the lowest one with an attempt")
+
+        parser.add_argument("--end",
+            dest="end",
+            type=int,
+            default=None,
+            help="the highest submission id to compact, defaults to the highest one with an attempt")
+
+        parser.add_argument("--batch-size",
+            dest="batch_size",
+            type=int,
+            default=constants.COMPACT_ATTEMPTS_DEFAULT_BATCH_SIZE,
+            help="how many submission ids to compact per transaction")
+
+        parser.add_argument("--sleep",
+            dest="sleep_seconds",
+            type=float,
+            default=constants.COMPACT_ATTEMPTS_DEFAULT_SLEEP_SECONDS,
+            help="how long to sleep between batches, in seconds")
+
+        parser.add_argument("--min-age-hours",
+            dest="min_age_hours",
+            type=float,
+            default=constants.COMPACT_ATTEMPTS_DEFAULT_MIN_AGE_HOURS,
+            help="TODO attempts younger than this might still be running, so they are not compacted")
+
+        compact_attempts_obj = CompactAttempts()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=compact_attempts_obj.run)
+
+
+    def __init__(self):
+
+        self.config = None
+        self.sqla_engine = None
+        self.async_sessionmaker = None
+        self.stop_event = None
+
+    @staticmethod
+    def build_compact_statement():
+        '''
+        builds the statement that compacts one batch, it is one statement with data modifying CTEs:
+
+        * `superseded_attempt` - the failed attempts in the batch that have a newer attempt
+        * `deleted_attempt` - deletes them from fa_scrape_attempt
+        * `upserted_history` - rolls them up per submission and adds them to fa_scrape_attempt_error_history
+
+        params: batch_start, batch_end (both inclusive), todo_cutoff
+
+        @return a select of the number of attempts deleted and the number of history rows written
+        '''
+
+        attempt_table = db_model.FAScrapeAttempt.__table__
+        newer_attempt_table = attempt_table.alias("newer_attempt")
+        content_table = db_model.FAScrapeContent.__table__
+        history_table = db_model.FAScrapeAttemptErrorHistory.__table__
+
+        superseded_cte = select(attempt_table.c.scrape_attempt_id, attempt_table.c.furaffinity_submission_id) \
+            .where(attempt_table.c.furaffinity_submission_id.between(bindparam("batch_start"), bindparam("batch_end"))) \
+            .where(or_(
+                attempt_table.c.processed_status == model.ProcessedStatus.ERROR,
+                and_(
+                    attempt_table.c.processed_status == model.ProcessedStatus.TODO,
+                    attempt_table.c.date_visited < bindparam("todo_cutoff")))) \
+            .where(select(newer_attempt_table.c.scrape_attempt_id)
+                .where(newer_attempt_table.c.furaffinity_submission_id == attempt_table.c.furaffinity_submission_id)
+                .where(newer_attempt_table.c.scrape_attempt_id > attempt_table.c.scrape_attempt_id)
+                .exists()) \
+            .where(~select(content_table.c.content_id)
+                .where(content_table.c.attempt_id == attempt_table.c.scrape_attempt_id)
+                .where(content_table.c.furaffinity_submission_id == attempt_table.c.furaffinity_submission_id)
+                .exists()) \
+            .with_for_update(skip_locked=True) \
+            .cte("superseded_attempt")
+
+        # the id range is repeated here so postgres only looks at the partitions for the batch
+        deleted_cte = delete(attempt_table) \
+            .where(attempt_table.c.furaffinity_submission_id.between(bindparam("batch_start"), bindparam("batch_end"))) \
+            .where(attempt_table.c.scrape_attempt_id == superseded_cte.c.scrape_attempt_id) \
+            .where(attempt_table.c.furaffinity_submission_id == superseded_cte.c.furaffinity_submission_id) \
+            .returning(
+                attempt_table.c.scrape_attempt_id,
+                attempt_table.c.furaffinity_submission_id,
+                attempt_table.c.date_visited,
+                attempt_table.c.error_string) \
+            .cte("deleted_attempt")
+
+        rolled_up_select = select(
+                deleted_cte.c.furaffinity_submission_id,
+                func.count(),
+                func.min(deleted_cte.c.date_visited),
+                func.max(deleted_cte.c.date_visited),
+                array_agg(aggregate_order_by(deleted_cte.c.error_string, deleted_cte.c.scrape_attempt_id.desc()))[1]) \
+            .group_by(deleted_cte.c.furaffinity_submission_id)
+
+        insert_statement = insert(history_table).from_select(
+            ["furaffinity_submission_id", "error_count", "first_error_date", "last_error_date", "last_error_string"],
+            rolled_up_select)
+
+        upserted_cte = insert_statement.on_conflict_do_update(
+                index_elements=[history_table.c.furaffinity_submission_id],
+                set_={
+                    "error_count": history_table.c.error_count + insert_statement.excluded.error_count,
+                    "first_error_date": func.least(history_table.c.first_error_date, insert_statement.excluded.first_error_date),
+                    "last_error_date": func.greatest(history_table.c.last_error_date, insert_statement.excluded.last_error_date),
+                    "last_error_string": case(
+                        (insert_statement.excluded.last_error_date >= history_table.c.last_error_date, insert_statement.excluded.last_error_string),
+                        else_=history_table.c.last_error_string),
+                }) \
+            .returning(history_table.c.furaffinity_submission_id) \
+            .cte("upserted_history")
+
+        return select(
+            select(func.count()).select_from(deleted_cte).scalar_subquery(),
+            select(func.count()).select_from(upserted_cte).scalar_subquery())
+
+    async def run(self, parsed_args, stop_event):
+
+        self.config = parsed_args.config
+        self.stop_event = stop_event
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
+
+        try:
+
+            self.async_sessionmaker = sessionmaker(
+                bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
+            )
+
+            await self.compact(parsed_args.start, parsed_args.end, parsed_args.batch_size, parsed_args.sleep_seconds, parsed_args.min_age_hours)
+
+        finally:
+            await self.close_stuff()
+
+    async def compact(self, start:int|None, end:int|None, batch_size:int, sleep_seconds:float, min_age_hours:float):
+
+        async with self.async_sessionmaker() as sqla_session:
+
+            bounds_result = await sqla_session.execute(select(
+                func.min(db_model.FAScrapeAttempt.furaffinity_submission_id),
+                func.max(db_model.FAScrapeAttempt.furaffinity_submission_id)))
+            lowest_id, highest_id = bounds_result.one()
+
+        start = start if start is not None else lowest_id
+        end = end if end is not None else highest_id
+
+        if start is None or end is None:
+            logger.info("there are no attempts and no --start / --end was given, nothing to do")
+            return
+
+        if start > end:
+            raise Exception(f"--start `{start}` is after --end `{end}`")
+
+        compact_statement = CompactAttempts.build_compact_statement()
+        todo_cutoff = utils.utcnow() - datetime.timedelta(hours=min_age_hours)
+
+        logger.info("compacting the attempts for submission ids `%s` to `%s`, `%s` ids at a time, leaving TODO attempts newer than `%s` alone",
+            start, end, batch_size, todo_cutoff)
+
+        number_of_attempts_deleted = 0
+        number_of_history_rows_written = 0
+        batch_start = start
+
+        while batch_start <= end:
+
+            if self.stop_event.is_set():
+                logger.info("stop event is set, stopping before submission id `%s`", batch_start)
+                break
+
+            batch_end = min(batch_start + batch_size - 1, end)
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                async with sqla_session.begin():
+
+                    compact_result = await sqla_session.execute(compact_statement, {
+                        "batch_start": batch_start,
+                        "batch_end": batch_end,
+                        "todo_cutoff": todo_cutoff})
+
+                    batch_attempts_deleted, batch_history_rows_written = compact_result.one()
+
+            number_of_attempts_deleted += batch_attempts_deleted
+            number_of_history_rows_written += batch_history_rows_written
+
+            if batch_attempts_deleted:
+                logger.info("submission ids `%s` to `%s`: compacted `%s` attempts of `%s` submissions, `%s` compacted so far",
+                    batch_start, batch_end, batch_attempts_deleted, batch_history_rows_written, number_of_attempts_deleted)
+            else:
+                logger.debug("submission ids `%s` to `%s`: nothing to compact", batch_start, batch_end)
+
+            batch_start = batch_end + 1
+
+            await asyncio.sleep(sleep_seconds)
+
+        logger.info("done, compacted `%s` attempts into `%s` history rows, the space is reused by new rows after the next VACUUM of `%s`",
+            number_of_attempts_deleted, number_of_history_rows_written, db_model.FAScrapeAttempt.__tablename__)
+
+    async def close_stuff(self):
+
+        if self.sqla_engine:
+            logger.info("closing sqla engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
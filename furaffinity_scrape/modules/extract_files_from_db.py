@@ -2,20 +2,56 @@ import logging
 import json
 import asyncio
 import pathlib
+import os
+import concurrent.futures
 
 import aio_pika
 
 import arrow
-from sqlalchemy import select, desc, text, func
+import bitmath
+from sqlalchemy import select, update, desc, text, func
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import insert
 
 from furaffinity_scrape import utils
 from furaffinity_scrape import db_model
+from furaffinity_scrape import constants
 
 logger = logging.getLogger(__name__)
 
+
+def write_content_file(file_path:pathlib.Path, content_binary:bytes) -> int:
+    '''
+    writes one file without fsyncing it, the batch is fsynced together by `fsync_paths`
+
+    this runs on the thread pool
+
+    @return the number of bytes written
+    '''
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(file_path, "wb") as f:
+        f.write(content_binary)
+
+    return len(content_binary)
+
+def fsync_paths(path_list:list[pathlib.Path]):
+    '''
+    fsyncs every file or directory in the list, this runs on the thread pool
+    '''
+
+    for iter_path in path_list:
+
+        fd = os.open(iter_path, os.O_RDONLY)
+
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
 class ExtractFilesFromDb:
 
 
@@ -31,6 +67,24 @@ class ExtractFilesFromDb:
 
         parser = argparse_subparser.add_parser("extract_files_from_db")
 
+        parser.add_argument("--output-folder",
+            dest="output_folder",
+            type=utils.isDirectoryType,
+            required=True,
+            help="the folder to write the files to, they go into subfolders named after the start of their sha512")
+
+        parser.add_argument("--batch-size",
+            dest="batch_size",
+            type=int,
+            default=constants.EXTRACT_FILES_FROM_DB_DEFAULT_BATCH_SIZE,
+            help="how many rows to write, fsync and clear in the database at once")
+
+        parser.add_argument("--workers",
+            dest="workers",
+            type=int,
+            default=constants.EXTRACT_FILES_FROM_DB_DEFAULT_WORKERS,
+            help="how many threads to write files with")
+
         extract_files_from_db = ExtractFilesFromDb()
 
         # set the function that is called when this command is used
@@ -40,12 +94,25 @@ class ExtractFilesFromDb:
     def __init__(self):
 
         self.config = None
+        self.sqla_engine = None
+        self.async_sessionmaker = None
+        self.stop_event = None
+        self.output_folder = None
+        self.batch_size = None
+        self.thread_pool = None
+
+        self.files_written = 0
+        self.bytes_written = 0
+        self.rows_cleared = 0
 
     async def run(self, parsed_args, stop_event):
 
         self.config = parsed_args.config
-        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url)
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
         self.stop_event = stop_event
+        self.output_folder = parsed_args.output_folder
+        self.batch_size = parsed_args.batch_size
+        self.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=parsed_args.workers)
 
         try:
 
@@ -55,85 +122,153 @@ class ExtractFilesFromDb:
                 bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
             )
 
-            number_of_rows = 0
-            async with self.async_sessionmaker() as sqla_session:
+            logger.info("extracting files to `%s` in batches of `%s` with `%s` threads",
+                self.output_folder, self.batch_size, parsed_args.workers)
 
-                # select_statement = select(db_model.User) \
-                # .filter(db_model.User.user_name.in_(users_found_set))
+            start_time = arrow.utcnow()
 
-                select_statement = select(func.count()).select_from(db_model.FAScrapeContent) \
-                    .filter(db_model.FAScrapeContent.content_binary != None)
-                select_result = await sqla_session.execute(select_statement)
-                number_of_rows = select_result.scalars().all()[0]
+            # read the next batch while the files from the current one are being written
+            next_batch_task = asyncio.create_task(self.fetch_batch(0))
 
-            logger.info("number of rows: `%s`", number_of_rows)
+            while True:
 
+                row_list = await next_batch_task
 
-            for i in range(0, number_of_rows):
+                if not row_list:
+                    logger.info("no more rows with content_binary set")
+                    break
 
                 if self.stop_event.is_set():
                     logger.info("Stop event is set, breaking")
                     break
 
-                async with self.async_sessionmaker() as sqla_session:
+                next_batch_task = asyncio.create_task(self.fetch_batch(row_list[-1].content_id))
+
+                try:
+                    await self.extract_batch(row_list)
+                except Exception as e:
+                    next_batch_task.cancel()
+                    raise e
+
+            elapsed_seconds = (arrow.utcnow() - start_time).total_seconds()
+
+            logger.info("wrote `%s` files, `%s` (`%s`/s), cleared content_binary on `%s` rows in `%.1f` seconds",
+                self.files_written,
+                bitmath.Byte(self.bytes_written).best_prefix().format(constants.BITMATH_FORMATTING_STRING),
+                bitmath.Byte(self.bytes_written / max(elapsed_seconds, 0.001)).best_prefix().format(constants.BITMATH_FORMATTING_STRING),
+                self.rows_cleared,
+                elapsed_seconds)
+
+        except Exception as e:
+            logger.exception("uncaught exception")
+            await self.close_stuff()
+            raise e
+
+        await self.close_stuff()
+
 
-                    async with sqla_session.begin():
+    async def close_stuff(self):
 
-                        stmt = select(db_model.FAScrapeContent).filter(db_model.FAScrapeContent.content_binary != None).limit(5)
+        if self.thread_pool:
+            self.thread_pool.shutdown(wait=True)
+            self.thread_pool = None
 
-                        select_result = await sqla_session.execute(stmt)
+        # make sure we dispose the engine because its not in an `async with` block
 
-                        results = select_result.all()
+        if self.sqla_engine:
+            logger.info("closing sqla engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
 
+    async def fetch_batch(self, last_content_id:int) -> list:
+        '''
+        gets the next batch of rows that still have content_binary, in keyset order
 
+        the rows are streamed through a server side cursor so the driver doesn't buffer a second
+        copy of every blob, and every batch is its own short transaction so we aren't holding a
+        snapshot open while the previous batches get cleared
 
-                        for iter_row in results:
+        @param last_content_id - the content_id of the last row of the previous batch
+        @return a list of rows with `content_id`, `attempt_id`, `content_sha512` and `content_binary`
+        '''
 
-                            for single_result in iter_row:
+        content_class = db_model.FAScrapeContent
 
-                                # see if we already deleted it
-                                if len(single_result.content_binary) == 0:
-                                    # set it to be null and continue
-                                    logger.info("`%s` already had it's content deleted, setting it to null and continuing", iter_row)
-                                    single_result.content_binary = None
-                                    continue
+        select_statement = select(
+                content_class.content_id,
+                content_class.attempt_id,
+                content_class.content_sha512,
+                content_class.content_binary) \
+            .where(content_class.content_id > last_content_id) \
+            .where(content_class.content_binary != None) \
+            .order_by(content_class.content_id) \
+            .limit(self.batch_size) \
+            .execution_options(yield_per=self.batch_size)
 
+        async with self.async_sessionmaker() as sqla_session:
 
-                                folder = pathlib.Path("/mnt/g/fascrape/")
-                                sha_prefix_folder_name = single_result.content_sha512[0:3]
-                                full_folder_name = folder / sha_prefix_folder_name
+            async with sqla_session.begin():
 
-                                # create the folder if it doesn't exist
-                                if not full_folder_name.exists():
-                                    logger.info("Creating folder `%s`", full_folder_name)
-                                    full_folder_name.mkdir()
+                stream_result = await sqla_session.stream(select_statement)
 
+                return [iter_row async for iter_row in stream_result]
 
-                                filename = full_folder_name / f"fascrape_content_cid-{single_result.content_id}_aid-{single_result.attempt_id}.tar.xz"
-                                with open(filename, "wb") as f:
-                                    f.write(single_result.content_binary)
+    def get_file_path(self, row) -> pathlib.Path:
 
-                                logger.info("wrote `%s` bytes to `%s`", len(single_result.content_binary), filename)
+        sha_prefix_folder_name = row.content_sha512[0:constants.EXTRACT_FILES_FROM_DB_SHA_PREFIX_LENGTH]
 
-                                single_result.content_binary = None
+        return self.output_folder / sha_prefix_folder_name / f"fascrape_content_cid-{row.content_id}_aid-{row.attempt_id}.tar.xz"
 
-                        logger.debug("Committing...")
+    async def extract_batch(self, row_list:list):
+        '''
+        writes the files for a batch on the thread pool, fsyncs them (and their folders) together,
+        and only then sets content_binary to NULL for the whole batch in one UPDATE
+        '''
 
+        loop = asyncio.get_running_loop()
 
+        file_path_list = []
+        write_future_list = []
 
-        except Exception as e:
-            logger.exception("uncaught exception")
-            await self.close_stuff()
-            raise e
+        for iter_row in row_list:
 
-        await self.close_stuff()
+            # see if we already deleted it, those just get set to null along with the rest of the batch
+            if len(iter_row.content_binary) == 0:
+                logger.info("content_id `%s` already had it's content deleted, setting it to null", iter_row.content_id)
+                continue
 
+            file_path = self.get_file_path(iter_row)
+            file_path_list.append(file_path)
 
-    async def close_stuff(self):
+            write_future_list.append(loop.run_in_executor(
+                self.thread_pool, write_content_file, file_path, iter_row.content_binary))
 
-        # make sure we dispose the engine because its not in an `async with` block
+        bytes_written_list = await asyncio.gather(*write_future_list)
 
-        if self.sqla_engine:
-            logger.info("closing sqla engine")
-            await self.sqla_engine.dispose()
-            self.sqla_engine = None
+        # fsync the files, spread over the thread pool, then the folders they are in so the new directory
+        # entries are durable too, before we throw away the only other copy
+        fsync_future_list = [loop.run_in_executor(self.thread_pool, fsync_paths, [iter_path]) for iter_path in file_path_list]
+        await asyncio.gather(*fsync_future_list)
+
+        folder_list = sorted(set(iter_path.parent for iter_path in file_path_list))
+        await loop.run_in_executor(self.thread_pool, fsync_paths, folder_list + [self.output_folder])
+
+        content_class = db_model.FAScrapeContent
+
+        update_statement = update(content_class) \
+            .where(content_class.content_id.in_([iter_row.content_id for iter_row in row_list])) \
+            .values(content_binary=None) \
+            .execution_options(synchronize_session=False)
+
+        async with self.async_sessionmaker() as sqla_session:
+
+            async with sqla_session.begin():
+
+                update_result = await sqla_session.execute(update_statement)
+
+        self.files_written += len(file_path_list)
+        self.bytes_written += sum(bytes_written_list)
+        self.rows_cleared += update_result.rowcount
+
+        logger.info("wrote `%s` files, `%s` bytes, cleared `%s` rows, up to content_id `%s`",
+            len(file_path_list), sum(bytes_written_list), update_result.rowcount, row_list[-1].content_id)
@@ -9,10 +9,12 @@ import json
 import io
 import base64
 import re
+import datetime
 
+from bs4 import BeautifulSoup
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select, desc, text
+from sqlalchemy import select, update, desc, text
 
 from furaffinity_scrape import utils
 from furaffinity_scrape import db_model
@@ -20,6 +22,8 @@ from furaffinity_scrape import model
 from furaffinity_scrape import constants
 from furaffinity_scrape import html_utils
 from furaffinity_scrape import file_utils
+from furaffinity_scrape import warc_utils
+from furaffinity_scrape import prebuilt_statements
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +50,30 @@ class FindFaHoles:
             required=True,
             help="path to warcat")
 
+        parser.add_argument("--run-id",
+            dest="run_id",
+            type=int,
+            default=None,
+            help="only work on the rows from this prescan run, otherwise rows from any run are claimed")
+
+        parser.add_argument("--batch-size",
+            dest="batch_size",
+            type=int,
+            default=constants.FIND_FA_HOLES_DEFAULT_BATCH_SIZE,
+            help="how many rows a worker claims at once")
+
+        parser.add_argument("--workers",
+            dest="workers",
+            type=int,
+            default=constants.FIND_FA_HOLES_DEFAULT_WORKERS,
+            help="how many rows to work on at the same time")
+
+        parser.add_argument("--lease-seconds",
+            dest="lease_seconds",
+            type=int,
+            default=constants.FIND_FA_HOLES_DEFAULT_LEASE_SECONDS,
+            help="how long a claimed batch is ours before other workers can reclaim it, should be longer than a batch takes")
+
         hole_obj = FindFaHoles()
 
         # set the function that is called when this command is used
@@ -58,6 +86,10 @@ class FindFaHoles:
         self.stop_event = None
         self.sqla_engine = None
         self.warcat_path = None
+        self.identity_string = None
+        self.run_id = None
+        self.batch_size = None
+        self.lease_seconds = None
 
         self.fa_url_regex = re.compile("")
 
@@ -66,7 +98,7 @@ class FindFaHoles:
 
         self.stop_event = stop_event
         self.config = parsed_args.config
-        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url)
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
 
         # expire_on_commit=False will prevent attributes from being expired
         # after commit.
@@ -75,41 +107,125 @@ class FindFaHoles:
         )
 
         self.warcat_path = parsed_args.warcat_path
+        self.run_id = parsed_args.run_id
+        self.batch_size = parsed_args.batch_size
+        self.lease_seconds = parsed_args.lease_seconds
+
+        self.identity_string = utils.get_identity_string()
+        logger.info("Our identity string is `%s`", self.identity_string)
+
+        try:
+
+            # every worker claims its own batches, SKIP LOCKED keeps them from waiting on or
+            # getting the same rows as each other (or as the workers on other machines)
+            worker_task_list = [asyncio.create_task(self.worker_loop(i)) for i in range(parsed_args.workers)]
+
+            await asyncio.gather(*worker_task_list)
+
+        finally:
+            await self.close_stuff()
+
+        logger.info("done!")
+
+    async def close_stuff(self):
+
+        if self.sqla_engine:
+            logger.debug("disposing sqlalchemy engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
+
+    async def worker_loop(self, worker_number:int):
 
         while True:
 
             if self.stop_event.is_set():
-                logger.info("stop event is set, breaking out early")
+                logger.info("worker `%s`: stop event is set, breaking out early", worker_number)
                 break
 
-            async with self.async_sessionmaker() as sqla_session:
+            claimed_row_list = await self.claim_batch()
 
+            logger.debug("worker `%s`: claimed `%s` rows", worker_number, len(claimed_row_list))
 
-                # pick out one unfinished row
-                query = select(db_model.FuraffinityHoleStatus)\
-                    .where(db_model.FuraffinityHoleStatus.processed_status == model.ProcessedStatus.TODO)\
-                    .limit(1)
-
-                query_result = await sqla_session.execute(query)
-                query_result_list = query_result.all()
+            if len(claimed_row_list) == 0:
+                logger.info("worker `%s`: got 0 rows back, seems to be no more rows to process, breaking out", worker_number)
+                break
 
-                logger.debug("query result got `%s` rows back", len(query_result_list) )
+            for iter_row in claimed_row_list:
 
-                if len(query_result_list) == 0:
-                    logger.info("got 0 rows back, seems to be no more processed rows, breaking out")
+                # rows we don't get to keep their claim, they get picked up again once the lease expires
+                if self.stop_event.is_set():
+                    break
 
-                    stop_event.signal()
+                try:
+                    fa_submission_status = await self.handle_one_row(iter_row)
+                except Exception as e:
+                    logger.exception("worker `%s`: failed to handle row `%s`", worker_number, iter_row)
+                    await self.finish_row(iter_row, model.ProcessedStatus.ERROR, model.FuraffinitySubmissionStatus.UNKNOWN)
                     continue
 
-                for iter_row in query_result_list:
-                    # a sequence of row objects, we want the row
-                    await self.handle_one_row(iter_row[0])
+                await self.finish_row(iter_row, model.ProcessedStatus.FINISHED, fa_submission_status)
 
+    async def claim_batch(self) -> list[db_model.FuraffinityHoleStatus]:
+        '''
+        claims up to batch_size rows in one statement, marking them IN_PROGRESS with us as the owner
+
+        this is an `UPDATE ... WHERE item_id IN (SELECT ... FOR UPDATE SKIP LOCKED LIMIT k) RETURNING`, rows
+        that are TODO are claimable, and so are IN_PROGRESS rows whose lease has expired (the worker that
+        had them crashed)
+
+        @return the claimed rows
+        '''
 
+        now = utils.utcnow()
 
+        claim_params = {
+            "now": now,
+            "batch_size": self.batch_size,
+            "identity_string": self.identity_string,
+            "new_lease_expires": now + datetime.timedelta(seconds=self.lease_seconds),
+        }
 
+        if self.run_id is not None:
+            claim_statement = prebuilt_statements.CLAIM_HOLE_STATUS_FOR_RUN
+            claim_params["claim_run_id"] = self.run_id
+        else:
+            claim_statement = prebuilt_statements.CLAIM_HOLE_STATUS
 
-    async def handle_one_row(self, item:db_model.FuraffinityHoleStatus):
+        async with self.async_sessionmaker() as sqla_session:
+
+            async with sqla_session.begin():
+
+                claim_result = await sqla_session.execute(claim_statement, claim_params)
+                claimed_row_list = claim_result.scalars().all()
+
+        return sorted(claimed_row_list, key=lambda x: x.item_id)
+
+    async def finish_row(
+        self,
+        item:db_model.FuraffinityHoleStatus,
+        processed_status:model.ProcessedStatus,
+        fa_submission_status:model.FuraffinitySubmissionStatus):
+        '''
+        records the result for a row we claimed and gives up the claim
+
+        if our lease expired and someone else reclaimed the row, nothing is updated and we log it
+        '''
+
+        async with self.async_sessionmaker() as sqla_session:
+
+            async with sqla_session.begin():
+
+                finish_result = await sqla_session.execute(prebuilt_statements.FINISH_HOLE_STATUS, {
+                    "claimed_item_id": item.item_id,
+                    "identity_string": self.identity_string,
+                    "new_processed_status": processed_status,
+                    "new_fa_submission_status": fa_submission_status,
+                })
+
+        if finish_result.rowcount == 0:
+            logger.warning("lost the claim on row `%s` before we finished it, not saving the result `%s`", item.item_id, processed_status)
+
+    async def handle_one_row(self, item:db_model.FuraffinityHoleStatus) -> model.FuraffinitySubmissionStatus:
 
         # call warcat / 7z to see if it is there
 
@@ -118,11 +234,32 @@ class FindFaHoles:
 
         logger.debug("handling row `%s`", item)
 
+        if warc_utils.WarcUtils.has_record_index(item_path):
+            # the warc was compressed per record, so we can seek straight to the two records we
+            # need instead of decompressing the entire archive
+            headers_ba, fa_submission_ba = await self._read_records_from_indexed_warc(item_path)
+        else:
+            headers_ba, fa_submission_ba = await self._read_records_from_sevenzip_warc(item_path)
+
+        headers_dict = self._get_warcinfo_header_dict_from_bytearray(headers_ba)
+
+        # we now have the warcinfo records , we know the furaffinity submission
+        # number and attempt id
+
+        # this raises if it can't tell, so the row is marked as an error rather than finished
+        return self._get_fa_submission_status_from_response(fa_submission_ba)
+
+    async def _read_records_from_sevenzip_warc(self, item_path:pathlib.Path) -> tuple[bytearray, bytearray]:
+        '''
+        decompresses the entire 7z archive and uses warcat to pull out the warcinfo record and the
+        record for the main submission page
+
+        @return a tuple of the warcinfo record block and the submission page record block
+        '''
 
         # first, read the data from disk so we aren't doing it multiple times
-        sevenzip_decompressed_data = await self._read_sevenzip_data(item.file_path)
+        sevenzip_decompressed_data = await self._read_sevenzip_data(item_path)
 
-        breakpoint()
         # get the warcat rows
 
         warc_records = await self.get_warc_record_list(sevenzip_decompressed_data)
@@ -133,13 +270,10 @@ class FindFaHoles:
         sevenzip_decompressed_data.seek(0)
 
         headers_ba = await self._get_decoded_base64_for_warcrecord(sevenzip_decompressed_data, warcinfo_record)
-        headers_dict = self._get_warcinfo_header_dict_from_bytearray(headers_ba)
-
-        # we now have the warcinfo records , we know the furaffinity submission
-        # number and attempt id . we need to find the warc record for the main submission
 
+        # we need to find the warc record for the main submission
         submission_page_record = self._find_first_warc_record_matches_function(
-            lambda x: x.warc_type == "response" and constants.WARCINFO_RECORD_FURAFFINITY_VIEW_URL_REGEX.match(x.warc_target_uri) != None, warc_records)
+            self._is_submission_page_record, warc_records)
         logger.info("found main submission record: `%s`", submission_page_record)
 
         sevenzip_decompressed_data.seek(0)
@@ -147,16 +281,74 @@ class FindFaHoles:
         fa_submission_ba = await self._get_decoded_base64_for_warcrecord(
             sevenzip_decompressed_data, submission_page_record)
 
-        fa_html_result = self._get_fa_submission_html_information(fa_submission_ba)
+        return (headers_ba, fa_submission_ba)
+
+    async def _read_records_from_indexed_warc(self, item_path:pathlib.Path) -> tuple[bytearray, bytearray]:
+        '''
+        uses the sidecar record index of a `.warc.gz` / `.warc.zst` file to read only the warcinfo record
+        and the record for the main submission page
+
+        @return a tuple of the warcinfo record block and the submission page record block
+        '''
+
+        index_entry_list = await asyncio.to_thread(
+            warc_utils.WarcUtils.read_record_index,
+            warc_utils.WarcUtils.get_record_index_path(item_path))
 
-        breakpoint()
+        warcinfo_entry = self._find_first_warc_record_matches_function(lambda x: x.warc_type == "warcinfo", index_entry_list)
+        logger.info("found warcinfo record: `%s`", warcinfo_entry)
 
-    def _get_fa_submission_html_information(self,
-        ba:bytearray) -> None:
+        submission_page_entry = self._find_first_warc_record_matches_function(
+            self._is_submission_page_record, index_entry_list)
+        logger.info("found main submission record: `%s`", submission_page_entry)
 
-        sio = io.StringIO(ba.decode("utf-8"))
-        breakpoint()
+        if warcinfo_entry is None or submission_page_entry is None:
+            raise Exception(f"could not find the warcinfo and submission page records in the record index for `{item_path}`")
+
+        warcinfo_record = await asyncio.to_thread(warc_utils.WarcUtils.read_record, item_path, warcinfo_entry)
+        submission_page_record = await asyncio.to_thread(warc_utils.WarcUtils.read_record, item_path, submission_page_entry)
+
+        return (bytearray(warcinfo_record.block), bytearray(submission_page_record.block))
+
+    def _is_submission_page_record(self, record:model.WarcatRecordInformation|model.WarcRecordIndexEntry) -> bool:
+
+        return record.warc_type == "response" \
+            and constants.WARCINFO_RECORD_FURAFFINITY_VIEW_URL_REGEX.match(record.warc_target_uri) != None
+
+    def _get_fa_submission_status_from_response(self,
+        ba:bytearray) -> model.FuraffinitySubmissionStatus:
+        '''
+        looks at the html of the submission page response record to see what state the submission was in
+
+        only the states we have a known marker for are returned, cloudflare / maintenance pages and anything
+        else we don't recognize raise an exception instead of guessing
+
+        @param ba - the block of the response record, the http status line and headers and then the body
+        @return the FuraffinitySubmissionStatus
+        '''
+
+        # the block of a response record is the raw http response, the html is after the headers
+        _, separator, body_ba = bytes(ba).partition(b"\r\n\r\n")
+
+        if not separator:
+            raise Exception("the submission page record has no end of the http headers, can't find the html")
+
+        soup = BeautifulSoup(body_ba.decode("utf-8", errors="replace"), "lxml")
+
+        # same checks as ScrapeUsers.does_submission_exist
+        section_body_list = soup.select("div.section-body")
+        if section_body_list and section_body_list[0].text.strip() == constants.SUBMISSION_DOESNT_EXIST_TEXT:
+            return model.FuraffinitySubmissionStatus.DELETED
+
+        if soup.select("body#pageid-error-account-unavailable-deleted"):
+            return model.FuraffinitySubmissionStatus.DELETED
+
+        # the artist avatar only shows up on an actual submission page, see html_utils.get_artist_username_as_list
+        if soup.select("div.submission-id-avatar > a"):
+            return model.FuraffinitySubmissionStatus.PRESENT
 
+        title_element = soup.find("title")
+        raise Exception(f"could not figure out the submission status from the submission page, title: `{title_element.text.strip() if title_element else None}`")
 
     def _get_warcinfo_header_dict_from_bytearray(
         self,
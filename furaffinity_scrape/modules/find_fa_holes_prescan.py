@@ -16,6 +16,9 @@ from furaffinity_scrape import file_utils
 
 logger = logging.getLogger(__name__)
 
+# the columns the tuples from `handle_iter_file` are in, `item_id` is left to its sequence
+HOLE_STATUS_COPY_COLUMNS = ["run_id", "processed_status", "file_path", "warc_sha512", "fa_submission_status"]
+
 class FindFaHolesPrescan:
 
 
@@ -43,6 +46,12 @@ class FindFaHolesPrescan:
             required=True,
             help="the run identifier in case we want to do multiple runs")
 
+        parser.add_argument("--batch-size",
+            dest="batch_size",
+            type=int,
+            default=constants.FIND_FA_HOLES_PRESCAN_DEFAULT_BATCH_SIZE,
+            help="how many rows to buffer before writing them to the database in one transaction")
+
         hole_obj = FindFaHolesPrescan()
 
         # set the function that is called when this command is used
@@ -55,62 +64,120 @@ class FindFaHolesPrescan:
         self.stop_event = None
         self.sqla_engine = None
         self.async_sessionmaker = None
+        self.use_copy = None
+        self.rows_written = 0
 
     async def run(self, parsed_args, stop_event):
 
         self.stop_event = stop_event
         self.config = parsed_args.config
-        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url)
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
         # expire_on_commit=False will prevent attributes from being expired
         # after commit.
         self.async_sessionmaker = sessionmaker(
             bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
         )
 
+        # COPY is postgres (and asyncpg) only, anything else gets the ORM
+        self.use_copy = self.sqla_engine.dialect.name == "postgresql" and self.sqla_engine.dialect.driver == "asyncpg"
 
         run_id = parsed_args.run_id
         root_directory = parsed_args.rootdir
+        batch_size = parsed_args.batch_size
 
-        logger.info("starting scan at `%s`", root_directory)
+        logger.info("starting scan at `%s`, writing rows in batches of `%s` using `%s`",
+            root_directory, batch_size, "COPY" if self.use_copy else "the ORM")
 
-        for dirpath, dirnames, filenames in root_directory.walk(top_down=True):
+        pending_record_list = []
 
-            if self.stop_event.is_set():
-                logger.info("stop event is set, breaking out early at folder `%s`", dirpath)
-                break
+        try:
 
-            async with self.async_sessionmaker() as sqla_session:
+            for dirpath, dirnames, filenames in root_directory.walk(top_down=True):
+
+                if self.stop_event.is_set():
+                    logger.info("stop event is set, breaking out early at folder `%s`", dirpath)
+                    break
 
                 logger.info("on directory `%s`, we have `%s` files", dirpath, len(filenames))
 
-                async with sqla_session.begin():
-                    for iter_file in filenames:
+                for iter_file in filenames:
+
+                    # the record index of a per record compressed warc isn't an archive itself
+                    if iter_file.endswith(constants.WARC_RECORD_INDEX_SUFFIX):
+                        continue
+
+                    current_file = dirpath / iter_file
+
+                    pending_record_list.append(self.handle_iter_file(run_id, current_file))
+
+                if len(pending_record_list) >= batch_size:
+
+                    await self.write_records(pending_record_list)
+                    pending_record_list = []
+
+            # whatever is left over, only whole directories are ever buffered so this is safe on stop too
+            if pending_record_list:
+                await self.write_records(pending_record_list)
+
+        finally:
+            await self.close_stuff()
 
-                        current_file = dirpath / iter_file
+        logger.info("done! wrote `%s` rows", self.rows_written)
 
-                        self.handle_iter_file(run_id, current_file, sqla_session)
 
-                    logger.info("Committing...")
+    async def close_stuff(self):
 
-        logger.info("done!")
+        if self.sqla_engine:
+            logger.debug("disposing sqlalchemy engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
 
 
-    def handle_iter_file(self, run_id:int, current_file:pathlib.Path, session:AsyncSession):
+    def handle_iter_file(self, run_id:int, current_file:pathlib.Path) -> tuple:
+        '''
+        makes the row for one file
+
+        @return a tuple in the order of `HOLE_STATUS_COPY_COLUMNS`
+        '''
+
+        return (
+            run_id,
+            model.ProcessedStatus.TODO.value,
+            str(current_file),
+            None,
+            model.FuraffinitySubmissionStatus.UNKNOWN.value)
+
+
+    async def write_records(self, record_list:list[tuple]):
+        '''
+        writes a batch of rows made by `handle_iter_file` in one transaction
+
+        with postgres this is a binary COPY through asyncpg, which skips the unit of work and
+        statement building that made the prescan ORM bound, otherwise it falls back to adding
+        ORM objects to the session
+        '''
+
+        async with self.async_sessionmaker() as sqla_session:
 
+            async with sqla_session.begin():
 
-        # create database object
-        dbobj = db_model.FuraffinityHoleStatus(
-            run_id=run_id,
-            processed_status=model.ProcessedStatus.TODO,
-            file_path=str(current_file),
-            warc_sha512=None,
-            fa_submission_status=model.FuraffinitySubmissionStatus.UNKNOWN)
+                if self.use_copy:
 
-        # add it to the session
-        session.add(dbobj)
+                    sqla_connection = await sqla_session.connection()
+                    raw_connection = await sqla_connection.get_raw_connection()
+                    asyncpg_connection = raw_connection.driver_connection
 
+                    await asyncpg_connection.copy_records_to_table(
+                        db_model.FuraffinityHoleStatus.__tablename__,
+                        records=record_list,
+                        columns=HOLE_STATUS_COPY_COLUMNS)
 
+                else:
 
+                    for iter_record in record_list:
+                        sqla_session.add(db_model.FuraffinityHoleStatus(**dict(zip(HOLE_STATUS_COPY_COLUMNS, iter_record))))
 
+                logger.info("Committing `%s` rows...", len(record_list))
 
+        self.rows_written += len(record_list)
 
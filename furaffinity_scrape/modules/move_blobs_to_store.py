@@ -0,0 +1,188 @@
+import logging
+import asyncio
+
+import bitmath
+from sqlalchemy import select, update, values, column, Integer
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import constants
+from furaffinity_scrape import blob_store
+
+logger = logging.getLogger(__name__)
+
+class MoveBlobsToStore:
+    '''
+    moves the compressed webpages that are still in the database into the configured blob store,
+    a batch at a time
+
+    the blobs are written to the store first and only then is the row updated to point at the store,
+    so if we are interrupted the worst case is a file in the store that nothing references yet, and
+    running it again picks up where it left off
+    '''
+
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("move_blobs_to_store")
+
+        parser.add_argument("--source",
+            dest="source",
+            type=model.RecompressSource,
+            required=True,
+            choices=[model.RecompressSource.WEBPAGE_BLOBS, model.RecompressSource.WEBPAGES],
+            help="which webpage table to move the data out of")
+
+        parser.add_argument("--batch-size",
+            dest="batch_size",
+            type=int,
+            default=constants.MOVE_BLOBS_TO_STORE_DEFAULT_BATCH_SIZE,
+            help="how many rows to move per transaction")
+
+        parser.add_argument("--concurrency",
+            dest="concurrency",
+            type=int,
+            default=constants.MOVE_BLOBS_TO_STORE_DEFAULT_CONCURRENCY,
+            help="how many blobs to write to the store at once")
+
+        move_blobs_to_store_obj = MoveBlobsToStore()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=move_blobs_to_store_obj.run)
+
+
+    def __init__(self):
+
+        self.config = None
+        self.sqla_engine = None
+        self.async_sessionmaker = None
+        self.stop_event = None
+        self.webpage_blob_store = None
+
+    async def run(self, parsed_args, stop_event):
+
+        self.config = parsed_args.config
+        self.stop_event = stop_event
+
+        self.webpage_blob_store = blob_store.create_blob_store(self.config.blob_store_settings)
+
+        if self.webpage_blob_store is None:
+            raise Exception("there is no blob store configured, set the `blob_store` group in the config")
+
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
+
+        try:
+
+            self.async_sessionmaker = sessionmaker(
+                bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
+            )
+
+            await self.move_blobs(parsed_args.source, parsed_args.batch_size, parsed_args.concurrency)
+
+        finally:
+            await self.close_stuff()
+
+    async def move_blobs(self, source:model.RecompressSource, batch_size:int, concurrency:int):
+
+        if source == model.RecompressSource.WEBPAGE_BLOBS:
+            row_class = db_model.SubmissionWebpageBlob
+            id_column = db_model.SubmissionWebpageBlob.blob_id
+        else:
+            row_class = db_model.SubmissionWebpage
+            id_column = db_model.SubmissionWebpage.submission_webpage_id
+
+        logger.info("moving `%s` into the %s", source.value, self.webpage_blob_store.describe())
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _put_one(key:str, data:bytes):
+            async with semaphore:
+                await self.webpage_blob_store.put(key, data)
+
+        last_row_id = 0
+        number_of_rows_moved = 0
+        number_of_bytes_moved = 0
+
+        while not self.stop_event.is_set():
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                # keyset pagination on the primary key
+                select_statement = select(
+                        id_column.label("item_id"),
+                        row_class.raw_compressed_webpage_data,
+                        row_class.compressed_data_sha512) \
+                    .where(id_column > last_row_id) \
+                    .where(row_class.storage_location == model.BlobStorageLocation.DATABASE) \
+                    .where(row_class.raw_compressed_webpage_data != None) \
+                    .order_by(id_column) \
+                    .limit(batch_size)
+
+                select_result = await sqla_session.execute(select_statement)
+                row_list = select_result.all()
+
+            if not row_list:
+                break
+
+            await asyncio.gather(*[_put_one(iter_row.compressed_data_sha512, iter_row.raw_compressed_webpage_data) for iter_row in row_list])
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                async with sqla_session.begin():
+
+                    # one `UPDATE ... FROM (VALUES ...)` for the whole batch, only swapping the rows that
+                    # recompress_archive didn't change since we read them
+                    moved_values = values(
+                            column("item_id", Integer),
+                            column("compressed_data_sha512", row_class.compressed_data_sha512.type),
+                            name="moved") \
+                        .data([(iter_row.item_id, iter_row.compressed_data_sha512) for iter_row in row_list])
+
+                    update_statement = update(row_class) \
+                        .where(id_column == moved_values.c.item_id) \
+                        .where(row_class.compressed_data_sha512 == moved_values.c.compressed_data_sha512) \
+                        .where(row_class.storage_location == model.BlobStorageLocation.DATABASE) \
+                        .values(
+                            raw_compressed_webpage_data=None,
+                            storage_location=model.BlobStorageLocation.BLOB_STORE) \
+                        .returning(id_column) \
+                        .execution_options(synchronize_session=False)
+
+                    update_result = await sqla_session.execute(update_statement)
+                    moved_id_set = set(update_result.scalars().all())
+
+            for iter_row in row_list:
+
+                if iter_row.item_id not in moved_id_set:
+                    logger.warning("`%s` changed while we were moving it, skipping", iter_row.item_id)
+                    continue
+
+                number_of_rows_moved += 1
+                number_of_bytes_moved += len(iter_row.raw_compressed_webpage_data)
+
+            last_row_id = row_list[-1].item_id
+
+            logger.info("moved `%s` rows (`%s`) so far, up to id `%s`",
+                number_of_rows_moved, bitmath.Byte(number_of_bytes_moved).best_prefix().format(constants.BITMATH_FORMATTING_STRING), last_row_id)
+
+        logger.info("done, moved `%s` rows (`%s`) out of `%s`, the space is only given back to the OS after a VACUUM FULL of `%s`",
+            number_of_rows_moved, bitmath.Byte(number_of_bytes_moved).best_prefix().format(constants.BITMATH_FORMATTING_STRING),
+            row_class.__tablename__, row_class.__tablename__)
+
+    async def close_stuff(self):
+
+        if self.sqla_engine:
+            logger.info("closing sqla engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
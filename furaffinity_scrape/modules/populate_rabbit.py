@@ -4,8 +4,11 @@ import asyncio
 
 import aio_pika
 from aio_pika.abc import DeliveryMode
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from furaffinity_scrape import utils
+from furaffinity_scrape import partition_utils
 
 logger = logging.getLogger(__name__)
 
@@ -39,10 +42,16 @@ class PopulateRabbit:
         self.rabbitmq_channel = None
         self.rabbitmq_queue = None
         self.identity_string = None
+        self.sqla_engine = None
 
 
     async def close_stuff(self):
 
+        if self.sqla_engine:
+            logger.info("closing sqla engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
+
         if self.rabbitmq_connection and not self.rabbitmq_connection.is_closed:
             logger.info("closing rabbitmq client")
             await self.rabbitmq_connection.close()
@@ -60,6 +69,15 @@ class PopulateRabbit:
 
         try:
 
+            # the workers can't insert rows for these submissions unless their partitions exist
+            self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
+            async_sessionmaker = sessionmaker(bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession)
+
+            async with async_sessionmaker() as sqla_session:
+                async with sqla_session.begin():
+                    await partition_utils.PartitionUtils.ensure_submission_partitions(
+                        sqla_session, self.config.starting_submission_id, self.config.ending_submission_id)
+
             # create rabbitmq stuff
             self.rabbitmq_url = self.config.rabbitmq_url
 
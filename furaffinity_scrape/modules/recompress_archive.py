@@ -0,0 +1,683 @@
+from __future__ import annotations
+import logging
+import asyncio
+import pathlib
+import tempfile
+import os
+import concurrent.futures
+import datetime
+
+from sqlalchemy import select, update, values, column, Integer
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import constants
+from furaffinity_scrape import compression_utils
+from furaffinity_scrape import warc_utils
+
+logger = logging.getLogger(__name__)
+
+def recompress_webpage_data(
+    item_id:int,
+    compressed_data:bytes,
+    compression_scheme:model.CompressionScheme,
+    original_data_sha512:str,
+    old_compressed_sha512:str,
+    target_scheme:model.CompressionScheme,
+    level:int) -> model.RecompressItemResult:
+    '''
+    recompresses one stored webpage, runs in a worker process
+
+    both the old and the new data have to decompress to the original sha512 we have in the
+    database, otherwise error_string is set and the row must not be touched
+    '''
+
+    cu = compression_utils.CompressionUtils
+
+    original_data = cu.decompress(compression_scheme, compressed_data)
+
+    if utils.sha512_hexdigest(original_data) != original_data_sha512:
+        return model.RecompressItemResult(
+            item_key=item_id,
+            old_size=len(compressed_data),
+            new_size=len(compressed_data),
+            old_compressed_sha512=old_compressed_sha512,
+            error_string=f"the stored `{compression_scheme.value}` data doesn't match original sha512 `{original_data_sha512}`")
+
+    new_compressed_data = cu.compress(target_scheme, level, original_data)
+
+    if utils.sha512_hexdigest(cu.decompress(target_scheme, new_compressed_data)) != original_data_sha512:
+        return model.RecompressItemResult(
+            item_key=item_id,
+            old_size=len(compressed_data),
+            new_size=len(compressed_data),
+            old_compressed_sha512=old_compressed_sha512,
+            error_string=f"the `{target_scheme.value}` data didn't round trip to original sha512 `{original_data_sha512}`")
+
+    return model.RecompressItemResult(
+        item_key=item_id,
+        old_size=len(compressed_data),
+        new_size=len(new_compressed_data),
+        old_compressed_sha512=old_compressed_sha512,
+        new_compressed_sha512=utils.sha512_hexdigest(new_compressed_data),
+        new_compressed_data=new_compressed_data)
+
+def recompress_warc_file(
+    folder:pathlib.Path,
+    relative_path:str,
+    target_format:model.WarcCompressionFormat,
+    sevenzip_path:pathlib.Path,
+    temp_folder:pathlib.Path) -> model.RecompressItemResult:
+    '''
+    converts one `.warc.7z` file into a per record compressed warc with a record index, runs
+    in a worker process
+
+    the new files are written next to the original with a partial suffix, it is up to the caller
+    to rename them into place once the database has been updated
+    '''
+
+    wcu = warc_utils.WarcUtils
+    sevenzip_warc_path = folder / relative_path
+    old_size = sevenzip_warc_path.stat().st_size
+    old_compressed_sha512 = utils.sha512_file_hexdigest(sevenzip_warc_path)
+
+    final_warc_path = sevenzip_warc_path.with_name(
+        sevenzip_warc_path.name.removesuffix(constants.SEVENZIP_SUFFIX) + wcu.get_per_record_compressed_suffix(target_format))
+    new_file_path = final_warc_path.with_name(final_warc_path.name + constants.RECOMPRESS_ARCHIVE_PARTIAL_SUFFIX)
+    new_record_index_file_path = wcu.get_record_index_path(final_warc_path)
+    new_record_index_file_path = new_record_index_file_path.with_name(new_record_index_file_path.name + constants.RECOMPRESS_ARCHIVE_PARTIAL_SUFFIX)
+
+    with tempfile.TemporaryDirectory(dir=temp_folder, prefix="recompress_archive_") as d:
+
+        warc_path = pathlib.Path(d) / sevenzip_warc_path.name.removesuffix(constants.SEVENZIP_SUFFIX)
+
+        compression_utils.CompressionUtils.extract_sevenzip_to_file(sevenzip_path, sevenzip_warc_path, warc_path)
+        original_data_sha512 = utils.sha512_file_hexdigest(warc_path)
+
+        index_entry_list = wcu.write_per_record_compressed_warc(warc_path, new_file_path, target_format)
+
+    scheme = model.CompressionScheme.GZIP if target_format == model.WarcCompressionFormat.WARC_GZ else model.CompressionScheme.ZSTD
+
+    if compression_utils.CompressionUtils.sha512_of_decompressed_file(scheme, new_file_path) != original_data_sha512:
+
+        new_file_path.unlink()
+
+        return model.RecompressItemResult(
+            item_key=relative_path,
+            old_size=old_size,
+            new_size=old_size,
+            old_compressed_sha512=old_compressed_sha512,
+            error_string=f"the `{target_format.value}` file didn't round trip to the original warc sha512 `{original_data_sha512}`")
+
+    wcu.write_record_index(new_record_index_file_path, index_entry_list)
+
+    return model.RecompressItemResult(
+        item_key=relative_path,
+        old_size=old_size,
+        new_size=new_file_path.stat().st_size,
+        old_compressed_sha512=old_compressed_sha512,
+        new_compressed_sha512=utils.sha512_file_hexdigest(new_file_path),
+        new_file_path=new_file_path,
+        new_record_index_file_path=new_record_index_file_path)
+
+
+class RecompressArchive:
+
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("recompress_archive")
+
+        parser.add_argument("--source",
+            dest="source",
+            type=model.RecompressSource,
+            required=True,
+            choices=list(model.RecompressSource),
+            help="what to recompress, the webpage tables or a folder of .warc.7z files")
+
+        parser.add_argument("--target-format",
+            dest="target_format",
+            required=True,
+            help="for the webpage sources a compression scheme (gzip, xz, zstd, tar_xz), for warc_files either warc_gz or warc_zst")
+
+        parser.add_argument("--level",
+            dest="level",
+            type=int,
+            default=None,
+            help="compression level for the webpage sources, the warc files use the same levels as new warcs")
+
+        parser.add_argument("--folder",
+            dest="folder",
+            type=utils.isDirectoryType,
+            default=None,
+            help="the folder of .warc.7z files, required for the warc_files source")
+
+        parser.add_argument("--job-name",
+            dest="job_name",
+            default=None,
+            help="name of the checkpoint to resume, defaults to `<source>-to-<target format>`")
+
+        parser.add_argument("--batch-size",
+            dest="batch_size",
+            type=int,
+            default=constants.RECOMPRESS_ARCHIVE_DEFAULT_BATCH_SIZE,
+            help="how many rows or files to recompress between checkpoints")
+
+        parser.add_argument("--workers",
+            dest="workers",
+            type=int,
+            default=os.cpu_count(),
+            help="number of worker processes")
+
+        parser.add_argument("--keep-original",
+            dest="keep_original",
+            action="store_true",
+            help="for warc_files, don't delete the .warc.7z file after it has been converted")
+
+        parser.add_argument("--force",
+            dest="force",
+            action="store_true",
+            help="take over the job even if another machine's lease hasn't expired yet")
+
+        recompress_archive_obj = RecompressArchive()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=recompress_archive_obj.run)
+
+
+    def __init__(self):
+
+        self.config = None
+        self.sqla_engine = None
+        self.async_sessionmaker = None
+        self.stop_event = None
+        self.identity_string = None
+        self.job_name = None
+
+    async def run(self, parsed_args, stop_event):
+
+        self.config = parsed_args.config
+        self.stop_event = stop_event
+        self.identity_string = utils.get_identity_string()
+
+        source = parsed_args.source
+
+        if source == model.RecompressSource.WARC_FILES:
+            target_format = model.WarcCompressionFormat(parsed_args.target_format)
+
+            if target_format == model.WarcCompressionFormat.SEVENZIP:
+                raise Exception("the warc_files source can only be converted to warc_gz or warc_zst")
+
+            if parsed_args.folder is None:
+                raise Exception("--folder is required for the warc_files source")
+
+        else:
+            target_format = model.CompressionScheme(parsed_args.target_format)
+
+            if target_format not in (model.CompressionScheme.GZIP, model.CompressionScheme.XZ,
+                    model.CompressionScheme.ZSTD, model.CompressionScheme.TAR_XZ):
+                raise Exception(f"the webpage sources can't be converted to `{target_format.value}`")
+
+        self.job_name = parsed_args.job_name or f"{source.value}-to-{target_format.value}"
+
+        self.config.temp_folder.mkdir(exist_ok=True)
+
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
+
+        try:
+
+            # expire_on_commit=False will prevent attributes from being expired
+            # after commit.
+            self.async_sessionmaker = sessionmaker(
+                bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
+            )
+
+            checkpoint = await self.claim_checkpoint(source, target_format, parsed_args.force)
+
+            try:
+
+                with concurrent.futures.ProcessPoolExecutor(max_workers=parsed_args.workers) as executor:
+
+                    if source == model.RecompressSource.WARC_FILES:
+                        await self.recompress_warc_files(executor, checkpoint, parsed_args, target_format)
+                    else:
+                        level = parsed_args.level if parsed_args.level is not None \
+                            else constants.RECOMPRESS_ARCHIVE_DEFAULT_LEVELS[target_format.value]
+                        await self.recompress_webpage_rows(executor, checkpoint, parsed_args, source, target_format, level)
+
+            finally:
+                await self.release_checkpoint()
+
+        except Exception as e:
+            logger.exception("uncaught exception")
+            await self.close_stuff()
+            raise e
+
+        await self.close_stuff()
+
+    async def claim_checkpoint(self, source:model.RecompressSource, target_format, force:bool) -> db_model.RecompressCheckpoint:
+        '''
+        creates the checkpoint row for this job if it doesn't exist, and takes the lease on it
+
+        raises an exception if another machine is still working on the job
+        '''
+
+        checkpoint_table = db_model.RecompressCheckpoint.__table__
+        now = utils.utcnow()
+
+        async with self.async_sessionmaker() as sqla_session:
+
+            async with sqla_session.begin():
+
+                insert_statement = insert(checkpoint_table).values(
+                    job_name=self.job_name,
+                    source=source,
+                    target_format=target_format.value,
+                    last_row_id=None,
+                    last_file_path=None,
+                    items_done=0,
+                    items_failed=0,
+                    bytes_before=0,
+                    bytes_after=0,
+                    claimed_by=None,
+                    lease_expires=None,
+                    date_updated=now) \
+                    .on_conflict_do_nothing(index_elements=[checkpoint_table.c.job_name])
+
+                await sqla_session.execute(insert_statement)
+
+                select_statement = select(db_model.RecompressCheckpoint) \
+                    .where(db_model.RecompressCheckpoint.job_name == self.job_name) \
+                    .with_for_update()
+
+                select_result = await sqla_session.execute(select_statement)
+                checkpoint = select_result.scalar_one()
+
+                if checkpoint.source != source or checkpoint.target_format != target_format.value:
+                    raise Exception(f"job `{self.job_name}` is for `{checkpoint.source.value}` to `{checkpoint.target_format}`, not `{source.value}` to `{target_format.value}`")
+
+                if checkpoint.claimed_by is not None \
+                    and checkpoint.claimed_by != self.identity_string \
+                    and checkpoint.lease_expires > now \
+                    and not force:
+
+                    raise Exception(f"job `{self.job_name}` is claimed by `{checkpoint.claimed_by}` until `{checkpoint.lease_expires}`, pass --force to take it over")
+
+                checkpoint.claimed_by = self.identity_string
+                checkpoint.lease_expires = now + datetime.timedelta(seconds=constants.RECOMPRESS_ARCHIVE_LEASE_SECONDS)
+                checkpoint.date_updated = now
+
+        logger.info("claimed job `%s`, resuming after row `%s` / file `%s`, `%s` done and `%s` failed so far",
+            self.job_name, checkpoint.last_row_id, checkpoint.last_file_path, checkpoint.items_done, checkpoint.items_failed)
+
+        return checkpoint
+
+    async def save_checkpoint(
+        self,
+        sqla_session:AsyncSession,
+        result_list:list[model.RecompressItemResult],
+        last_row_id:int|None=None,
+        last_file_path:str|None=None):
+        '''
+        moves the checkpoint past the batch and extends our lease, this is done in the same
+        transaction that swaps in the recompressed data
+
+        raises an exception (rolling back the transaction) if another machine took over the job
+        '''
+
+        checkpoint_class = db_model.RecompressCheckpoint
+        now = utils.utcnow()
+
+        ok_result_list = [iter_result for iter_result in result_list if iter_result.error_string is None]
+
+        update_statement = update(checkpoint_class) \
+            .where(checkpoint_class.job_name == self.job_name) \
+            .where(checkpoint_class.claimed_by == self.identity_string) \
+            .values(
+                last_row_id=last_row_id,
+                last_file_path=last_file_path,
+                items_done=checkpoint_class.items_done + len(ok_result_list),
+                items_failed=checkpoint_class.items_failed + (len(result_list) - len(ok_result_list)),
+                bytes_before=checkpoint_class.bytes_before + sum(iter_result.old_size for iter_result in ok_result_list),
+                bytes_after=checkpoint_class.bytes_after + sum(iter_result.new_size for iter_result in ok_result_list),
+                lease_expires=now + datetime.timedelta(seconds=constants.RECOMPRESS_ARCHIVE_LEASE_SECONDS),
+                date_updated=now) \
+            .execution_options(synchronize_session=False)
+
+        update_result = await sqla_session.execute(update_statement)
+
+        if update_result.rowcount != 1:
+            raise Exception(f"lost the lease on job `{self.job_name}`, another machine must have taken it over")
+
+    async def release_checkpoint(self):
+
+        checkpoint_class = db_model.RecompressCheckpoint
+
+        async with self.async_sessionmaker() as sqla_session:
+
+            async with sqla_session.begin():
+
+                update_statement = update(checkpoint_class) \
+                    .where(checkpoint_class.job_name == self.job_name) \
+                    .where(checkpoint_class.claimed_by == self.identity_string) \
+                    .values(claimed_by=None, lease_expires=None, date_updated=utils.utcnow()) \
+                    .execution_options(synchronize_session=False)
+
+                await sqla_session.execute(update_statement)
+
+        logger.info("released job `%s`", self.job_name)
+
+    def _log_failed_results(self, result_list:list[model.RecompressItemResult]):
+
+        for iter_result in result_list:
+            if iter_result.error_string is not None:
+                logger.error("failed to recompress `%s`, leaving it as is: %s", iter_result.item_key, iter_result.error_string)
+
+    async def recompress_webpage_rows(
+        self,
+        executor:concurrent.futures.Executor,
+        checkpoint:db_model.RecompressCheckpoint,
+        parsed_args,
+        source:model.RecompressSource,
+        target_scheme:model.CompressionScheme,
+        level:int):
+
+        if source == model.RecompressSource.WEBPAGE_BLOBS:
+            row_class = db_model.SubmissionWebpageBlob
+            id_column = db_model.SubmissionWebpageBlob.blob_id
+        else:
+            row_class = db_model.SubmissionWebpage
+            id_column = db_model.SubmissionWebpage.submission_webpage_id
+
+        last_row_id = checkpoint.last_row_id if checkpoint.last_row_id is not None else 0
+        loop = asyncio.get_running_loop()
+
+        while not self.stop_event.is_set():
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                # keyset pagination on the primary key, rows that are already in the target scheme are skipped
+                select_statement = select(
+                        id_column.label("item_id"),
+                        row_class.raw_compressed_webpage_data,
+                        row_class.compression_scheme,
+                        row_class.original_data_sha512,
+                        row_class.compressed_data_sha512) \
+                    .where(id_column > last_row_id) \
+                    .where(row_class.raw_compressed_webpage_data != None) \
+                    .where(row_class.compression_scheme != target_scheme) \
+                    .order_by(id_column) \
+                    .limit(parsed_args.batch_size)
+
+                select_result = await sqla_session.execute(select_statement)
+                row_list = select_result.all()
+
+            if not row_list:
+                logger.info("no more rows to recompress for job `%s`", self.job_name)
+                break
+
+            result_list = await asyncio.gather(*[
+                loop.run_in_executor(
+                    executor,
+                    recompress_webpage_data,
+                    iter_row.item_id,
+                    iter_row.raw_compressed_webpage_data,
+                    iter_row.compression_scheme,
+                    iter_row.original_data_sha512,
+                    iter_row.compressed_data_sha512,
+                    target_scheme,
+                    level)
+                for iter_row in row_list])
+
+            self._log_failed_results(result_list)
+
+            last_row_id = row_list[-1].item_id
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                async with sqla_session.begin():
+
+                    ok_result_list = [iter_result for iter_result in result_list if iter_result.error_string is None]
+
+                    if ok_result_list:
+                        await self._swap_recompressed_rows(sqla_session, source, row_class, id_column, ok_result_list, target_scheme)
+
+                    await self.save_checkpoint(sqla_session, result_list, last_row_id=last_row_id)
+
+            logger.info("job `%s`: recompressed `%s` rows, up to id `%s`", self.job_name, len(result_list), last_row_id)
+
+    async def _swap_recompressed_rows(
+        self,
+        sqla_session:AsyncSession,
+        source:model.RecompressSource,
+        row_class,
+        id_column,
+        ok_result_list:list[model.RecompressItemResult],
+        target_scheme:model.CompressionScheme):
+        '''
+        `UPDATE <row_class> ... FROM (VALUES (id, old sha512, new sha512, new data), ...) RETURNING`, only
+        swapping the rows that nobody changed since we read them, then for blobs one more
+        `UPDATE submission_webpage ... FROM (VALUES ...)` for the returned ids, since the webpage rows
+        that reference a blob have a copy of its compressed sha512
+        '''
+
+        recompressed_values = values(
+                column("item_id", Integer),
+                column("old_compressed_sha512", row_class.compressed_data_sha512.type),
+                column("new_compressed_sha512", row_class.compressed_data_sha512.type),
+                column("new_compressed_data", row_class.raw_compressed_webpage_data.type),
+                name="recompressed") \
+            .data([
+                (iter_result.item_key, iter_result.old_compressed_sha512, iter_result.new_compressed_sha512, iter_result.new_compressed_data)
+                for iter_result in sorted(ok_result_list, key=lambda x: x.item_key)])
+
+        update_statement = update(row_class) \
+            .where(id_column == recompressed_values.c.item_id) \
+            .where(row_class.compressed_data_sha512 == recompressed_values.c.old_compressed_sha512) \
+            .values(
+                raw_compressed_webpage_data=recompressed_values.c.new_compressed_data,
+                compressed_data_sha512=recompressed_values.c.new_compressed_sha512,
+                compression_scheme=target_scheme) \
+            .returning(id_column.label("item_id"), row_class.compressed_data_sha512) \
+            .execution_options(synchronize_session=False)
+
+        update_result = await sqla_session.execute(update_statement)
+        swapped_row_list = update_result.all()
+
+        swapped_id_set = set(iter_row.item_id for iter_row in swapped_row_list)
+
+        for iter_result in ok_result_list:
+            if iter_result.item_key not in swapped_id_set:
+                logger.warning("`%s` changed while we were recompressing it, skipping", iter_result.item_key)
+
+        if source != model.RecompressSource.WEBPAGE_BLOBS or not swapped_row_list:
+            return
+
+        webpage_class = db_model.SubmissionWebpage
+
+        blob_sha512_values = values(
+                column("blob_id", Integer),
+                column("compressed_data_sha512", webpage_class.compressed_data_sha512.type),
+                name="blob_sha512") \
+            .data([(iter_row.item_id, iter_row.compressed_data_sha512) for iter_row in swapped_row_list])
+
+        await sqla_session.execute(
+            update(webpage_class) \
+                .where(webpage_class.blob_id == blob_sha512_values.c.blob_id) \
+                .values(compressed_data_sha512=blob_sha512_values.c.compressed_data_sha512) \
+                .execution_options(synchronize_session=False))
+
+    def get_sevenzip_warc_file_list(self, folder:pathlib.Path, last_file_path:str|None) -> list[str]:
+        '''
+        returns the paths of the `.warc.7z` files relative to the folder, sorted, that come after
+        last_file_path
+        '''
+
+        result_list = []
+
+        for dirpath, dirnames, filenames in folder.walk(top_down=True):
+
+            for iter_file in filenames:
+
+                if not iter_file.endswith(constants.WARC_FILE_SUFFIX + constants.SEVENZIP_SUFFIX):
+                    continue
+
+                relative_path = (dirpath / iter_file).relative_to(folder).as_posix()
+
+                if last_file_path is None or relative_path > last_file_path:
+                    result_list.append(relative_path)
+
+        result_list.sort()
+
+        return result_list
+
+    async def recompress_warc_files(
+        self,
+        executor:concurrent.futures.Executor,
+        checkpoint:db_model.RecompressCheckpoint,
+        parsed_args,
+        target_format:model.WarcCompressionFormat):
+
+        folder = parsed_args.folder
+        loop = asyncio.get_running_loop()
+
+        file_list = await asyncio.to_thread(self.get_sevenzip_warc_file_list, folder, checkpoint.last_file_path)
+
+        logger.info("job `%s`: `%s` files left to recompress in `%s`", self.job_name, len(file_list), folder)
+
+        for batch_start in range(0, len(file_list), parsed_args.batch_size):
+
+            if self.stop_event.is_set():
+                logger.info("stop event is set, stopping job `%s`", self.job_name)
+                break
+
+            batch_file_list = file_list[batch_start:batch_start + parsed_args.batch_size]
+
+            result_list = await asyncio.gather(*[
+                loop.run_in_executor(
+                    executor,
+                    recompress_warc_file,
+                    folder,
+                    iter_relative_path,
+                    target_format,
+                    self.config.sevenzip_path,
+                    self.config.temp_folder)
+                for iter_relative_path in batch_file_list])
+
+            self._log_failed_results(result_list)
+
+            original_path_list = []
+            # (partial path, final path) of every file we renamed into place
+            renamed_path_list = []
+
+            try:
+
+                async with self.async_sessionmaker() as sqla_session:
+
+                    async with sqla_session.begin():
+
+                        swap_list = []
+
+                        for iter_result in result_list:
+
+                            if iter_result.error_string is not None:
+                                continue
+
+                            original_path = folder / iter_result.item_key
+                            final_warc_path = iter_result.new_file_path.with_name(
+                                iter_result.new_file_path.name.removesuffix(constants.RECOMPRESS_ARCHIVE_PARTIAL_SUFFIX))
+                            final_index_path = iter_result.new_record_index_file_path.with_name(
+                                iter_result.new_record_index_file_path.name.removesuffix(constants.RECOMPRESS_ARCHIVE_PARTIAL_SUFFIX))
+
+                            await self.update_rows_for_swapped_file(sqla_session, iter_result, original_path, final_warc_path)
+
+                            swap_list.append((iter_result, final_warc_path, final_index_path))
+                            original_path_list.append(original_path)
+
+                        await self.save_checkpoint(sqla_session, result_list, last_file_path=batch_file_list[-1])
+
+                        # the files are renamed last so that only the commit can fail after they are in
+                        # place. if we die before the commit, the checkpoint hasn't moved, so the next run
+                        # recompresses these files again and replaces what we renamed
+                        for iter_result, final_warc_path, final_index_path in swap_list:
+
+                            # the index goes first so a reader never sees the new warc without its index
+                            os.replace(iter_result.new_record_index_file_path, final_index_path)
+                            renamed_path_list.append((iter_result.new_record_index_file_path, final_index_path))
+
+                            os.replace(iter_result.new_file_path, final_warc_path)
+                            renamed_path_list.append((iter_result.new_file_path, final_warc_path))
+
+            except Exception as e:
+
+                # the database still has the old hashes and paths, so put the files back
+                for iter_partial_path, iter_final_path in reversed(renamed_path_list):
+                    logger.warning("job `%s`: moving `%s` back to `%s` since the batch didn't commit", self.job_name, iter_final_path, iter_partial_path)
+                    os.replace(iter_final_path, iter_partial_path)
+
+                raise e
+
+            # only delete the originals once the database points at the new files
+            if not parsed_args.keep_original:
+                for iter_path in original_path_list:
+                    iter_path.unlink()
+
+            logger.info("job `%s`: recompressed `%s` files, up to `%s`", self.job_name, len(result_list), batch_file_list[-1])
+
+    async def update_rows_for_swapped_file(
+        self,
+        sqla_session:AsyncSession,
+        item_result:model.RecompressItemResult,
+        original_path:pathlib.Path,
+        final_warc_path:pathlib.Path):
+        '''
+        points the `fa_scrape_content` row for the attempt at the hash and size of the new file,
+        and any `fa_hole_status` rows at the new path
+        '''
+
+        file_name_match = constants.CONTENT_FILE_NAME_RE.search(original_path.name)
+
+        if file_name_match:
+
+            attempt_id = int(file_name_match.group(constants.CONTENT_FILE_NAME_ATTEMPT_ID_KEY))
+
+            update_statement = update(db_model.FAScrapeContent) \
+                .where(db_model.FAScrapeContent.attempt_id == attempt_id) \
+                .where(db_model.FAScrapeContent.content_sha512 == item_result.old_compressed_sha512) \
+                .values(content_sha512=item_result.new_compressed_sha512, content_length=item_result.new_size) \
+                .execution_options(synchronize_session=False)
+
+            update_result = await sqla_session.execute(update_statement)
+
+            if update_result.rowcount == 0:
+                logger.debug("no fa_scrape_content row for attempt `%s` has the sha512 of `%s`", attempt_id, original_path)
+
+        else:
+            logger.debug("`%s` doesn't look like one of our content files, not updating fa_scrape_content", original_path)
+
+        await sqla_session.execute(
+            update(db_model.FuraffinityHoleStatus) \
+                .where(db_model.FuraffinityHoleStatus.file_path == str(original_path)) \
+                .values(file_path=str(final_warc_path)) \
+                .execution_options(synchronize_session=False))
+
+    async def close_stuff(self):
+
+        # make sure we dispose the engine because its not in an `async with` block
+
+        if self.sqla_engine:
+            logger.info("closing sqla engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
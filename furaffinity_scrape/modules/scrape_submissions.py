@@ -8,7 +8,6 @@ import attr
 import yarl
 from bs4 import BeautifulSoup
 import aiohttp
-import arrow
 from sqlalchemy import select, desc, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -22,6 +21,7 @@ from furaffinity_scrape import model
 from furaffinity_scrape import constants
 from furaffinity_scrape import html_utils
 from furaffinity_scrape import file_utils
+from furaffinity_scrape import write_behind
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +40,18 @@ class ScrapeSubmissions:
 
         parser = argparse_subparser.add_parser("scrape_submissions")
 
+        parser.add_argument("--flush-size",
+            dest="flush_size",
+            type=int,
+            default=constants.SCRAPE_SUBMISSIONS_DEFAULT_FLUSH_SIZE,
+            help="how many finished attempts to hold before writing them to the database, this is also the rabbitmq prefetch count")
+
+        parser.add_argument("--flush-interval",
+            dest="flush_interval_seconds",
+            type=float,
+            default=constants.SCRAPE_SUBMISSIONS_DEFAULT_FLUSH_INTERVAL_SECONDS,
+            help="write the finished attempts to the database at least this often, in seconds")
+
         scrape_submissions_obj = ScrapeSubmissions()
 
         # set the function that is called when this command is used
@@ -55,6 +67,10 @@ class ScrapeSubmissions:
         self.rabbitmq_channel = None
         self.rabbitmq_queue = None
         self.identity_string = None
+        self.attempt_sink = None
+        # messages get prefetched so the attempt sink can batch them, but we still only want
+        # to scrape one submission at a time
+        self.processing_lock = None
 
         self.time_to_wait_for_additional_messages_at_close = 5
 
@@ -64,7 +80,7 @@ class ScrapeSubmissions:
         logger.info("Our identity string is `%s`", self.identity_string)
 
         self.config = parsed_args.config
-        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url)
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
         self.stop_event = stop_event
 
 
@@ -85,9 +101,9 @@ class ScrapeSubmissions:
 
         self.rabbitmq_channel = await self.rabbitmq_connection.channel()
 
-        # Maximum message count which will be
-        # processing at the same time.
-        await self.rabbitmq_channel.set_qos(prefetch_count=1)
+        # Maximum message count which will be unacked at the same time, since the
+        # attempt sink holds on to the messages until it flushes this needs to be at least the flush size
+        await self.rabbitmq_channel.set_qos(prefetch_count=parsed_args.flush_size)
 
         self.rabbitmq_queue = await self.rabbitmq_channel.get_queue(name=self.config.rabbitmq_queue_name, ensure=True)
 
@@ -100,6 +116,14 @@ class ScrapeSubmissions:
                 bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
             )
 
+            self.processing_lock = asyncio.Lock()
+            self.attempt_sink = write_behind.AttemptStatusWriteBehindSink(
+                sqla_engine=self.sqla_engine,
+                stop_event=self.stop_event,
+                flush_size=parsed_args.flush_size,
+                flush_interval_seconds=parsed_args.flush_interval_seconds)
+            self.attempt_sink.start()
+
             cookie_dict = self.config.cookie_jar.as_aiohttp_cookie_dict()
             header_dict = self.config.header_jar.as_aiohttp_header_dict()
 
@@ -125,6 +149,10 @@ class ScrapeSubmissions:
                     self.time_to_wait_for_additional_messages_at_close)
                 await asyncio.sleep(self.time_to_wait_for_additional_messages_at_close)
 
+                # write out anything the sink is still holding so those messages get acked
+                logger.info("flushing the attempt sink")
+                await self.attempt_sink.stop()
+
                 logger.info("run() loop ended, stop_event was set! Returning")
 
             await self.close_stuff()
@@ -144,12 +172,6 @@ class ScrapeSubmissions:
             message_alternate_representation = model.RabbitmqMessageInfo(delivery_tag=msg.delivery_tag, body_bytes=msg.body )
             logger.debug("rabbitmq_message_received() called with message: `%s`", message_alternate_representation)
 
-            if self.stop_event.is_set():
-                # stop event is set, immediately nack the message
-                logger.info("nacking message `%s` because stop event is set", message_alternate_representation)
-                await msg.reject(requeue=True)
-                return
-
             submission_id = None
 
             try:
@@ -168,22 +190,34 @@ class ScrapeSubmissions:
 
             try:
 
-                await self.one_iteration(submission_id, aiohttp_session, self.async_sessionmaker)
+                async with self.processing_lock:
+
+                    if self.stop_event.is_set():
+                        # stop event is set, immediately nack the message
+                        logger.info("nacking message `%s` because stop event is set", message_alternate_representation)
+                        await msg.reject(requeue=True)
+                        return
+
+                    wget_dl_result = await self.one_iteration(submission_id, aiohttp_session)
 
-                logger.info("sleeping for `%s` second(s)", self.config.time_between_requests_seconds)
-                await asyncio.sleep(self.config.time_between_requests_seconds)
+                    # the message gets acked once the attempt has been written as finished
+                    logger.debug("handing message `%s` to the attempt sink", message_alternate_representation)
+                    await self.attempt_sink.add(
+                        attempt=wget_dl_result.fa_scrape_content.attempt,
+                        processed_status=model.ProcessedStatus.FINISHED,
+                        scrape_content=wget_dl_result.fa_scrape_content,
+                        message=msg)
 
-                # make sure we ack AFTER sleeping, because once we ack it we will get another
-                # message immediately even if we are sleeping
-                logger.info("acking message `%s`", message_alternate_representation)
-                await msg.ack(multiple=False)
+                    logger.info("sleeping for `%s` second(s)", self.config.time_between_requests_seconds)
+                    await asyncio.sleep(self.config.time_between_requests_seconds)
 
             except Exception as e:
                 # don't rethrow as i don't think it will bubble up to the right place anyway, set the stop event instead
                 logger.exception("Exception `%s` caught in rabbitmq_message_received processing message `%s`, nacking message", e, message_alternate_representation)
 
-                # nack the message
-                await msg.reject(requeue=True)
+                # nack the message, unless the attempt sink already did because its flush failed
+                if not msg.processed:
+                    await msg.reject(requeue=True)
 
                 await asyncio.sleep(constants.TIME_TO_SLEEP_SECONDS_ON_EXCEPTION)
 
@@ -192,50 +226,58 @@ class ScrapeSubmissions:
 
 
 
-    async def one_iteration(self, submission_id, aiohttp_session, sessionmaker):
-
-        current_date = arrow.utcnow()
-
-        current_submission_row = None
-
-        async with sessionmaker() as sqla_session:
+    async def one_iteration(self, submission_id, aiohttp_session) -> db_model.WgetDownloadResult:
+        '''
+        scrapes one submission
 
+        the attempt is started with a core statement on a bare connection rather than the ORM, since we
+        need its id for the file name. recording the content and finishing the attempt is left to the
+        attempt sink, which batches them
 
-            current_attempt = None
+        @return the wget download result, with `fa_scrape_content.attempt` set
+        '''
 
-            # start the attempt
-            async with sqla_session.begin():
+        logger.info("on submission `%s`", submission_id)
 
-                logger.info("on submission `%s`", submission_id)
+        # start the attempt
+        async with self.sqla_engine.begin() as sqla_connection:
 
-                current_attempt = db_model.FAScrapeAttempt(
-                    furaffinity_submission_id=submission_id,
-                    date_visited=arrow.utcnow(),
-                    processed_status=model.ProcessedStatus.TODO,
-                    claimed_by=self.identity_string)
+            current_attempt = await self.start_attempt(sqla_connection, submission_id)
 
-                logger.debug("created FAScrapeAttempt and adding it to the session: `%s`", current_attempt)
+        logger.debug("started attempt: `%s`", current_attempt)
 
+        wget_dl_result = await file_utils.FileUtils.download_submission_using_wget(
+            fa_scrape_attempt=current_attempt,
+            config=self.config)
 
-                sqla_session.add(current_attempt)
+        return wget_dl_result
 
-            # now start a new session and then do the work
-            async with sqla_session.begin():
+    async def start_attempt(self, sqla_connection, submission_id:int) -> db_model.FAScrapeAttempt:
+        '''
+        inserts a new TODO attempt with `INSERT ... RETURNING`
 
-                wget_dl_result = await file_utils.FileUtils.download_submission_using_wget(
-                    fa_scrape_attempt=current_attempt,
-                    config=self.config)
+        @return a FAScrapeAttempt that isn't attached to any session, just to carry the values around
+        '''
 
-                # now add the content object to the sqlalchemy session
-                sqla_session.add(wget_dl_result.fa_scrape_content)
+        attempt_table = db_model.FAScrapeAttempt.__table__
 
-                # modify the attempt object to say we are done
-                current_attempt.processed_status = model.ProcessedStatus.FINISHED
-                sqla_session.add(current_attempt)
+        current_attempt = db_model.FAScrapeAttempt(
+            furaffinity_submission_id=submission_id,
+            date_visited=utils.utcnow(),
+            processed_status=model.ProcessedStatus.TODO,
+            claimed_by=self.identity_string)
 
-                logger.info("Committing...")
+        insert_statement = insert(attempt_table).values(
+                furaffinity_submission_id=current_attempt.furaffinity_submission_id,
+                date_visited=current_attempt.date_visited,
+                processed_status=current_attempt.processed_status,
+                claimed_by=current_attempt.claimed_by) \
+            .returning(attempt_table.c.scrape_attempt_id)
 
+        insert_result = await sqla_connection.execute(insert_statement)
+        current_attempt.scrape_attempt_id = insert_result.scalar_one()
 
+        return current_attempt
 
     async def close_stuff(self):
 
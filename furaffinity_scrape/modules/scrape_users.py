@@ -8,7 +8,6 @@ import attr
 import yarl
 from bs4 import BeautifulSoup
 import aiohttp
-import arrow
 from sqlalchemy import select, desc, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -21,6 +20,11 @@ from furaffinity_scrape import db_model
 from furaffinity_scrape import model
 from furaffinity_scrape import constants
 from furaffinity_scrape import html_utils
+from furaffinity_scrape import webpage_blob_utils
+from furaffinity_scrape import blob_store
+from furaffinity_scrape import prebuilt_statements
+from furaffinity_scrape import write_behind
+from furaffinity_scrape import known_user_cache
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +43,29 @@ class ScrapeUsers:
 
         parser = argparse_subparser.add_parser("scrape_users")
 
+        parser.add_argument("--user-flush-size",
+            dest="user_flush_size",
+            type=int,
+            default=constants.SCRAPE_USERS_DEFAULT_USER_FLUSH_SIZE,
+            help="how many submissions to collect users from before writing them to the database, this is also the rabbitmq prefetch count")
+
+        parser.add_argument("--user-flush-interval",
+            dest="user_flush_interval_seconds",
+            type=float,
+            default=constants.SCRAPE_USERS_DEFAULT_USER_FLUSH_INTERVAL_SECONDS,
+            help="write the collected users to the database at least this often, in seconds")
+
+        parser.add_argument("--known-user-cache-size",
+            dest="known_user_cache_size",
+            type=int,
+            default=constants.KNOWN_USER_CACHE_DEFAULT_LRU_SIZE,
+            help="how many recently seen users to remember are in the database, on top of the bloom filter")
+
+        parser.add_argument("--no-known-user-cache",
+            dest="use_known_user_cache",
+            action="store_false",
+            help="don't load the known user bloom filter at startup, every user found gets upserted")
+
         scrape_users_obj = ScrapeUsers()
 
         # set the function that is called when this command is used
@@ -56,6 +83,11 @@ class ScrapeUsers:
         self.rabbitmq_client = None
         self.rabbitmq_channel = None
         self.rabbitmq_queue = None
+        self.user_sink = None
+        self.webpage_blob_store = None
+        # messages get prefetched so the user sink can batch them, but we still only want
+        # to scrape one submission at a time
+        self.processing_lock = None
 
         self.time_to_wait_for_additional_messages_at_close = 5
 
@@ -88,79 +120,6 @@ class ScrapeUsers:
 
         self.html_queries_list.extend(to_add_list)
 
-    async def update_or_ignore_found_users(self, users_found_set:set, session:AsyncSession, date_added:arrow.arrow.Arrow):
-        '''
-        queries the database for all of the users found in the set
-
-        if we are using postgres, we can update the database using a special insert statement that has
-        'on conflict do nothing' (an "upsert")
-
-        see https://docs.sqlalchemy.org/en/14/dialects/postgresql.html#insert-on-conflict-upsert
-
-        note: originally we did this in ORM mode and asked the database for the list of users that we do a diff and see which
-        users were already in the DB, and then inserted the missing users. We still do that, but now we do a upsert
-        which means that if two workers have a race condition trying to add the same user, it won't have one worker fail,
-        the losing worker will just have the "on conflict do nothing" take place and everyone is happy, and no database
-        locking!
-
-        '''
-
-        select_statement = select(db_model.User) \
-            .filter(db_model.User.user_name.in_(users_found_set))
-
-        logger.debug("selecting data for user diff update: `%s`", select_statement)
-        select_result = await session.execute(select_statement)
-
-        users_in_database_list = select_result.scalars().all()
-        logger.debug("got `%s` users in database", len(users_in_database_list))
-
-        users_in_database_set = set([iter_user.user_name for iter_user in users_in_database_list])
-
-        # now do a set difference
-        users_not_in_db_set = users_found_set.difference(users_in_database_set)
-
-        logger.debug("users to add (`%s`): `%s`, \n\nusers already in database (`%s`): `%s`, \n\nusers to insert into db (`%s`): `%s`",
-            len(users_found_set),
-            users_found_set,
-            len(users_in_database_set),
-            users_in_database_set,
-            len(users_not_in_db_set),
-            users_not_in_db_set)
-
-        logger.info("found `%s` new users to add to the database: `%s`",
-            len(users_not_in_db_set), users_not_in_db_set)
-
-        # only do this if we have > 0 users to add, otherwise we will get an integrity error trying to add a
-        # user that has null values
-        if len(users_not_in_db_set) > 0:
-
-            core_insert_values_list = []
-            for iter_user_name in users_not_in_db_set:
-                core_insert_values_list.append({"date_added": date_added, "user_name": iter_user_name})
-
-            upsert_statement = insert(db_model.User.__table__).values(core_insert_values_list)
-
-            # you need the escaped quotes or else it will do a syntax error
-            # like:
-            # Exception `(sqlalchemy.dialects.postgresql.asyncpg.ProgrammingError) <class 'asyncpg.exceptions.PostgresSyntaxError'>: syntax error at or near "-"
-            # [SQL: INSERT INTO "user" (date_added, user_name) VALUES (%s, %s) ON CONFLICT ON CONSTRAINT PK-user-user_id DO NOTHING]
-            # [parameters: (datetime.datetime(2021, 6, 27, 17, 47, 56, 531642), 'deathking254')]
-            #
-            do_nothing_upsert_statement = upsert_statement.on_conflict_do_nothing()
-
-            # NOTE: potentially very verbose, uncomment for debugging
-            # logger.debug("upsert statement: `%s`", upsert_statement)
-            #
-            conn = await session.connection()
-
-            logger.debug("executing upsert statement")
-            await conn.execute(do_nothing_upsert_statement)
-            logger.debug("upsert statement finished successfully")
-
-        else:
-
-            logger.debug("no users to add to the database, not upserting anything")
-
     def does_submission_exist(self, current_fa_submission:model.FASubmission) -> model.SubmissionStatus:
         '''
         returns whether the submission exists or not depending on the html
@@ -227,27 +186,26 @@ class ScrapeUsers:
 
         return users_found_set
 
-    def add_webpage_data_to_db(self, sqla_session, fa_submission, current_date):
+    async def add_webpage_data_to_db(self, sqla_session, fa_submission, current_date):
         '''
         given a FA submission and the current date, add a new row to SubmisisonWebPage
 
+        if we already stored an identical page, the new row references the existing blob instead of
+        storing the page again, see webpage_blob_utils
+
         @param sqla_session - the sqlalchemy session
         @param fa_submission - the FASubmission object to insert to the database
-        @param current_date - the current date as an arrow object
+        @param current_date - the current date, see utils.utcnow()
 
         '''
 
-        compress_and_hash_result = utils.compress_and_hash_text_data(fa_submission.raw_html_bytes)
-
-        submission_wp = db_model.SubmissionWebpage(
+        await webpage_blob_utils.WebpageBlobUtils.add_submission_webpage(
+            sqla_session=sqla_session,
+            submission_row=fa_submission.submission_row,
+            raw_html_bytes=fa_submission.raw_html_bytes,
+            did_have_decode_error=fa_submission.did_have_decode_error,
             date_visited=current_date,
-            submission=fa_submission.submission_row,
-            raw_compressed_webpage_data=compress_and_hash_result.compressed_data,
-            encoding_status=model.EncodingStatusEnum.DECODED_OK if not fa_submission.did_have_decode_error else model.EncodingStatusEnum.UNICODE_DECODE_ERROR,
-            original_data_sha512=compress_and_hash_result.original_data_sha512,
-            compressed_data_sha512=compress_and_hash_result.compressed_data_sha512)
-
-        sqla_session.add(submission_wp)
+            webpage_blob_store=self.webpage_blob_store)
 
     async def download_one_fa_submission(self, fa_submission, aiohttp_session) -> model.FASubmission:
         '''
@@ -282,85 +240,54 @@ class ScrapeUsers:
 
         "claims" the next submission
 
-        this checks to see if we have a row in the submission table already for this submission, and if we do
-        we see if it is finished or not
+        this is one `INSERT ... ON CONFLICT DO UPDATE ... WHERE ... RETURNING` statement:
+
+        if there is no row in the submission table for this submission yet (the expected path), a new one is
+        inserted and returned
 
-        if it was finished, then we will return None, to let the caller know that this was already finished but not acked
-        for some reason (crashed at the perfect time?), since we use rabbitmq for the queueing, it is possible that
-        it was finished but then it never got a chance to ack the message so it got returned to the queue
+        if there is a row that isn't finished (another worker claimed it and then crashed, returning the message
+        to the queue), it gets our identity and a new date, and is returned
 
-        if it wasn't finished, then we will just use that submission row and update the date
+        if there is a row that is finished, the WHERE on the DO UPDATE doesn't match, so nothing is returned and we
+        return None, to let the caller know that this was already finished but not acked for some reason (crashed at
+        the perfect time?), since we use rabbitmq for the queueing, it is possible that it was finished but then it
+        never got a chance to ack the message so it got returned to the queue
 
-        if we DIDN'T find an existing submission, we will create a new FASubmission object and add it to the session
-        where it will be added immediately to the database
+        since furaffinity_submission_id is unique, two workers that get the same redelivered message can't both
+        create a row, the second one waits on the first one's row lock and then updates (or skips) it
 
         '''
 
         async with sqla_session.begin():
 
-            # first off, see if this submission already was claimed by another worker and then that worker
-            # crashed or something, returning the message to the queue. if that did happen, then we can use the existing
-            # submission object
-            does_submission_exist_stmt = select(db_model.Submission).where(db_model.Submission.furaffinity_submission_id == submission_id)
-
-            maybe_existing_fa_submission_execute_result = await sqla_session.execute(does_submission_exist_stmt)
+            claim_result = await sqla_session.execute(prebuilt_statements.CLAIM_SUBMISSION, {
+                "furaffinity_submission_id": submission_id,
+                "date_visited": current_date,
+                "claimed_by": self.identity_string,
+            })
+            claimed_submission_row = claim_result.scalar_one_or_none()
 
-            # TODO: figure out this, i say 'one or None', but i get back a sequence , so i still have to do '[0]' on it,
-            # i guess its better to return a sequence always so that way you aren't accidentally trying to get a index of a non sequence
-            # if it returns only one?
-            maybe_existing_fa_submission_sequence = maybe_existing_fa_submission_execute_result.one_or_none()
+            if claimed_submission_row is None:
 
-            logger.debug("Checking to see if there is a `Submission` row in the database for fa submission id `%s`, result is: `%s`",
-                submission_id, maybe_existing_fa_submission_sequence)
+                # submission was already finished, return None to let caller know to skip this one
+                logger.info("Skipping submission with the FA submission id `%s` because it was already finished in the database", submission_id)
+                return None
 
-            if maybe_existing_fa_submission_sequence:
+            logger.info("claimed submission with the FA submission id `%s`: `%s`", submission_id, claimed_submission_row)
 
-                maybe_existing_fa_submission = maybe_existing_fa_submission_sequence[0]
+            return claimed_submission_row
 
-                # there was an existing row, see if it was done already
-                if maybe_existing_fa_submission.processed_status == model.ProcessedStatus.FINISHED:
-
-                    # submission was already finished, return None to let caller know to skip this one
-                    logger.info("Skipping submission with the FA submission id `%s` because it was already started, and finished in the database: `%s`",
-                        submission_id, maybe_existing_fa_submission)
-                    return None
-
-                else:
-
-                    # there was an existing row, but it was not finished already. Set a new date, and return it
-                    logger.info("Submission with the FA submission id of `%s` was started but not finished, reusing existing submission object: `%s`",
-                        submission_id, maybe_existing_fa_submission)
-
-                    maybe_existing_fa_submission.date_visited = current_date
-                    maybe_existing_fa_submission.claimed_by = self.identity_string
-
-                    sqla_session.add(maybe_existing_fa_submission)
-
-                    return maybe_existing_fa_submission
-
-            else:
-
-                # no existing row was found, this is the expected path, create a new submission row
-
-                logger.info("Submission with the FA submission id `%s` doesn't already exist in the database, creating a new one", submission_id)
-
-                # insert the submission into the database to mark that are processing this
-                new_submission_row = db_model.Submission(
-                    furaffinity_submission_id=submission_id,
-                    date_visited=current_date,
-                    submission_status=model.SubmissionStatus.UNKNOWN,
-                    processed_status=model.ProcessedStatus.TODO,
-                    claimed_by=self.identity_string)
-
-                logger.debug("adding new submission object to db: `%s`", new_submission_row)
-
-                sqla_session.add(new_submission_row)
+    async def one_iteration(self, submission_id, aiohttp_session, sessionmaker) -> tuple[db_model.Submission|None, set[str]]:
+        '''
+        downloads and scrapes one submission, storing the webpage
 
-                return new_submission_row
+        the users found are returned instead of being written here, they get written (and the
+        submission gets marked as finished) by the user sink
 
-    async def one_iteration(self, submission_id, aiohttp_session, sessionmaker):
+        @return a tuple of the Submission row, or None if it was already finished, and the set of users found
+        '''
 
-        current_date = arrow.utcnow()
+        current_date = utils.utcnow()
 
         current_submission_row = None
 
@@ -377,7 +304,7 @@ class ScrapeUsers:
                 # if it was None, that means we have picked up a rabbit message for a submission that was started
                 # and already finished, just return here so we skip the submission
 
-                return
+                return (None, set())
 
         async with sessionmaker() as sqla_session:
 
@@ -400,6 +327,8 @@ class ScrapeUsers:
 
                 current_submission_row.submission_status = submission_status
 
+                users_found_set = set()
+
                 # if the submission does exist, save it in the database and scrape it for users
                 # if it doesn't exist, don't do anything
                 if submission_status == model.SubmissionStatus.EXISTS:
@@ -408,26 +337,23 @@ class ScrapeUsers:
 
                     users_found_set = self.scrape_html(current_fa_submission)
 
-                    # add the users to the database that we don't already have
-                    await self.update_or_ignore_found_users(users_found_set, sqla_session, current_date)
-
                     # add the submission page data
-                    self.add_webpage_data_to_db(sqla_session, current_fa_submission, current_date)
+                    await self.add_webpage_data_to_db(sqla_session, current_fa_submission, current_date)
 
                 else:
 
                     logger.info("submission doesn't exist, not searching for users")
 
-                # now mark the submission as processed
-                current_submission_row.processed_status = model.ProcessedStatus.FINISHED
                 sqla_session.add(current_submission_row)
 
-                # one with this FA submission
-                logger.info("finished with submission `%s`", current_fa_submission)
+                # the submission gets marked as finished by the user sink, in the same transaction as the users
+                logger.info("done scraping submission `%s`, it will be marked finished when the users are flushed", current_fa_submission)
                 logger.debug("committing")
 
             logger.debug("committing done")
 
+        return (current_submission_row, users_found_set)
+
 
     def return_rabbitmq_message_received_callback(self, aiohttp_session, sessionmaker):
 
@@ -445,20 +371,33 @@ class ScrapeUsers:
                 if not isinstance(submission_id, int):
                     raise Exception(f"submission id wasn't an integer? rabbitmq message was: `{message_alternate_representation}`, submission id was `{submission_id}`" )
 
-                await self.one_iteration(submission_id, aiohttp_session, self.async_sessionmaker)
+                async with self.processing_lock:
 
-                logger.debug("sleeping for `%s` second(s)", self.config.time_between_requests_seconds)
-                await asyncio.sleep(self.config.time_between_requests_seconds)
+                    if self.stop_event.is_set():
+                        logger.info("stop event is set, returning message `%s` to the queue", message_alternate_representation)
+                        await msg.reject(requeue=True)
+                        return
 
-                logger.info("acking message `%s`", message_alternate_representation)
-                await msg.ack(multiple=False)
+                    submission_row, users_found_set = await self.one_iteration(submission_id, aiohttp_session, self.async_sessionmaker)
+
+                    # the message gets acked once the users and the finished status have been written
+                    logger.debug("handing message `%s` to the user sink", message_alternate_representation)
+                    await self.user_sink.add(
+                        users_found_set=users_found_set,
+                        date_found=utils.utcnow(),
+                        submission_id=submission_row.submission_id if submission_row is not None else None,
+                        message=msg)
+
+                    logger.debug("sleeping for `%s` second(s)", self.config.time_between_requests_seconds)
+                    await asyncio.sleep(self.config.time_between_requests_seconds)
 
             except Exception as e:
                 # don't rethrow as i don't think it will bubble up to the right place anyway, set the stop event instead
                 logger.exception("Exception `%s` caught in rabbitmq_message_received processing message `%s`, nacking message, setting stop event", e, message_alternate_representation)
 
-                # nack the message
-                await msg.reject(requeue=True)
+                # nack the message, unless the user sink already did because its flush failed
+                if not msg.processed:
+                    await msg.reject(requeue=True)
 
                 self.stop_event.set()
 
@@ -486,9 +425,14 @@ class ScrapeUsers:
         logger.info("Our identity string is `%s`", self.identity_string)
 
         self.config = parsed_args.config
-        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url)
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
         self.stop_event = stop_event
 
+        self.webpage_blob_store = blob_store.create_blob_store(self.config.blob_store_settings)
+
+        if self.webpage_blob_store is not None:
+            logger.info("storing new webpages in the %s", self.webpage_blob_store.describe())
+
         # create rabbitmq stuff
         self.rabbitmq_url = self.config.rabbitmq_url
 
@@ -499,9 +443,9 @@ class ScrapeUsers:
 
         self.rabbitmq_channel = await self.rabbitmq_connection.channel()
 
-        # Maximum message count which will be
-        # processing at the same time.
-        await self.rabbitmq_channel.set_qos(prefetch_count=1)
+        # Maximum message count which will be unacked at the same time, since the
+        # user sink holds on to the messages until it flushes this needs to be at least the flush size
+        await self.rabbitmq_channel.set_qos(prefetch_count=parsed_args.user_flush_size)
 
         self.rabbitmq_queue = await self.rabbitmq_channel.get_queue(name=self.config.rabbitmq_queue_name, ensure=True)
 
@@ -518,6 +462,25 @@ class ScrapeUsers:
             async with self.sqla_engine.begin() as conn:
                 await conn.run_sync(db_model.CustomDeclarativeBase.metadata.create_all)
 
+            known_users = None
+
+            if parsed_args.use_known_user_cache:
+
+                known_users = known_user_cache.KnownUserCache(lru_size=parsed_args.known_user_cache_size)
+
+                async with self.async_sessionmaker() as sqla_session:
+                    async with sqla_session.begin():
+                        await known_users.warm(sqla_session)
+
+            self.processing_lock = asyncio.Lock()
+            self.user_sink = write_behind.UserWriteBehindSink(
+                async_sessionmaker=self.async_sessionmaker,
+                stop_event=self.stop_event,
+                flush_size=parsed_args.user_flush_size,
+                flush_interval_seconds=parsed_args.user_flush_interval_seconds,
+                known_users=known_users)
+            self.user_sink.start()
+
             cookie_dict = self.config.cookie_jar.as_aiohttp_cookie_dict()
             header_dict = self.config.header_jar.as_aiohttp_header_dict()
 
@@ -543,6 +506,10 @@ class ScrapeUsers:
                     self.time_to_wait_for_additional_messages_at_close)
                 await asyncio.sleep(self.time_to_wait_for_additional_messages_at_close)
 
+                # write out anything the sink is still holding so those messages get acked
+                logger.info("flushing the user sink")
+                await self.user_sink.stop()
+
                 logger.info("run() loop ended, stop_event was set! Returning")
 
             await self.close_stuff()
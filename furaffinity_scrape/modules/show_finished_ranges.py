@@ -0,0 +1,117 @@
+import logging
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import db_model
+from furaffinity_scrape import constants
+from furaffinity_scrape import submission_range_utils
+
+logger = logging.getLogger(__name__)
+
+class ShowFinishedRanges:
+    '''
+    logs how much of a range of submission ids has been scraped and where the gaps are, using
+    `finished_submission_range` so it doesn't have to scan fa_scrape_attempt
+    '''
+
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("show_finished_ranges")
+
+        parser.add_argument("--start",
+            dest="start",
+            type=int,
+            default=None,
+            help="the lowest submission id to look at, defaults to the lowest finished one")
+
+        parser.add_argument("--end",
+            dest="end",
+            type=int,
+            default=None,
+            help="the highest submission id to look at, defaults to the highest finished one")
+
+        parser.add_argument("--max-gaps",
+            dest="max_gaps",
+            type=int,
+            default=constants.SHOW_FINISHED_RANGES_DEFAULT_MAX_GAPS,
+            help="only log this many of the gaps")
+
+        show_finished_ranges_obj = ShowFinishedRanges()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=show_finished_ranges_obj.run)
+
+
+    def __init__(self):
+
+        self.config = None
+        self.sqla_engine = None
+        self.async_sessionmaker = None
+
+    async def run(self, parsed_args, stop_event):
+
+        self.config = parsed_args.config
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
+
+        try:
+
+            self.async_sessionmaker = sessionmaker(
+                bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
+            )
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                range_class = db_model.FinishedSubmissionRange
+
+                bounds_result = await sqla_session.execute(
+                    select(func.min(range_class.range_start), func.max(range_class.range_end), func.count()))
+                lowest_finished_id, highest_finished_id, number_of_ranges = bounds_result.one()
+
+                logger.info("`%s` finished ranges in total, from `%s` to `%s`", number_of_ranges, lowest_finished_id, highest_finished_id)
+
+                start = parsed_args.start if parsed_args.start is not None else lowest_finished_id
+                end = parsed_args.end if parsed_args.end is not None else highest_finished_id
+
+                if start is None or end is None:
+                    logger.info("nothing has been finished yet and no --start / --end was given")
+                    return
+
+                if start > end:
+                    raise Exception(f"--start `{start}` is after --end `{end}`")
+
+                finished_count, finished_percent = await submission_range_utils.SubmissionRangeUtils.get_coverage(sqla_session, start, end)
+
+                logger.info("`%s` of the `%s` submission ids from `%s` to `%s` are finished (`%.2f%%`)",
+                    finished_count, end - start + 1, start, end, finished_percent)
+
+                gap_list = await submission_range_utils.SubmissionRangeUtils.get_gaps(sqla_session, start, end)
+
+                logger.info("`%s` gaps", len(gap_list))
+
+                for iter_gap in gap_list[:parsed_args.max_gaps]:
+                    logger.info("gap: `%s` - `%s` (`%s` ids)", iter_gap.range_start, iter_gap.range_end, iter_gap.length())
+
+                if len(gap_list) > parsed_args.max_gaps:
+                    logger.info("... and `%s` more gaps", len(gap_list) - parsed_args.max_gaps)
+
+        finally:
+            await self.close_stuff()
+
+    async def close_stuff(self):
+
+        if self.sqla_engine:
+            logger.info("closing sqla engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
@@ -0,0 +1,384 @@
+import logging
+import asyncio
+import pathlib
+import json
+import time
+import concurrent.futures
+
+import bitmath
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import constants
+from furaffinity_scrape import file_utils
+
+logger = logging.getLogger(__name__)
+
+class VerifyArchive:
+    '''
+    checks the files on the storage host against `fa_scrape_content`
+
+    files are hashed with mmap on a thread pool per disk (st_dev), so every disk is kept busy
+    without a bunch of threads fighting over the same spindle, and the results are checked
+    against the database in batches
+    '''
+
+
+    @staticmethod
+    def create_subparser_command(argparse_subparser):
+        '''
+        populate the argparse arguments for this module
+
+        @param argparse_subparser - the object returned by ArgumentParser.add_subparsers()
+        that we call add_parser() on to add arguments and such
+
+        '''
+
+        parser = argparse_subparser.add_parser("verify_archive")
+
+        parser.add_argument("--folder",
+            dest="folder",
+            type=utils.isDirectoryType,
+            required=True,
+            help="the root folder of the archive, disks mounted below it get their own thread pool")
+
+        parser.add_argument("--threads-per-disk",
+            dest="threads_per_disk",
+            type=int,
+            default=constants.VERIFY_ARCHIVE_DEFAULT_THREADS_PER_DISK,
+            help="how many files to hash at once on each disk")
+
+        parser.add_argument("--batch-size",
+            dest="batch_size",
+            type=int,
+            default=constants.VERIFY_ARCHIVE_DEFAULT_BATCH_SIZE,
+            help="how many files to look up in the database at once")
+
+        parser.add_argument("--skip-missing-check",
+            dest="skip_missing_check",
+            action="store_true",
+            help="don't look for fa_scrape_content rows without a file, use this if --folder is only part of the archive")
+
+        parser.add_argument("--report-file",
+            dest="report_file",
+            type=utils.isFileType(False),
+            default=None,
+            help="if given, write every problem found to this file as json lines")
+
+        verify_archive_obj = VerifyArchive()
+
+        # set the function that is called when this command is used
+        parser.set_defaults(func_to_run=verify_archive_obj.run)
+
+
+    def __init__(self):
+
+        self.config = None
+        self.sqla_engine = None
+        self.async_sessionmaker = None
+        self.stop_event = None
+        self.problem_list = []
+        self.seen_attempt_id_set = set()
+
+    async def run(self, parsed_args, stop_event):
+
+        self.config = parsed_args.config
+        self.stop_event = stop_event
+        self.sqla_engine = utils.setup_sqlalchemy_engine(self.config.sqla_url, self.config.database_pool_settings)
+
+        executor_dict = dict()
+
+        try:
+
+            # expire_on_commit=False will prevent attributes from being expired
+            # after commit.
+            self.async_sessionmaker = sessionmaker(
+                bind=self.sqla_engine, expire_on_commit=False, class_=AsyncSession
+            )
+
+            files_by_device_dict = await asyncio.to_thread(self.get_files_by_device, parsed_args.folder)
+
+            for iter_device, iter_file_list in files_by_device_dict.items():
+                logger.info("device `%s` has `%s` files", iter_device, len(iter_file_list))
+
+                executor_dict[iter_device] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=parsed_args.threads_per_disk,
+                    thread_name_prefix=f"verify_archive_dev{iter_device}")
+
+            start_time = time.perf_counter()
+            total_bytes = await self.hash_and_check_files(files_by_device_dict, executor_dict, parsed_args)
+            elapsed_seconds = time.perf_counter() - start_time
+
+            if self.stop_event.is_set():
+                logger.info("stop event is set, not checking for missing files")
+            elif parsed_args.skip_missing_check:
+                logger.info("skipping the check for missing files")
+            else:
+                await self.check_for_missing_files(parsed_args.batch_size)
+
+            self.log_summary(total_bytes, elapsed_seconds)
+
+            if parsed_args.report_file is not None:
+                self.write_report(parsed_args.report_file)
+
+        except Exception as e:
+            logger.exception("uncaught exception")
+            await self.close_stuff(executor_dict)
+            raise e
+
+        await self.close_stuff(executor_dict)
+
+    def get_files_by_device(self, folder:pathlib.Path) -> dict[int, list[pathlib.Path]]:
+        '''
+        walks the folder and groups the archive files by the device they are on
+        '''
+
+        result_dict = dict()
+
+        for dirpath, dirnames, filenames in folder.walk(top_down=True):
+
+            # every file in a folder is on the same device as the folder
+            device = dirpath.stat().st_dev
+
+            for iter_file in filenames:
+
+                # the record index of a per record compressed warc isn't in fa_scrape_content, and
+                # partial files are a recompress_archive that is in progress or was interrupted
+                if iter_file.endswith(constants.WARC_RECORD_INDEX_SUFFIX) \
+                    or iter_file.endswith(constants.RECOMPRESS_ARCHIVE_PARTIAL_SUFFIX):
+                    continue
+
+                result_dict.setdefault(device, []).append(dirpath / iter_file)
+
+        return result_dict
+
+    def _hash_one_file(self, file_path:pathlib.Path) -> model.ArchiveFileHashResult:
+
+        file_name_match = constants.CONTENT_FILE_NAME_RE.search(file_path.name)
+        attempt_id = int(file_name_match.group(constants.CONTENT_FILE_NAME_ATTEMPT_ID_KEY)) if file_name_match else None
+
+        sha512, length = file_utils.FileUtils.sha512_and_length_of_file(file_path)
+
+        return model.ArchiveFileHashResult(
+            file_path=file_path,
+            attempt_id=attempt_id,
+            sha512=sha512,
+            length=length)
+
+    async def hash_and_check_files(
+        self,
+        files_by_device_dict:dict[int, list[pathlib.Path]],
+        executor_dict:dict[int, concurrent.futures.Executor],
+        parsed_args) -> int:
+        '''
+        keeps every disk's thread pool busy, and checks the hashes against the database
+        every time we have a full batch
+
+        @return the total number of bytes hashed
+        '''
+
+        loop = asyncio.get_running_loop()
+        total_bytes = 0
+        pending_result_list = []
+
+        # round robin the devices so the files in flight are spread across every disk
+        file_iter_dict = {iter_device: iter(iter_file_list) for iter_device, iter_file_list in files_by_device_dict.items()}
+        max_in_flight_per_device = parsed_args.threads_per_disk * 2
+        in_flight_dict = {iter_device: set() for iter_device in files_by_device_dict.keys()}
+        future_to_path_dict = dict()
+
+        while True:
+
+            if not self.stop_event.is_set():
+
+                for iter_device, iter_file_iter in file_iter_dict.items():
+
+                    while len(in_flight_dict[iter_device]) < max_in_flight_per_device:
+
+                        iter_path = next(iter_file_iter, None)
+                        if iter_path is None:
+                            break
+
+                        iter_future = loop.run_in_executor(executor_dict[iter_device], self._hash_one_file, iter_path)
+                        in_flight_dict[iter_device].add(iter_future)
+                        future_to_path_dict[iter_future] = iter_path
+
+            all_in_flight_set = set().union(*in_flight_dict.values())
+
+            if not all_in_flight_set:
+                break
+
+            done_set, _ = await asyncio.wait(all_in_flight_set, return_when=asyncio.FIRST_COMPLETED)
+
+            for iter_future in done_set:
+
+                for iter_in_flight_set in in_flight_dict.values():
+                    iter_in_flight_set.discard(iter_future)
+
+                iter_path = future_to_path_dict.pop(iter_future)
+
+                try:
+                    iter_result = iter_future.result()
+                except OSError as e:
+                    logger.error("failed to read `%s`: `%s`", iter_path, e)
+                    self.add_problem(model.ArchiveProblem(
+                        problem_type=model.ArchiveProblemType.UNREADABLE_FILE,
+                        file_path=iter_path,
+                        attempt_id=None,
+                        actual=str(e)))
+                    continue
+
+                total_bytes += iter_result.length
+                pending_result_list.append(iter_result)
+
+            if len(pending_result_list) >= parsed_args.batch_size:
+                await self.check_batch(pending_result_list)
+                pending_result_list = []
+
+        if pending_result_list:
+            await self.check_batch(pending_result_list)
+
+        return total_bytes
+
+    async def check_batch(self, hash_result_list:list[model.ArchiveFileHashResult]):
+        '''
+        looks up the fa_scrape_content rows for a batch of files in one query and compares them
+        '''
+
+        attempt_id_set = set(iter_result.attempt_id for iter_result in hash_result_list if iter_result.attempt_id is not None)
+
+        content_rows_by_attempt_id = dict()
+
+        if attempt_id_set:
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                select_statement = select(
+                        db_model.FAScrapeContent.attempt_id,
+                        db_model.FAScrapeContent.content_sha512,
+                        db_model.FAScrapeContent.content_length) \
+                    .where(db_model.FAScrapeContent.attempt_id.in_(attempt_id_set))
+
+                select_result = await sqla_session.execute(select_statement)
+
+                for iter_row in select_result.all():
+                    content_rows_by_attempt_id.setdefault(iter_row.attempt_id, []).append(iter_row)
+
+        for iter_result in hash_result_list:
+
+            content_row_list = content_rows_by_attempt_id.get(iter_result.attempt_id)
+
+            if not content_row_list:
+                self.add_problem(model.ArchiveProblem(
+                    problem_type=model.ArchiveProblemType.ORPHAN_FILE,
+                    file_path=iter_result.file_path,
+                    attempt_id=iter_result.attempt_id))
+                continue
+
+            self.seen_attempt_id_set.add(iter_result.attempt_id)
+
+            matching_row = next((iter_row for iter_row in content_row_list if iter_row.content_sha512 == iter_result.sha512), None)
+
+            if matching_row is None:
+                self.add_problem(model.ArchiveProblem(
+                    problem_type=model.ArchiveProblemType.SHA512_MISMATCH,
+                    file_path=iter_result.file_path,
+                    attempt_id=iter_result.attempt_id,
+                    expected=content_row_list[0].content_sha512,
+                    actual=iter_result.sha512))
+
+            if not any(iter_row.content_length == iter_result.length for iter_row in content_row_list):
+                self.add_problem(model.ArchiveProblem(
+                    problem_type=model.ArchiveProblemType.LENGTH_MISMATCH,
+                    file_path=iter_result.file_path,
+                    attempt_id=iter_result.attempt_id,
+                    expected=str(content_row_list[0].content_length),
+                    actual=str(iter_result.length)))
+
+        logger.info("checked `%s` files, `%s` problems so far", len(hash_result_list), len(self.problem_list))
+
+    async def check_for_missing_files(self, batch_size:int):
+        '''
+        walks fa_scrape_content in keyset order looking for rows that are stored on disk
+        but we didn't see a file for
+        '''
+
+        last_content_id = 0
+
+        while not self.stop_event.is_set():
+
+            async with self.async_sessionmaker() as sqla_session:
+
+                # content_binary is only set for the oldest rows that still have the file in the database
+                select_statement = select(
+                        db_model.FAScrapeContent.content_id,
+                        db_model.FAScrapeContent.attempt_id) \
+                    .where(db_model.FAScrapeContent.content_id > last_content_id) \
+                    .where(db_model.FAScrapeContent.content_binary == None) \
+                    .order_by(db_model.FAScrapeContent.content_id) \
+                    .limit(batch_size)
+
+                select_result = await sqla_session.execute(select_statement)
+                row_list = select_result.all()
+
+            if not row_list:
+                break
+
+            for iter_row in row_list:
+                if iter_row.attempt_id not in self.seen_attempt_id_set:
+                    self.add_problem(model.ArchiveProblem(
+                        problem_type=model.ArchiveProblemType.MISSING_FILE,
+                        file_path=None,
+                        attempt_id=iter_row.attempt_id))
+
+            last_content_id = row_list[-1].content_id
+
+    def add_problem(self, problem:model.ArchiveProblem):
+
+        logger.warning("`%s`: file `%s`, attempt `%s`, expected `%s`, got `%s`",
+            problem.problem_type.value, problem.file_path, problem.attempt_id, problem.expected, problem.actual)
+
+        self.problem_list.append(problem)
+
+    def log_summary(self, total_bytes:int, elapsed_seconds:float):
+
+        total_bytes_string = bitmath.Byte(total_bytes).best_prefix().format(constants.BITMATH_FORMATTING_STRING)
+        throughput_string = bitmath.Byte(total_bytes / elapsed_seconds if elapsed_seconds > 0 else 0) \
+            .best_prefix().format(constants.BITMATH_FORMATTING_STRING)
+
+        logger.info("hashed `%s` in `%.1f` seconds (`%s/s`)", total_bytes_string, elapsed_seconds, throughput_string)
+
+        for iter_problem_type in model.ArchiveProblemType:
+            logger.info("`%s`: `%s`", iter_problem_type.value,
+                sum(1 for iter_problem in self.problem_list if iter_problem.problem_type == iter_problem_type))
+
+    def write_report(self, report_file:pathlib.Path):
+
+        with open(report_file, "w", encoding="utf-8") as f:
+
+            for iter_problem in self.problem_list:
+                f.write(json.dumps({
+                    "problem_type": iter_problem.problem_type.value,
+                    "file_path": str(iter_problem.file_path) if iter_problem.file_path is not None else None,
+                    "attempt_id": iter_problem.attempt_id,
+                    "expected": iter_problem.expected,
+                    "actual": iter_problem.actual}))
+                f.write("\n")
+
+        logger.info("wrote `%s` problems to `%s`", len(self.problem_list), report_file)
+
+    async def close_stuff(self, executor_dict:dict[int, concurrent.futures.Executor]):
+
+        for iter_executor in executor_dict.values():
+            iter_executor.shutdown(wait=True, cancel_futures=True)
+
+        # make sure we dispose the engine because its not in an `async with` block
+
+        if self.sqla_engine:
+            logger.info("closing sqla engine")
+            await self.sqla_engine.dispose()
+            self.sqla_engine = None
@@ -0,0 +1,106 @@
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from furaffinity_scrape import constants
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_PARTITION_NAME_RE = re.compile(f"^(?:{'|'.join(constants.SUBMISSION_PARTITIONED_TABLE_NAMES)})_p[0-9]+$")
+
+class PartitionUtils:
+    '''
+    `submission` and `fa_scrape_attempt` are range partitioned by furaffinity_submission_id, with
+    `constants.SUBMISSION_PARTITION_SIZE` ids per partition and no default partition, so a partition
+    has to exist before a row for a submission id in its range can be inserted
+
+    the things that queue submission ids (populate_rabbit, queue_latest_submissions) call
+    `ensure_submission_partitions` for the ids they are about to queue, which also creates
+    `constants.SUBMISSION_PARTITIONS_AHEAD` empty partitions past them
+
+    old partitions can then be vacuumed, dumped or detached on their own
+    '''
+
+    @staticmethod
+    def get_partition_lower_bound(furaffinity_submission_id:int, partition_size:int=constants.SUBMISSION_PARTITION_SIZE) -> int:
+        '''
+        @return the (inclusive) lower bound of the partition the id goes in
+        '''
+
+        return (furaffinity_submission_id // partition_size) * partition_size
+
+    @staticmethod
+    def get_partition_name(table_name:str, lower_bound:int) -> str:
+
+        return f"{table_name}_p{lower_bound}"
+
+    @staticmethod
+    def is_submission_partition_name(table_name:str) -> bool:
+        '''
+        @return whether the table is one of the partitions made by `get_partition_name`
+        '''
+
+        return SUBMISSION_PARTITION_NAME_RE.match(table_name) is not None
+
+    @staticmethod
+    async def get_existing_partition_names(sqla_session:AsyncSession, table_name:str) -> set[str]:
+
+        select_result = await sqla_session.execute(
+            text("SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                "WHERE parent.relname = :table_name"),
+            {"table_name": table_name})
+
+        return set(select_result.scalars().all())
+
+    @staticmethod
+    async def ensure_submission_partitions(
+        sqla_session:AsyncSession,
+        lowest_submission_id:int,
+        highest_submission_id:int,
+        partitions_ahead:int=constants.SUBMISSION_PARTITIONS_AHEAD,
+        partition_size:int=constants.SUBMISSION_PARTITION_SIZE) -> list[str]:
+        '''
+        creates any missing partitions of the partitioned tables for the range of submission ids,
+        plus `partitions_ahead` more after it
+
+        the caller is in charge of the transaction, CREATE TABLE ... PARTITION OF takes a lock on the
+        parent table, so keep it short
+
+        @param sqla_session - the sqlalchemy session
+        @param lowest_submission_id - the lowest submission id that is about to be queued
+        @param highest_submission_id - the highest submission id that is about to be queued
+        @return the names of the partitions that were created
+        '''
+
+        first_lower_bound = PartitionUtils.get_partition_lower_bound(min(lowest_submission_id, highest_submission_id), partition_size)
+        last_lower_bound = PartitionUtils.get_partition_lower_bound(max(lowest_submission_id, highest_submission_id), partition_size) \
+            + partitions_ahead * partition_size
+
+        created_partition_list = []
+
+        for iter_table_name in constants.SUBMISSION_PARTITIONED_TABLE_NAMES:
+
+            existing_partition_set = await PartitionUtils.get_existing_partition_names(sqla_session, iter_table_name)
+
+            for iter_lower_bound in range(first_lower_bound, last_lower_bound + partition_size, partition_size):
+
+                partition_name = PartitionUtils.get_partition_name(iter_table_name, iter_lower_bound)
+
+                if partition_name in existing_partition_set:
+                    continue
+
+                # the bounds are ints we computed, not user input
+                await sqla_session.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS "{partition_name}" PARTITION OF "{iter_table_name}" '
+                    f'FOR VALUES FROM ({iter_lower_bound}) TO ({iter_lower_bound + partition_size})'))
+
+                logger.info("created partition `%s` for submission ids `%s` to `%s`",
+                    partition_name, iter_lower_bound, iter_lower_bound + partition_size - 1)
+
+                created_partition_list.append(partition_name)
+
+        return created_partition_list
@@ -0,0 +1,125 @@
+import logging
+import time
+
+import sqlalchemy
+from sqlalchemy import exc
+from sqlalchemy.pool import Pool, AsyncAdaptedQueuePool
+from sqlalchemy.event import listen
+
+logger = logging.getLogger(__name__)
+
+class PoolMetrics:
+    '''
+    counters for one engine's connection pool, updated by the pool event hooks
+
+    a summary is logged at most every `log_interval_seconds`, from the checkout hook so
+    there is no background task to manage, a log_interval_seconds of 0 never logs
+    '''
+
+    def __init__(self, log_interval_seconds:float):
+
+        self.log_interval_seconds = log_interval_seconds
+        self.last_log_time = time.monotonic()
+
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connections_opened = 0
+        self.invalidations = 0
+        self.peak_in_use = 0
+        self.peak_overflow = 0
+
+    def record_checkout_timeout(self):
+
+        self.checkout_timeouts += 1
+
+    def record_checkout(self, pool:AsyncAdaptedQueuePool, wait_seconds:float):
+
+        self.checkouts += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self.peak_in_use = max(self.peak_in_use, pool.checkedout())
+        self.peak_overflow = max(self.peak_overflow, pool.overflow())
+
+        if self.log_interval_seconds > 0 and time.monotonic() - self.last_log_time >= self.log_interval_seconds:
+            self.last_log_time = time.monotonic()
+            self.log_summary(pool)
+
+    def log_summary(self, pool:AsyncAdaptedQueuePool):
+
+        average_wait_ms = (self.total_wait_seconds / self.checkouts * 1000) if self.checkouts else 0.0
+
+        logger.info("connection pool: `%s` in use (peak `%s`), overflow `%s` (peak `%s`), `%s` checkouts, "
+            "wait avg `%.2f`ms / max `%.2f`ms, `%s` timeouts, `%s` connections opened, `%s` invalidated",
+            pool.checkedout(), self.peak_in_use, pool.overflow(), self.peak_overflow, self.checkouts,
+            average_wait_ms, self.max_wait_seconds * 1000, self.checkout_timeouts, self.connections_opened, self.invalidations)
+
+
+# `_do_get` is private to sqlalchemy, pyproject.toml pins the versions we checked it against, but fail at
+# startup rather than silently record nothing if it ever goes away. the base Pool has a stub that only
+# raises NotImplementedError, so it has to come from the queue pool itself
+if getattr(AsyncAdaptedQueuePool, "_do_get", None) in (None, getattr(Pool, "_do_get", None)):
+    raise Exception(f"sqlalchemy `{sqlalchemy.__version__}` has no `AsyncAdaptedQueuePool._do_get`, MeteredAsyncAdaptedQueuePool needs updating")
+
+
+class MeteredAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    '''
+    the default pool for async engines, but it times how long each checkout waits for a connection
+
+    none of the pool events fire before a checkout starts waiting, so the checkouts are recorded by
+    wrapping the private `_do_get` (see the check above), connects and invalidations are done with
+    event hooks in `register_pool_metrics`
+    '''
+
+    pool_metrics:PoolMetrics|None = None
+
+    def _do_get(self):
+
+        start_time = time.monotonic()
+
+        try:
+            connection_record = super()._do_get()
+        except exc.TimeoutError:
+            if self.pool_metrics is not None:
+                self.pool_metrics.record_checkout_timeout()
+            raise
+
+        if self.pool_metrics is not None:
+            self.pool_metrics.record_checkout(self, time.monotonic() - start_time)
+
+        return connection_record
+
+    def recreate(self):
+
+        # the pool is recreated on dispose / invalidation, keep counting into the same metrics
+        new_pool = super().recreate()
+        new_pool.pool_metrics = self.pool_metrics
+
+        return new_pool
+
+
+def register_pool_metrics(pool:MeteredAsyncAdaptedQueuePool, log_interval_seconds:float) -> PoolMetrics:
+    '''
+    attaches a PoolMetrics to the pool and the event hooks that update it
+
+    @param pool - the engine's pool, `engine.sync_engine.pool` for an async engine
+    @param log_interval_seconds - how often to log a summary, 0 to never log
+    @return the PoolMetrics, which is also at `pool.pool_metrics`
+    '''
+
+    pool_metrics = PoolMetrics(log_interval_seconds)
+    pool.pool_metrics = pool_metrics
+
+    def _on_connect(dbapi_connection, connection_record):
+        pool_metrics.connections_opened += 1
+
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.invalidations += 1
+        logger.warning("connection pool: connection invalidated because of `%s`", exception)
+
+    # `recreate()` carries these listeners over to the new pool
+    listen(pool, "connect", _on_connect)
+    listen(pool, "invalidate", _on_invalidate)
+
+    return pool_metrics
@@ -0,0 +1,111 @@
+import logging
+
+from sqlalchemy import select, update, desc, or_, and_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import insert
+
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+
+logger = logging.getLogger(__name__)
+
+# the statements that run for every message / row, built once at import time with bindparam()s
+# for everything that changes between calls
+#
+# sqlalchemy memoizes the cache key on the statement object, so executing the same object over and
+# over skips building the construct and walking it to compute the key, and goes straight to the
+# compiled cache. execute them with a dict of the bindparam names, or a list of dicts for the ones
+# that take many rows
+
+def _build_claim_submission_statement():
+
+    submission_table = db_model.Submission.__table__
+
+    insert_statement = insert(submission_table).values(
+        furaffinity_submission_id=bindparam("furaffinity_submission_id"),
+        date_visited=bindparam("date_visited"),
+        submission_status=model.SubmissionStatus.UNKNOWN,
+        processed_status=model.ProcessedStatus.TODO,
+        claimed_by=bindparam("claimed_by"))
+
+    upsert_statement = insert_statement.on_conflict_do_update(
+        index_elements=[submission_table.c.furaffinity_submission_id],
+        set_={
+            "date_visited": insert_statement.excluded.date_visited,
+            "claimed_by": insert_statement.excluded.claimed_by,
+        },
+        where=submission_table.c.processed_status != model.ProcessedStatus.FINISHED) \
+        .returning(*submission_table.c)
+
+    # an ORM insert of the Submission class executed with parameters goes through the ORM "bulk insert"
+    # path, which compiles the statement every time, so run the core upsert and have the ORM load
+    # Submission objects from what it returns instead
+    return select(db_model.Submission) \
+        .from_statement(upsert_statement) \
+        .execution_options(populate_existing=True)
+
+# see ScrapeUsers.claim_next_submission
+# params: furaffinity_submission_id, date_visited, claimed_by
+CLAIM_SUBMISSION = _build_claim_submission_statement()
+
+# see UserWriteBehindSink, execute with a list of dicts, one per user, sqlalchemy's "insertmanyvalues"
+# turns that into multi-row inserts
+# params: date_added, user_name
+INSERT_USER_IF_MISSING = insert(db_model.User.__table__) \
+    .values(
+        date_added=bindparam("date_added"),
+        user_name=bindparam("user_name")) \
+    .on_conflict_do_nothing(index_elements=[db_model.User.__table__.c.user_name]) \
+    .returning(db_model.User.__table__.c.user_name)
+
+# see SqlalchemyActor.get_latest_finished_fa_submission
+# no params
+LATEST_ATTEMPT_FURAFFINITY_SUBMISSION_ID = select(db_model.FAScrapeAttempt.furaffinity_submission_id) \
+    .order_by(desc(db_model.FAScrapeAttempt.furaffinity_submission_id)) \
+    .limit(1)
+
+def _build_claim_hole_status_statement(filter_by_run_id:bool):
+
+    hole_status_class = db_model.FuraffinityHoleStatus
+
+    claimable_select = select(hole_status_class.item_id) \
+        .where(or_(
+            hole_status_class.processed_status == model.ProcessedStatus.TODO,
+            and_(
+                hole_status_class.processed_status == model.ProcessedStatus.IN_PROGRESS,
+                hole_status_class.lease_expires < bindparam("now")))) \
+        .order_by(hole_status_class.item_id) \
+        .limit(bindparam("batch_size", type_=Integer)) \
+        .with_for_update(skip_locked=True)
+
+    if filter_by_run_id:
+        claimable_select = claimable_select.where(hole_status_class.run_id == bindparam("claim_run_id"))
+
+    return update(hole_status_class) \
+        .where(hole_status_class.item_id.in_(claimable_select)) \
+        .values(
+            processed_status=model.ProcessedStatus.IN_PROGRESS,
+            claimed_by=bindparam("identity_string"),
+            lease_expires=bindparam("new_lease_expires")) \
+        .returning(hole_status_class) \
+        .execution_options(synchronize_session=False)
+
+# see FindFaHoles.claim_batch
+# params: now, batch_size, identity_string, new_lease_expires, and claim_run_id for CLAIM_HOLE_STATUS_FOR_RUN
+#
+# sqlalchemy reserves the column names for the SET clause of an UPDATE, so none of the update
+# statements use a column name for a bindparam
+CLAIM_HOLE_STATUS = _build_claim_hole_status_statement(filter_by_run_id=False)
+CLAIM_HOLE_STATUS_FOR_RUN = _build_claim_hole_status_statement(filter_by_run_id=True)
+
+# see FindFaHoles.finish_row
+# params: claimed_item_id, identity_string, new_processed_status, new_fa_submission_status
+FINISH_HOLE_STATUS = update(db_model.FuraffinityHoleStatus) \
+    .where(db_model.FuraffinityHoleStatus.item_id == bindparam("claimed_item_id")) \
+    .where(db_model.FuraffinityHoleStatus.claimed_by == bindparam("identity_string")) \
+    .where(db_model.FuraffinityHoleStatus.processed_status == model.ProcessedStatus.IN_PROGRESS) \
+    .values(
+        processed_status=bindparam("new_processed_status"),
+        fa_submission_status=bindparam("new_fa_submission_status"),
+        claimed_by=None,
+        lease_expires=None) \
+    .execution_options(synchronize_session=False)
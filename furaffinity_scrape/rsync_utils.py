@@ -28,7 +28,11 @@ class RsyncUtils:
         # --itemize-changes --stats --mkpath  hello
         #  fascrape@73.109.220.3:/9/a/b/hello
 
-        src_file_to_transfer = wget_dl_result.compressed_warc_file_path
+        src_files_to_transfer = [wget_dl_result.compressed_warc_file_path]
+
+        # per record compressed warcs have a sidecar index that needs to go along with it
+        if wget_dl_result.record_index_file_path is not None:
+            src_files_to_transfer.append(wget_dl_result.record_index_file_path)
 
         remote_sha_folder_name = fa_scrape_content.content_sha512[0:3]
         remote_file_name = f"fascrape_content_cid-{fa_scrape_content.content_id}_aid-{fa_scrape_content.attempt_id}.tar.xz"
@@ -52,7 +56,7 @@ class RsyncUtils:
             "--rsync-path",
             "/usr/bin/rsync",
             "-vvv",
-            src_file_to_transfer,
+            *src_files_to_transfer,
             f"{rsync_settings.ssh_username}@{rsync_settings.ssh_host}:{remote_full_path_to_copy_to}/"
             ]
 
@@ -0,0 +1,104 @@
+import logging
+
+from sqlalchemy import select, func
+
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+
+logger = logging.getLogger(__name__)
+
+class SubmissionRangeUtils:
+    '''
+    reads and writes `finished_submission_range`, the finished furaffinity submission ids stored as
+    merged ranges
+
+    the functions take anything with an async `execute()`, so either an AsyncSession or an AsyncConnection
+    '''
+
+    @staticmethod
+    def ids_to_ranges(submission_id_iterable) -> list[model.SubmissionIdRange]:
+        '''
+        collapses submission ids into sorted runs of consecutive ids
+        '''
+
+        range_list = []
+
+        for iter_id in sorted(set(submission_id_iterable)):
+
+            if range_list and range_list[-1].range_end == iter_id - 1:
+                range_list[-1] = model.SubmissionIdRange(range_start=range_list[-1].range_start, range_end=iter_id)
+            else:
+                range_list.append(model.SubmissionIdRange(range_start=iter_id, range_end=iter_id))
+
+        return range_list
+
+    @staticmethod
+    async def mark_finished(sqla_executor, submission_id_iterable):
+        '''
+        adds the ids to the finished ranges, call this in the same transaction that finishes the attempts
+        so they can't disagree
+        '''
+
+        for iter_range in SubmissionRangeUtils.ids_to_ranges(submission_id_iterable):
+
+            await sqla_executor.execute(select(func.merge_finished_submission_range(iter_range.range_start, iter_range.range_end)))
+
+    @staticmethod
+    async def get_ranges(sqla_executor, lowest_submission_id:int, highest_submission_id:int) -> list[model.SubmissionIdRange]:
+        '''
+        @return the finished ranges that overlap [lowest_submission_id, highest_submission_id], clipped to it
+        '''
+
+        range_class = db_model.FinishedSubmissionRange
+
+        select_statement = select(range_class.range_start, range_class.range_end) \
+            .where(range_class.range_end >= lowest_submission_id) \
+            .where(range_class.range_start <= highest_submission_id) \
+            .order_by(range_class.range_start)
+
+        select_result = await sqla_executor.execute(select_statement)
+
+        return [model.SubmissionIdRange(
+                range_start=max(iter_row.range_start, lowest_submission_id),
+                range_end=min(iter_row.range_end, highest_submission_id))
+            for iter_row in select_result.all()]
+
+    @staticmethod
+    async def is_finished(sqla_executor, submission_id:int) -> bool:
+
+        return len(await SubmissionRangeUtils.get_ranges(sqla_executor, submission_id, submission_id)) > 0
+
+    @staticmethod
+    async def get_gaps(sqla_executor, lowest_submission_id:int, highest_submission_id:int) -> list[model.SubmissionIdRange]:
+        '''
+        @return the ranges of ids in [lowest_submission_id, highest_submission_id] that aren't finished
+        '''
+
+        gap_list = []
+        next_unfinished_id = lowest_submission_id
+
+        for iter_range in await SubmissionRangeUtils.get_ranges(sqla_executor, lowest_submission_id, highest_submission_id):
+
+            if iter_range.range_start > next_unfinished_id:
+                gap_list.append(model.SubmissionIdRange(range_start=next_unfinished_id, range_end=iter_range.range_start - 1))
+
+            next_unfinished_id = iter_range.range_end + 1
+
+        if next_unfinished_id <= highest_submission_id:
+            gap_list.append(model.SubmissionIdRange(range_start=next_unfinished_id, range_end=highest_submission_id))
+
+        return gap_list
+
+    @staticmethod
+    async def get_coverage(sqla_executor, lowest_submission_id:int, highest_submission_id:int) -> tuple[int, float]:
+        '''
+        @return a tuple of the number of finished ids in [lowest_submission_id, highest_submission_id] and
+        the percentage of the range that is
+        '''
+
+        range_list = await SubmissionRangeUtils.get_ranges(sqla_executor, lowest_submission_id, highest_submission_id)
+
+        finished_count = sum(iter_range.length() for iter_range in range_list)
+        total_count = highest_submission_id - lowest_submission_id + 1
+
+        return (finished_count, finished_count / total_count * 100)
@@ -10,6 +10,7 @@ import asyncio
 import subprocess
 import socket
 import os
+import datetime
 from logging.handlers import TimedRotatingFileHandler
 
 import yarl
@@ -25,6 +26,7 @@ from furaffinity_scrape import constants
 from furaffinity_scrape.constants import HoconTypesEnum
 
 from furaffinity_scrape import model
+from furaffinity_scrape import pool_metrics
 import importlib.metadata
 
 logger = logging.getLogger(__name__)
@@ -220,6 +222,24 @@ def _get_key_or_throw(conf_obj, key, type:HoconTypesEnum):
         raise Exception(
             f"Unable to get the key `{key}`, using the type `{type}` from the config because of: `{e}`") from e
 
+def _get_key_or_default(conf_obj, key, type:HoconTypesEnum, default):
+    '''
+    returns the value at the hocon config for the given key, or the default
+    if the key isn't in the config at all, used for settings that were added
+    after existing configs were deployed
+
+    @param conf_obj the config object (probably the root object)
+    @param key - the key we want from the conf_obj
+    @param type - a member of HoconTypesEnum of what type we want are expecting
+    out of the config
+    @param default - the value to return if the key is missing
+    '''
+
+    if key not in conf_obj:
+        return default
+
+    return _get_key_or_throw(conf_obj, key, type)
+
 def parse_config(stringArg):
     ''' parse the config into our settings object
 
@@ -266,6 +286,7 @@ def parse_config(stringArg):
         # FIXME: update all of these where i use array indexing to instead use _get_key_or_throw
         db_config_key = f"{constants.HOCON_CONFIG_TOP_LEVEL_KEY}.{constants.HOCON_CONFIG_DATABASE_GROUP}"
         sqla_url = get_sqlalchemy_url_from_hocon_config(conf_obj[db_config_key])
+        database_pool_settings = get_database_pool_settings_from_hocon_config(conf_obj[db_config_key])
 
         logging_dict_key = f"{constants.HOCON_CONFIG_TOP_LEVEL_KEY}.{constants.HOCON_CONFIG_LOGGING_DICT_KEY}"
         logging_dict = _get_key_or_throw(conf_obj, logging_dict_key, HoconTypesEnum.CONFIG)
@@ -304,12 +325,21 @@ def parse_config(stringArg):
         queue_latest_submissions_group_obj = _get_key_or_throw(conf_obj, queue_latest_submission_group_key, HoconTypesEnum.CONFIG)
         queue_latest_submission_settings = get_queue_latest_submission_settings(queue_latest_submissions_group_obj)
 
+        warc_compression_format_key = f"{constants.HOCON_CONFIG_TOP_LEVEL_KEY}.{constants.HOCON_CONFIG_WARC_COMPRESSION_FORMAT}"
+        warc_compression_format = model.WarcCompressionFormat(_get_key_or_default(
+            conf_obj, warc_compression_format_key, HoconTypesEnum.STRING, model.WarcCompressionFormat.SEVENZIP.value))
+
+        blob_store_key = f"{constants.HOCON_CONFIG_TOP_LEVEL_KEY}.{constants.HOCON_CONFIG_KEY_BLOB_STORE_GROUP}"
+        blob_store_settings = get_blob_store_settings_from_hocon_config(
+            _get_key_or_default(conf_obj, blob_store_key, HoconTypesEnum.CONFIG, pyhocon.ConfigTree()))
+
         # return final settings
         return model.Settings(
             time_between_requests_seconds=sleep_time_seconds,
             cookie_jar=cookie_jar,
             header_jar=header_jar,
             sqla_url=sqla_url,
+            database_pool_settings=database_pool_settings,
             logging_config=logging_dict,
             rabbitmq_url=rabbitmq_url,
             rabbitmq_queue_name=rabbitmq_queue_name,
@@ -324,7 +354,9 @@ def parse_config(stringArg):
             rsync_settings=rsync_settings,
             operator_name=operator_name,
             user_agent=user_agent,
-            queue_latest_submissions_settings=queue_latest_submission_settings)
+            queue_latest_submissions_settings=queue_latest_submission_settings,
+            warc_compression_format=warc_compression_format,
+            blob_store_settings=blob_store_settings)
 
     except Exception as e:
         raise argparse.ArgumentTypeError(f"Failed to parse the config: `{e}`")
@@ -470,6 +502,51 @@ def get_rsync_settings_from_hocon_config(config:pyhocon.ConfigTree) -> model.Rsy
 
     return rsync_settings
 
+def get_database_pool_settings_from_hocon_config(config:pyhocon.ConfigTree) -> model.DatabasePoolSettings:
+    '''
+    reads the optional `pool` group inside of the database group, every key in it is optional and
+    defaults to what sqlalchemy / asyncpg would use
+
+    @param config - the database group of the config
+    '''
+
+    pool_key = constants.HOCON_CONFIG_KEY_DATABASE_POOL_GROUP
+
+    return model.DatabasePoolSettings(
+        pool_size=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_SIZE}",
+            HoconTypesEnum.INT, constants.DATABASE_POOL_DEFAULT_SIZE),
+        max_overflow=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_MAX_OVERFLOW}",
+            HoconTypesEnum.INT, constants.DATABASE_POOL_DEFAULT_MAX_OVERFLOW),
+        pool_timeout_seconds=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_TIMEOUT_SECONDS}",
+            HoconTypesEnum.FLOAT, constants.DATABASE_POOL_DEFAULT_TIMEOUT_SECONDS),
+        pool_pre_ping=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_PRE_PING}",
+            HoconTypesEnum.BOOLEAN, constants.DATABASE_POOL_DEFAULT_PRE_PING),
+        pool_recycle_seconds=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_RECYCLE_SECONDS}",
+            HoconTypesEnum.INT, constants.DATABASE_POOL_DEFAULT_RECYCLE_SECONDS),
+        prepared_statement_cache_size=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_PREPARED_STATEMENT_CACHE_SIZE}",
+            HoconTypesEnum.INT, constants.DATABASE_POOL_DEFAULT_PREPARED_STATEMENT_CACHE_SIZE),
+        statement_cache_size=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_STATEMENT_CACHE_SIZE}",
+            HoconTypesEnum.INT, constants.DATABASE_POOL_DEFAULT_STATEMENT_CACHE_SIZE),
+        metrics_log_interval_seconds=_get_key_or_default(config, f"{pool_key}.{constants.HOCON_CONFIG_KEY_DATABASE_POOL_METRICS_LOG_INTERVAL_SECONDS}",
+            HoconTypesEnum.FLOAT, constants.DATABASE_POOL_DEFAULT_METRICS_LOG_INTERVAL_SECONDS))
+
+def get_blob_store_settings_from_hocon_config(config:pyhocon.ConfigTree) -> model.BlobStoreSettings:
+    '''
+    reads the optional `blob_store` group, with nothing in it the webpages stay in the database
+
+    @param config - the blob_store group of the config
+    '''
+
+    store_type = model.BlobStoreType(_get_key_or_default(config, constants.HOCON_CONFIG_KEY_BLOB_STORE_TYPE,
+        HoconTypesEnum.STRING, model.BlobStoreType.DATABASE.value))
+
+    local_folder = None
+
+    if store_type == model.BlobStoreType.LOCAL_FILESYSTEM:
+        local_folder = pathlib.Path(_get_key_or_throw(config, constants.HOCON_CONFIG_KEY_BLOB_STORE_LOCAL_FOLDER, HoconTypesEnum.STRING))
+
+    return model.BlobStoreSettings(store_type=store_type, local_folder=local_folder)
+
 def get_sqlalchemy_url_from_hocon_config(config:pyhocon.ConfigTree) -> URL:
 
     driver = _get_key_or_throw(config, constants.HOCON_CONFIG_KEY_DATABASE_DRIVER, HoconTypesEnum.STRING)
@@ -513,21 +590,46 @@ def sqlalchemy_pool_on_connect_listener(dbapi_connection, connection_record):
     wal_result = dbapi_connection.execute("PRAGMA journal_mode")
     logger.debug("sqlalchemy_pool_on_connect_listener: it is now: `%s`", wal_result.fetchone())
 
-def setup_sqlalchemy_engine(sqla_url:URL) -> sqlalchemy.ext.asyncio.AsyncEngine:
+def setup_sqlalchemy_engine(
+    sqla_url:URL,
+    pool_settings:model.DatabasePoolSettings|None=None) -> sqlalchemy.ext.asyncio.AsyncEngine:
     '''
     method to set up the sqlalchemy engine
 
     this can be overridden in a subclass to configure the engine further
 
+    @param sqla_url - the url to connect to
+    @param pool_settings - the pool settings from the config, or None for the sqlalchemy defaults
     @return a sqlalchemy.ext.asyncio.AsyncEngine instance
     '''
 
     # use repr so it doesn't log the password
-    logger.info("creating engine using url: `%s`", repr(sqla_url))
+    logger.info("creating engine using url: `%s`, pool settings: `%s`", repr(sqla_url), pool_settings)
+
+    engine_kwargs = dict()
+
+    if pool_settings is not None:
+
+        engine_kwargs["poolclass"] = pool_metrics.MeteredAsyncAdaptedQueuePool
+        engine_kwargs["pool_size"] = pool_settings.pool_size
+        engine_kwargs["max_overflow"] = pool_settings.max_overflow
+        engine_kwargs["pool_timeout"] = pool_settings.pool_timeout_seconds
+        engine_kwargs["pool_pre_ping"] = pool_settings.pool_pre_ping
+        engine_kwargs["pool_recycle"] = pool_settings.pool_recycle_seconds
+
+        # these are DBAPI arguments that only the asyncpg driver knows about
+        if sqla_url.get_driver_name() == "asyncpg":
+            engine_kwargs["connect_args"] = {
+                "prepared_statement_cache_size": pool_settings.prepared_statement_cache_size,
+                "statement_cache_size": pool_settings.statement_cache_size,
+            }
 
     # lets support sqlalchemy 2.0 for future proofing
     # see https://docs.sqlalchemy.org/en/14/changelog/migration_20.html
-    result_engine = create_async_engine(sqla_url, echo=False, future=True)
+    result_engine = create_async_engine(sqla_url, echo=False, future=True, **engine_kwargs)
+
+    if pool_settings is not None:
+        pool_metrics.register_pool_metrics(result_engine.sync_engine.pool, pool_settings.metrics_log_interval_seconds)
 
     # attach a listener to the pool
     # see https://docs.sqlalchemy.org/en/13/core/event.html
@@ -536,18 +638,57 @@ def setup_sqlalchemy_engine(sqla_url:URL) -> sqlalchemy.ext.asyncio.AsyncEngine:
 
     return result_engine
 
-def compress_and_hash_text_data(binary_data:bytes) -> model.CompressAndHashResult:
+def utcnow() -> datetime.datetime:
+    '''
+    returns the current time as a timezone aware datetime in UTC
+
+    this is what the `DateTime(timezone=True)` columns take and give back, arrow is only for
+    formatting dates, not for values that go to or come from the database
+    '''
+
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def sha512_hexdigest(binary_data:bytes) -> str:
+    '''
+    returns the sha512 of the data as a hex string
+    '''
+
+    hasher = hashlib.sha512()
+    hasher.update(binary_data)
+    return hasher.hexdigest()
+
+def sha512_file_hexdigest(file_path:pathlib.Path) -> str:
+    '''
+    returns the sha512 of a file as a hex string, reading it in chunks
+
+    this is blocking, so call it with `asyncio.to_thread()` from async code
+    '''
+
+    hasher = hashlib.sha512()
+
+    with open(file_path, "rb") as f:
+        while True:
+            iter_data = f.read(constants.WARC_RECORD_READ_CHUNK_SIZE)
+
+            if not iter_data:
+                break
+
+            hasher.update(iter_data)
+
+    return hasher.hexdigest()
+
+def compress_and_hash_text_data(binary_data:bytes, original_sha512:str|None=None) -> model.CompressAndHashResult:
     '''
     compresses and hashes a string value into a tar.xz (LZMA) file
 
     @param binary_data - the binary data to compress
+    @param original_sha512 - the sha512 of binary_data if the caller already computed it
     @returns a model.CompressAndHashResult object
     '''
 
-    hasher = hashlib.sha512()
+    if original_sha512 is None:
+        original_sha512 = sha512_hexdigest(binary_data)
 
-    hasher.update(binary_data)
-    original_sha512 = hasher.hexdigest()
     logger.debug("compressing bytes of length `%s` to tar.xz (LZMA), sha512: `%s`", len(binary_data), original_sha512)
 
     binary_data_fileobj = io.BytesIO()
@@ -567,9 +708,7 @@ def compress_and_hash_text_data(binary_data:bytes) -> model.CompressAndHashResul
 
     final_bytes = tar_fileobj.getvalue()
 
-    hasher = hashlib.sha512()
-    hasher.update(final_bytes)
-    compressed_sha512 = hasher.hexdigest()
+    compressed_sha512 = sha512_hexdigest(final_bytes)
 
     logger.debug("final .tar.xz file is `%s` bytes, sha512: `%s`", len(final_bytes), compressed_sha512)
 
@@ -0,0 +1,289 @@
+import logging
+import pathlib
+import typing
+import json
+import zlib
+
+import zstandard
+
+from furaffinity_scrape import model
+from furaffinity_scrape import constants
+
+logger = logging.getLogger(__name__)
+
+class WarcUtils:
+    '''
+    helpers for writing and reading WARC files where every record is its own compressed
+    gzip member / zstd frame (the standard `.warc.gz` / `.warc.zst` layout)
+
+    unlike the solid 7z archive, a single record can be read back by seeking to its offset
+    and only decompressing that one member, the offsets are recorded at write time in a
+    sidecar jsonl index file
+    '''
+
+    @staticmethod
+    def get_per_record_compressed_suffix(compression_format:model.WarcCompressionFormat) -> str:
+        '''
+        returns the file suffix that gets appended to the `.warc` file name for the given format
+        '''
+
+        if compression_format == model.WarcCompressionFormat.WARC_GZ:
+            return constants.WARC_GZ_SUFFIX
+        elif compression_format == model.WarcCompressionFormat.WARC_ZST:
+            return constants.WARC_ZST_SUFFIX
+        else:
+            raise Exception(f"compression format `{compression_format}` is not a per record compression format")
+
+    @staticmethod
+    def get_compression_format_for_path(path:pathlib.Path) -> model.WarcCompressionFormat|None:
+        '''
+        returns the per record compression format based on the file name, or None if the file
+        isn't a per record compressed warc
+        '''
+
+        if path.name.endswith(constants.WARC_FILE_SUFFIX + constants.WARC_GZ_SUFFIX):
+            return model.WarcCompressionFormat.WARC_GZ
+        elif path.name.endswith(constants.WARC_FILE_SUFFIX + constants.WARC_ZST_SUFFIX):
+            return model.WarcCompressionFormat.WARC_ZST
+
+        return None
+
+    @staticmethod
+    def get_record_index_path(compressed_warc_path:pathlib.Path) -> pathlib.Path:
+        '''
+        returns the path of the sidecar index file for a per record compressed warc
+        '''
+
+        return compressed_warc_path.with_name(compressed_warc_path.name + constants.WARC_RECORD_INDEX_SUFFIX)
+
+    @staticmethod
+    def has_record_index(compressed_warc_path:pathlib.Path) -> bool:
+
+        if WarcUtils.get_compression_format_for_path(compressed_warc_path) is None:
+            return False
+
+        return WarcUtils.get_record_index_path(compressed_warc_path).exists()
+
+    @staticmethod
+    def _create_compressor(compression_format:model.WarcCompressionFormat):
+        '''
+        returns a new object with `compress()` and `flush()` methods that produces
+        exactly one gzip member / zstd frame
+        '''
+
+        if compression_format == model.WarcCompressionFormat.WARC_GZ:
+            # wbits of 16 + MAX_WBITS makes zlib write a gzip header and trailer
+            return zlib.compressobj(constants.WARC_GZIP_COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif compression_format == model.WarcCompressionFormat.WARC_ZST:
+            return zstandard.ZstdCompressor(level=constants.WARC_ZSTD_COMPRESSION_LEVEL).compressobj()
+        else:
+            raise Exception(f"compression format `{compression_format}` is not a per record compression format")
+
+    @staticmethod
+    def decompress_member(compression_format:model.WarcCompressionFormat, data:bytes) -> bytes:
+        '''
+        decompresses a single gzip member / zstd frame
+        '''
+
+        if compression_format == model.WarcCompressionFormat.WARC_GZ:
+            return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+        elif compression_format == model.WarcCompressionFormat.WARC_ZST:
+            # the frames are written with a streaming compressor so they don't have the content
+            # size in the frame header, which means we have to use decompressobj() here
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        else:
+            raise Exception(f"compression format `{compression_format}` is not a per record compression format")
+
+    @staticmethod
+    def _read_record_header(fileobj:typing.BinaryIO) -> tuple[bytes, dict]|None:
+        '''
+        reads the header of the next WARC record, including the `WARC/1.1` version line
+        and the blank line that ends the header
+
+        @return a tuple of the raw header bytes and a dict of the headers with lowercase keys,
+        or None if we are at the end of the file
+        '''
+
+        version_line = fileobj.readline()
+
+        # skip any stray blank lines between records
+        while version_line in (b"\r\n", b"\n"):
+            version_line = fileobj.readline()
+
+        if not version_line:
+            return None
+
+        if not version_line.startswith(b"WARC/"):
+            raise Exception(f"expected a WARC version line at offset `{fileobj.tell() - len(version_line)}` but got `{version_line[:64]}`")
+
+        raw_header = bytearray(version_line)
+        header_dict = dict()
+
+        while True:
+            iter_line = fileobj.readline()
+
+            if not iter_line:
+                raise Exception("unexpected end of file while reading WARC record header")
+
+            raw_header.extend(iter_line)
+
+            if iter_line in (b"\r\n", b"\n"):
+                break
+
+            key, sep, value = iter_line.decode("utf-8").partition(":")
+            if not sep:
+                logger.debug("skipping invalid WARC header line `%s`", iter_line)
+                continue
+
+            header_dict[key.strip().lower()] = value.strip()
+
+        return (bytes(raw_header), header_dict)
+
+    @staticmethod
+    def write_per_record_compressed_warc(
+        warc_file_path:pathlib.Path,
+        compressed_warc_file_path:pathlib.Path,
+        compression_format:model.WarcCompressionFormat) -> list[model.WarcRecordIndexEntry]:
+        '''
+        reads an uncompressed WARC file and writes it back out where every record is
+        compressed on its own
+
+        this is blocking, so call it with `asyncio.to_thread()`
+
+        @param warc_file_path - the uncompressed warc file that wget wrote
+        @param compressed_warc_file_path - where to write the per record compressed warc
+        @param compression_format - either WARC_GZ or WARC_ZST
+        @return a list of WarcRecordIndexEntry, one for every record, in file order
+        '''
+
+        index_entry_list = []
+
+        with open(warc_file_path, "rb") as in_fileobj, open(compressed_warc_file_path, "wb") as out_fileobj:
+
+            while True:
+
+                header_result = WarcUtils._read_record_header(in_fileobj)
+
+                if header_result is None:
+                    break
+
+                raw_header, header_dict = header_result
+                content_length = int(header_dict[constants.WARC_HEADER_CONTENT_LENGTH])
+
+                record_offset = out_fileobj.tell()
+                compressor = WarcUtils._create_compressor(compression_format)
+
+                out_fileobj.write(compressor.compress(raw_header))
+
+                # stream the block through the compressor so large images don't have
+                # to be held in memory all at once
+                bytes_left = content_length
+                while bytes_left > 0:
+                    iter_data = in_fileobj.read(min(bytes_left, constants.WARC_RECORD_READ_CHUNK_SIZE))
+
+                    if not iter_data:
+                        raise Exception(f"unexpected end of file while reading the block of WARC record `{header_dict.get(constants.WARC_HEADER_RECORD_ID)}`")
+
+                    out_fileobj.write(compressor.compress(iter_data))
+                    bytes_left -= len(iter_data)
+
+                # every record ends with two CRLFs that aren't part of the block
+                record_trailer = in_fileobj.read(len(constants.WARC_RECORD_TRAILER))
+                if record_trailer != constants.WARC_RECORD_TRAILER:
+                    raise Exception(f"WARC record `{header_dict.get(constants.WARC_HEADER_RECORD_ID)}` did not end with the expected trailer, got `{record_trailer}`")
+
+                out_fileobj.write(compressor.compress(record_trailer))
+                out_fileobj.write(compressor.flush())
+
+                index_entry = model.WarcRecordIndexEntry(
+                    offset=record_offset,
+                    length=out_fileobj.tell() - record_offset,
+                    warc_record_id=header_dict.get(constants.WARC_HEADER_RECORD_ID),
+                    warc_type=header_dict.get(constants.WARC_HEADER_TYPE),
+                    content_type=header_dict.get(constants.WARC_HEADER_CONTENT_TYPE),
+                    warc_target_uri=header_dict.get(constants.WARC_HEADER_TARGET_URI))
+
+                index_entry_list.append(index_entry)
+
+        logger.debug("wrote `%s` records to `%s`", len(index_entry_list), compressed_warc_file_path)
+
+        return index_entry_list
+
+    @staticmethod
+    def write_record_index(index_file_path:pathlib.Path, index_entry_list:list[model.WarcRecordIndexEntry]):
+        '''
+        writes the record offsets as json lines, one record per line
+        '''
+
+        with open(index_file_path, "w", encoding="utf-8") as f:
+
+            for iter_entry in index_entry_list:
+                f.write(json.dumps([
+                    iter_entry.offset,
+                    iter_entry.length,
+                    iter_entry.warc_record_id,
+                    iter_entry.warc_type,
+                    iter_entry.content_type,
+                    iter_entry.warc_target_uri]))
+                f.write("\n")
+
+    @staticmethod
+    def read_record_index(index_file_path:pathlib.Path) -> list[model.WarcRecordIndexEntry]:
+
+        result_list = []
+
+        with open(index_file_path, "r", encoding="utf-8") as f:
+
+            for iter_line in f:
+
+                if not iter_line.strip():
+                    continue
+
+                json_line = json.loads(iter_line)
+                result_list.append(model.WarcRecordIndexEntry(
+                    offset=json_line[0],
+                    length=json_line[1],
+                    warc_record_id=json_line[2],
+                    warc_type=json_line[3],
+                    content_type=json_line[4],
+                    warc_target_uri=json_line[5]))
+
+        return result_list
+
+    @staticmethod
+    def read_record(compressed_warc_file_path:pathlib.Path, index_entry:model.WarcRecordIndexEntry) -> model.WarcRecord:
+        '''
+        seeks to a single record and decompresses only that member
+
+        this is blocking, so call it with `asyncio.to_thread()`
+
+        @param compressed_warc_file_path - the `.warc.gz` / `.warc.zst` file
+        @param index_entry - the entry from the sidecar index for the record we want
+        @return a WarcRecord with the headers and the block
+        '''
+
+        compression_format = WarcUtils.get_compression_format_for_path(compressed_warc_file_path)
+
+        if compression_format is None:
+            raise Exception(f"`{compressed_warc_file_path}` is not a per record compressed warc file")
+
+        with open(compressed_warc_file_path, "rb") as f:
+            f.seek(index_entry.offset)
+            compressed_member = f.read(index_entry.length)
+
+        record_bytes = WarcUtils.decompress_member(compression_format, compressed_member)
+
+        header_end = record_bytes.find(b"\r\n\r\n")
+        if header_end == -1:
+            raise Exception(f"could not find the end of the header for record `{index_entry}`")
+
+        header_dict = dict()
+        for iter_line in record_bytes[:header_end].decode("utf-8").split("\r\n")[1:]:
+            key, sep, value = iter_line.partition(":")
+            if sep:
+                header_dict[key.strip().lower()] = value.strip()
+
+        block_start = header_end + 4
+        block_end = block_start + int(header_dict[constants.WARC_HEADER_CONTENT_LENGTH])
+
+        return model.WarcRecord(headers=header_dict, block=record_bytes[block_start:block_end])
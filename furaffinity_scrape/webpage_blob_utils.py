@@ -0,0 +1,266 @@
+import logging
+import datetime
+
+from sqlalchemy import Row, select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import utils
+from furaffinity_scrape import compression_utils
+from furaffinity_scrape import blob_store
+
+logger = logging.getLogger(__name__)
+
+class WebpageBlobUtils:
+    '''
+    dedup-on-write for the compressed submission webpages
+
+    the identical page gets scraped more than once (re-queued messages, re-crawls), so instead of
+    compressing and storing it again, we look up the sha512 of the original data in
+    `submission_webpage_blob` first, and if it is there, the new `submission_webpage` row
+    just references the existing blob and we bump its reference count
+
+    if a blob store is configured, new blobs are written there (keyed by the compressed sha512) and
+    the row only keeps the hashes, so queries on the webpage tables don't drag the pages along
+    '''
+
+    @staticmethod
+    async def _add_reference_to_existing_blob(
+        sqla_session:AsyncSession,
+        original_data_sha512:str) -> Row|None:
+        '''
+        increments the reference count of the blob with the given original sha512
+
+        @return a row with `blob_id` and `compressed_data_sha512`, or None if there is no such blob
+        '''
+
+        blob_table = db_model.SubmissionWebpageBlob.__table__
+
+        update_statement = update(blob_table) \
+            .where(blob_table.c.original_data_sha512 == original_data_sha512) \
+            .values(reference_count=blob_table.c.reference_count + 1) \
+            .returning(blob_table.c.blob_id, blob_table.c.compressed_data_sha512)
+
+        update_result = await sqla_session.execute(update_statement)
+
+        return update_result.one_or_none()
+
+    @staticmethod
+    async def _insert_new_blob(
+        sqla_session:AsyncSession,
+        compress_and_hash_result:model.CompressAndHashResult,
+        date_added:datetime.datetime,
+        webpage_blob_store:blob_store.BlobStore|None) -> Row:
+        '''
+        inserts a new blob with a reference count of 1
+
+        with a blob store, the data is put there before the row is inserted, so a committed row always
+        has its data. if the transaction rolls back, the file is just unreferenced, and since it is keyed
+        by its hash the next time the same page is stored it is reused
+
+        if another worker inserted the same page in the meantime, the "on conflict do update" just
+        increments the reference count of that blob instead so nobody fails
+
+        @return a row with `blob_id` and `compressed_data_sha512`
+        '''
+
+        blob_table = db_model.SubmissionWebpageBlob.__table__
+
+        if webpage_blob_store is not None:
+
+            await webpage_blob_store.put(compress_and_hash_result.compressed_data_sha512, compress_and_hash_result.compressed_data)
+
+            raw_compressed_webpage_data = None
+            storage_location = model.BlobStorageLocation.BLOB_STORE
+
+        else:
+
+            raw_compressed_webpage_data = compress_and_hash_result.compressed_data
+            storage_location = model.BlobStorageLocation.DATABASE
+
+        insert_statement = insert(blob_table).values(
+            date_added=date_added,
+            original_data_sha512=compress_and_hash_result.original_data_sha512,
+            compressed_data_sha512=compress_and_hash_result.compressed_data_sha512,
+            raw_compressed_webpage_data=raw_compressed_webpage_data,
+            compression_scheme=model.CompressionScheme.TAR_XZ,
+            storage_location=storage_location,
+            reference_count=1)
+
+        upsert_statement = insert_statement.on_conflict_do_update(
+            index_elements=[blob_table.c.original_data_sha512],
+            set_={"reference_count": blob_table.c.reference_count + 1}) \
+            .returning(blob_table.c.blob_id, blob_table.c.compressed_data_sha512)
+
+        upsert_result = await sqla_session.execute(upsert_statement)
+
+        return upsert_result.one()
+
+    @staticmethod
+    async def add_submission_webpage(
+        sqla_session:AsyncSession,
+        submission_row:db_model.Submission,
+        raw_html_bytes:bytes,
+        did_have_decode_error:bool,
+        date_visited:datetime.datetime,
+        webpage_blob_store:blob_store.BlobStore|None=None) -> db_model.SubmissionWebpage:
+        '''
+        adds a new `submission_webpage` row for the given page, only compressing and storing the page
+        if we haven't seen identical data before
+
+        this needs to be called inside of a transaction
+
+        @param sqla_session - the sqlalchemy session
+        @param submission_row - the Submission the page belongs to
+        @param raw_html_bytes - the uncompressed page
+        @param did_have_decode_error - whether the page had a unicode decode error
+        @param date_visited - the current date, see utils.utcnow()
+        @param webpage_blob_store - where to put new blobs, or None to store them in the database
+        @return the new SubmissionWebpage, already added to the session
+        '''
+
+        original_data_sha512 = utils.sha512_hexdigest(raw_html_bytes)
+
+        blob_row = await WebpageBlobUtils._add_reference_to_existing_blob(sqla_session, original_data_sha512)
+
+        if blob_row is not None:
+
+            logger.info("webpage with sha512 `%s` is already stored as blob `%s`, adding a reference instead of storing it again",
+                original_data_sha512, blob_row.blob_id)
+
+        else:
+
+            compress_and_hash_result = utils.compress_and_hash_text_data(raw_html_bytes, original_data_sha512)
+
+            blob_row = await WebpageBlobUtils._insert_new_blob(sqla_session, compress_and_hash_result, date_visited, webpage_blob_store)
+
+            logger.debug("stored webpage with sha512 `%s` as blob `%s`", original_data_sha512, blob_row.blob_id)
+
+        submission_wp = db_model.SubmissionWebpage(
+            date_visited=date_visited,
+            submission=submission_row,
+            raw_compressed_webpage_data=None,
+            blob_id=blob_row.blob_id,
+            encoding_status=model.EncodingStatusEnum.DECODED_OK if not did_have_decode_error else model.EncodingStatusEnum.UNICODE_DECODE_ERROR,
+            original_data_sha512=original_data_sha512,
+            compressed_data_sha512=blob_row.compressed_data_sha512)
+
+        sqla_session.add(submission_wp)
+
+        return submission_wp
+
+    @staticmethod
+    async def _read_stored_data(
+        raw_compressed_webpage_data:bytes|None,
+        storage_location:model.BlobStorageLocation,
+        compressed_data_sha512:str,
+        webpage_blob_store:blob_store.BlobStore|None) -> bytes:
+
+        if storage_location == model.BlobStorageLocation.DATABASE:
+            return raw_compressed_webpage_data
+
+        if webpage_blob_store is None:
+            raise Exception(f"webpage `{compressed_data_sha512}` is in the blob store but no blob store is configured")
+
+        return await webpage_blob_store.get(compressed_data_sha512)
+
+    @staticmethod
+    async def get_compressed_webpage_data(
+        sqla_session:AsyncSession,
+        submission_wp:db_model.SubmissionWebpage,
+        webpage_blob_store:blob_store.BlobStore|None=None) -> tuple[bytes, model.CompressionScheme]:
+        '''
+        returns the compressed page for a `submission_webpage` row, whether it is stored inline,
+        as a deduplicated blob, or in the blob store
+
+        @return a tuple of the compressed data and the CompressionScheme it is compressed with
+        '''
+
+        if submission_wp.blob_id is None:
+
+            compressed_data = await WebpageBlobUtils._read_stored_data(
+                submission_wp.raw_compressed_webpage_data,
+                submission_wp.storage_location,
+                submission_wp.compressed_data_sha512,
+                webpage_blob_store)
+
+            return (compressed_data, submission_wp.compression_scheme)
+
+        select_statement = select(
+                db_model.SubmissionWebpageBlob.raw_compressed_webpage_data,
+                db_model.SubmissionWebpageBlob.compression_scheme,
+                db_model.SubmissionWebpageBlob.storage_location,
+                db_model.SubmissionWebpageBlob.compressed_data_sha512) \
+            .where(db_model.SubmissionWebpageBlob.blob_id == submission_wp.blob_id)
+
+        select_result = await sqla_session.execute(select_statement)
+        blob_row = select_result.one()
+
+        compressed_data = await WebpageBlobUtils._read_stored_data(
+            blob_row.raw_compressed_webpage_data,
+            blob_row.storage_location,
+            blob_row.compressed_data_sha512,
+            webpage_blob_store)
+
+        return (compressed_data, blob_row.compression_scheme)
+
+    @staticmethod
+    async def get_webpage_data(
+        sqla_session:AsyncSession,
+        submission_wp:db_model.SubmissionWebpage,
+        webpage_blob_store:blob_store.BlobStore|None=None) -> bytes:
+        '''
+        returns the uncompressed page for a `submission_webpage` row, no matter how it is stored
+        or what recompress_archive has converted it to
+        '''
+
+        compressed_data, compression_scheme = await WebpageBlobUtils.get_compressed_webpage_data(sqla_session, submission_wp, webpage_blob_store)
+
+        return compression_utils.CompressionUtils.decompress(compression_scheme, compressed_data)
+
+    @staticmethod
+    async def delete_submission_webpage(
+        sqla_session:AsyncSession,
+        submission_wp:db_model.SubmissionWebpage):
+        '''
+        deletes a `submission_webpage` row, and the blob it references once nothing else references it
+
+        blobs in the blob store are left there, the same file can be shared by several rows since it is
+        keyed by its hash, and deleting it here could lose data if the transaction rolls back
+
+        this needs to be called inside of a transaction
+        '''
+
+        blob_id = submission_wp.blob_id
+
+        await sqla_session.delete(submission_wp)
+        await sqla_session.flush()
+
+        if blob_id is None:
+            return
+
+        blob_table = db_model.SubmissionWebpageBlob.__table__
+
+        update_statement = update(blob_table) \
+            .where(blob_table.c.blob_id == blob_id) \
+            .values(reference_count=blob_table.c.reference_count - 1) \
+            .returning(blob_table.c.reference_count)
+
+        update_result = await sqla_session.execute(update_statement)
+        reference_count = update_result.scalar_one()
+
+        logger.debug("blob `%s` now has `%s` references", blob_id, reference_count)
+
+        if reference_count <= 0:
+
+            # our update holds the row lock until we commit, so a worker adding a new reference to
+            # this page will wait, see the row is gone and store a new blob
+            delete_statement = delete(blob_table) \
+                .where(blob_table.c.blob_id == blob_id) \
+                .where(blob_table.c.reference_count <= 0)
+
+            await sqla_session.execute(delete_statement)
+
+            logger.info("deleted blob `%s` because it has no more references", blob_id)
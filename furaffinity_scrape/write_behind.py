@@ -0,0 +1,380 @@
+import logging
+import abc
+import asyncio
+import datetime
+
+import aio_pika
+from sqlalchemy import update, values, column, Integer
+from sqlalchemy.dialects.postgresql import insert
+
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import known_user_cache
+from furaffinity_scrape import submission_range_utils
+from furaffinity_scrape import prebuilt_statements
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindSink(abc.ABC):
+    '''
+    the parts every write-behind sink shares, a background task that calls flush() every
+    flush_interval_seconds and sets the stop event if that fails
+
+    subclasses implement flush(), taking self.flush_lock while they swap out what they are holding
+    '''
+
+    def __init__(self, stop_event:asyncio.Event, flush_size:int, flush_interval_seconds:float):
+
+        self.stop_event = stop_event
+        self.flush_size = flush_size
+        self.flush_interval_seconds = flush_interval_seconds
+
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
+
+    def start(self):
+        '''
+        starts the background task that flushes every flush_interval_seconds
+        '''
+
+        self.flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        '''
+        stops the background task and flushes anything we are still holding
+        '''
+
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+
+            self.flush_task = None
+
+        await self.flush()
+
+    async def _flush_periodically(self):
+
+        while True:
+
+            await asyncio.sleep(self.flush_interval_seconds)
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception("failed to flush `%s`, setting stop event", type(self).__name__)
+                self.stop_event.set()
+                return
+
+    @abc.abstractmethod
+    async def flush(self):
+        pass
+
+
+class UserWriteBehindSink(WriteBehindSink):
+    '''
+    collects the usernames found across many submissions, deduplicated in memory, and writes them
+    with one sorted bulk upsert instead of a select + upsert for every page
+
+    the submissions to mark as finished and their rabbitmq messages ride along with the users, the
+    submissions are marked finished in the same transaction as the upsert and the messages are only
+    acked once that has committed, so if we crash before a flush, the messages just get redelivered
+
+    the upsert is "on conflict do nothing", so two workers adding the same user don't fail, and the
+    names are sorted so that workers take the unique index locks in the same order and can't deadlock
+    '''
+
+    def __init__(
+        self,
+        async_sessionmaker,
+        stop_event:asyncio.Event,
+        flush_size:int,
+        flush_interval_seconds:float,
+        known_users:known_user_cache.KnownUserCache|None=None):
+        '''
+        @param async_sessionmaker - the sqlalchemy sessionmaker
+        @param stop_event - gets set if a flush from the background task fails
+        @param flush_size - flush once we are holding this many messages
+        @param flush_interval_seconds - flush at least this often if we are holding anything
+        @param known_users - if given, users it knows are already in the database aren't upserted
+        '''
+
+        super().__init__(stop_event, flush_size, flush_interval_seconds)
+
+        self.async_sessionmaker = async_sessionmaker
+        self.known_users = known_users
+
+        # user name -> the date we first saw it
+        self.pending_user_name_dict:dict[str, datetime.datetime] = dict()
+        self.pending_submission_id_list:list[int] = []
+        self.pending_message_list:list[aio_pika.abc.AbstractIncomingMessage] = []
+
+    async def add(
+        self,
+        users_found_set:set[str],
+        date_found:datetime.datetime,
+        submission_id:int|None,
+        message:aio_pika.abc.AbstractIncomingMessage):
+        '''
+        adds the users found on one submission, flushing if we are now holding flush_size messages
+
+        @param users_found_set - the usernames found on the page
+        @param date_found - the date to use for `date_added` if the user is new
+        @param submission_id - the `submission.submission_id` to mark finished, or None if there isn't one
+        @param message - the rabbitmq message to ack once this has been written
+        '''
+
+        for iter_user_name in users_found_set:
+            self.pending_user_name_dict.setdefault(iter_user_name, date_found)
+
+        if submission_id is not None:
+            self.pending_submission_id_list.append(submission_id)
+
+        self.pending_message_list.append(message)
+
+        logger.debug("user sink is holding `%s` users for `%s` messages", len(self.pending_user_name_dict), len(self.pending_message_list))
+
+        if len(self.pending_message_list) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        '''
+        writes everything we are holding in one transaction and then acks the messages
+
+        if the transaction fails, the messages are rejected so rabbitmq redelivers them and
+        the exception is raised
+        '''
+
+        async with self.flush_lock:
+
+            if not self.pending_message_list and not self.pending_user_name_dict:
+                return
+
+            user_name_dict = self.pending_user_name_dict
+            submission_id_list = self.pending_submission_id_list
+            message_list = self.pending_message_list
+
+            self.pending_user_name_dict = dict()
+            self.pending_submission_id_list = []
+            self.pending_message_list = []
+
+            try:
+
+                async with self.async_sessionmaker() as sqla_session:
+
+                    async with sqla_session.begin():
+
+                        if self.known_users is not None:
+                            unknown_user_set = await self.known_users.filter_unknown_users(sqla_session, user_name_dict.keys())
+                            user_name_to_upsert_dict = {k: v for k, v in user_name_dict.items() if k in unknown_user_set}
+                        else:
+                            user_name_to_upsert_dict = user_name_dict
+
+                        number_of_new_users = await self._upsert_users(sqla_session, user_name_to_upsert_dict)
+
+                        if submission_id_list:
+
+                            update_statement = update(db_model.Submission) \
+                                .where(db_model.Submission.submission_id.in_(submission_id_list)) \
+                                .values(processed_status=model.ProcessedStatus.FINISHED) \
+                                .execution_options(synchronize_session=False)
+
+                            await sqla_session.execute(update_statement)
+
+            except Exception as e:
+
+                logger.exception("failed to flush `%s` users, rejecting `%s` messages", len(user_name_dict), len(message_list))
+
+                for iter_message in message_list:
+                    await iter_message.reject(requeue=True)
+
+                raise e
+
+            # only now that it has committed are these users definitely in the database
+            if self.known_users is not None:
+                self.known_users.add_known_users(user_name_to_upsert_dict.keys())
+
+            for iter_message in message_list:
+                await iter_message.ack(multiple=False)
+
+            logger.info("flushed `%s` users (`%s` new), finished `%s` submissions and acked `%s` messages",
+                len(user_name_dict), number_of_new_users, len(submission_id_list), len(message_list))
+
+    async def _upsert_users(self, sqla_session, user_name_dict:dict[str, datetime.datetime]) -> int:
+        '''
+        inserts the users that aren't in the database yet, in sorted order
+
+        @return the number of users that were actually inserted
+        '''
+
+        if not user_name_dict:
+            return 0
+
+        # one prebuilt statement executed with a list of parameters, sqlalchemy splits it up into multi-row
+        # inserts that stay under the bind parameter limit, in the order we give it
+        upsert_result = await sqla_session.execute(prebuilt_statements.INSERT_USER_IF_MISSING, [
+            {"date_added": user_name_dict[iter_user_name], "user_name": iter_user_name}
+            for iter_user_name in sorted(user_name_dict.keys())])
+
+        # only the users that were actually inserted are returned
+        return len(upsert_result.all())
+
+
+class AttemptStatusWriteBehindSink(WriteBehindSink):
+    '''
+    collects `fa_scrape_attempt` status transitions (and the content of the finished ones) and writes
+    them all in one transaction, instead of one transaction per attempt
+
+    * the content rows are one multi-row insert
+    * the status transitions are merged per attempt, so only the last status we were given is written,
+      and written with one `UPDATE fa_scrape_attempt ... FROM (VALUES ...)`
+    * the finished ids go into `finished_submission_range`
+
+    like the user sink, the rabbitmq messages are only acked after that has committed, and are rejected
+    if it fails, so a crash before a flush just means the messages get redelivered
+    '''
+
+    def __init__(
+        self,
+        sqla_engine,
+        stop_event:asyncio.Event,
+        flush_size:int,
+        flush_interval_seconds:float):
+        '''
+        @param sqla_engine - the sqlalchemy AsyncEngine
+        @param stop_event - gets set if a flush from the background task fails
+        @param flush_size - flush once we are holding this many messages
+        @param flush_interval_seconds - flush at least this often if we are holding anything
+        '''
+
+        super().__init__(stop_event, flush_size, flush_interval_seconds)
+
+        self.sqla_engine = sqla_engine
+
+        # (scrape_attempt_id, furaffinity_submission_id) -> the latest status for that attempt
+        self.pending_status_dict:dict[tuple[int, int], model.ProcessedStatus] = dict()
+        self.pending_content_list:list[db_model.FAScrapeContent] = []
+        self.pending_message_list:list[aio_pika.abc.AbstractIncomingMessage] = []
+
+    async def add(
+        self,
+        attempt:db_model.FAScrapeAttempt,
+        processed_status:model.ProcessedStatus,
+        scrape_content:db_model.FAScrapeContent|None,
+        message:aio_pika.abc.AbstractIncomingMessage|None):
+        '''
+        records a status transition for an attempt, flushing if we are now holding flush_size messages
+
+        @param attempt - the attempt, only scrape_attempt_id and furaffinity_submission_id are used
+        @param processed_status - the status to move the attempt to
+        @param scrape_content - the content to insert for the attempt, or None
+        @param message - the rabbitmq message to ack once this has been written, or None
+        '''
+
+        self.pending_status_dict[(attempt.scrape_attempt_id, attempt.furaffinity_submission_id)] = processed_status
+
+        if scrape_content is not None:
+            self.pending_content_list.append(scrape_content)
+
+        if message is not None:
+            self.pending_message_list.append(message)
+
+        logger.debug("attempt sink is holding `%s` transitions for `%s` messages", len(self.pending_status_dict), len(self.pending_message_list))
+
+        if len(self.pending_message_list) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        '''
+        writes everything we are holding in one transaction and then acks the messages
+
+        if the transaction fails, the messages are rejected so rabbitmq redelivers them and
+        the exception is raised
+        '''
+
+        async with self.flush_lock:
+
+            if not self.pending_status_dict and not self.pending_message_list:
+                return
+
+            status_dict = self.pending_status_dict
+            content_list = self.pending_content_list
+            message_list = self.pending_message_list
+
+            self.pending_status_dict = dict()
+            self.pending_content_list = []
+            self.pending_message_list = []
+
+            try:
+
+                async with self.sqla_engine.begin() as sqla_connection:
+
+                    await self._insert_content(sqla_connection, content_list)
+                    await self._update_statuses(sqla_connection, status_dict)
+
+                    await submission_range_utils.SubmissionRangeUtils.mark_finished(sqla_connection,
+                        [iter_key[1] for iter_key, iter_status in status_dict.items() if iter_status == model.ProcessedStatus.FINISHED])
+
+            except Exception as e:
+
+                logger.exception("failed to flush `%s` attempt transitions, rejecting `%s` messages", len(status_dict), len(message_list))
+
+                for iter_message in message_list:
+                    await iter_message.reject(requeue=True)
+
+                raise e
+
+            for iter_message in message_list:
+                await iter_message.ack(multiple=False)
+
+            logger.info("flushed `%s` attempt transitions and `%s` content rows, acked `%s` messages",
+                len(status_dict), len(content_list), len(message_list))
+
+    async def _insert_content(self, sqla_connection, content_list:list[db_model.FAScrapeContent]):
+
+        if not content_list:
+            return
+
+        content_table = db_model.FAScrapeContent.__table__
+
+        insert_statement = insert(content_table).values([
+            {
+                "attempt_id": iter_content.attempt.scrape_attempt_id,
+                "furaffinity_submission_id": iter_content.attempt.furaffinity_submission_id,
+                "content_length": iter_content.content_length,
+                "content_sha512": iter_content.content_sha512,
+                "content_binary": iter_content.content_binary,
+            } for iter_content in content_list])
+
+        await sqla_connection.execute(insert_statement)
+
+    async def _update_statuses(self, sqla_connection, status_dict:dict[tuple[int, int], model.ProcessedStatus]):
+        '''
+        `UPDATE fa_scrape_attempt SET processed_status = new_status.processed_status FROM (VALUES ...) AS new_status
+        WHERE ...`, the rows are sorted so concurrent flushes lock them in the same order
+        '''
+
+        if not status_dict:
+            return
+
+        attempt_table = db_model.FAScrapeAttempt.__table__
+
+        new_status_values = values(
+                column("scrape_attempt_id", Integer),
+                column("furaffinity_submission_id", Integer),
+                column("processed_status", attempt_table.c.processed_status.type),
+                name="new_status") \
+            .data([(iter_key[0], iter_key[1], status_dict[iter_key]) for iter_key in sorted(status_dict.keys())])
+
+        update_statement = update(attempt_table) \
+            .where(attempt_table.c.scrape_attempt_id == new_status_values.c.scrape_attempt_id) \
+            .where(attempt_table.c.furaffinity_submission_id == new_status_values.c.furaffinity_submission_id) \
+            .values(processed_status=new_status_values.c.processed_status)
+
+        update_result = await sqla_connection.execute(update_statement)
+
+        if update_result.rowcount != len(status_dict):
+            raise Exception(f"expected to update `{len(status_dict)}` attempts but `{update_result.rowcount}` were updated")
@@ -0,0 +1,548 @@
+import argparse
+import abc
+import asyncio
+import logging
+import time
+import enum
+import math
+import os
+
+from sqlalchemy import select, update, values, column, bindparam, text, Integer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import partition_utils
+
+logging.basicConfig(level="INFO")
+
+logger = logging.getLogger("main")
+
+# measures the ways we can write rows, for the write patterns the scrapers actually have:
+#
+# * user_upsert - ScrapeUsers / UserWriteBehindSink inserting the users it found, about half of them
+#   already exist
+# * attempt_insert_update - ScrapeSubmissions starting an attempt (and needing its id) and then
+#   finishing it
+# * prescan_insert - FindFaHolesPrescan writing fa_hole_status rows
+# * content_insert - the fa_scrape_content rows with the compressed warc in them
+#
+# each one is written with:
+#
+# * orm - session.add_all() and flush(), what the code used to do
+# * core - one Core statement per row
+# * executemany - one Core statement executed with a list of parameters
+# * multi_values - one `INSERT ... VALUES (...), (...), ...` statement built per batch
+# * copy - asyncpg's binary COPY
+#
+# at each batch size, reporting rows/s and the percentiles of how long one batch took
+#
+# everything runs in one transaction against the database in --config, every measurement is rolled
+# back to a savepoint so they all start from the same tables, and the whole transaction is rolled back
+# at the end, so nothing is written. point it at a local / throwaway database, not the live one, the
+# inserts still take locks and the rows still go through the indexes
+
+BENCHMARK_IDENTITY = "benchmark_database_writes"
+BENCHMARK_RUN_ID = -1
+# the submission ids the attempt / content rows use, these have to have partitions
+BENCHMARK_SUBMISSION_ID_START = 999_000
+BENCHMARK_SUBMISSION_ID_COUNT = 1000
+
+METHOD_NAME_LIST = ["orm", "core", "executemany", "multi_values", "copy"]
+
+
+class BenchmarkContext:
+    '''
+    what the write methods need, the session and the asyncpg connection under it (for COPY)
+    '''
+
+    def __init__(self, sqla_session, asyncpg_connection):
+
+        self.sqla_session = sqla_session
+        self.asyncpg_connection = asyncpg_connection
+        self.counter = 0
+
+    def next_number(self) -> int:
+
+        self.counter += 1
+        return self.counter
+
+
+def to_copy_value(value):
+    '''
+    COPY skips the sqlalchemy types, so the enums have to be their values and the sha512s raw bytes
+    '''
+
+    if isinstance(value, enum.Enum):
+        return value.value
+
+    return value
+
+async def copy_rows(context:BenchmarkContext, table, row_list:list[dict], sha512_column_name_list:list[str]=[]):
+
+    column_name_list = list(row_list[0].keys())
+
+    record_list = [
+        tuple(
+            bytes.fromhex(iter_row[iter_column_name]) if iter_column_name in sha512_column_name_list else to_copy_value(iter_row[iter_column_name])
+            for iter_column_name in column_name_list)
+        for iter_row in row_list]
+
+    await context.asyncpg_connection.copy_records_to_table(table.name, records=record_list, columns=column_name_list)
+
+async def update_attempts_from_values(context:BenchmarkContext, key_list:list[tuple[int, int]]):
+    '''
+    what AttemptStatusWriteBehindSink does, one `UPDATE ... FROM (VALUES ...)`
+    '''
+
+    attempt_table = db_model.FAScrapeAttempt.__table__
+
+    new_status_values = values(
+            column("scrape_attempt_id", Integer),
+            column("furaffinity_submission_id", Integer),
+            column("processed_status", attempt_table.c.processed_status.type),
+            name="new_status") \
+        .data([(iter_key[0], iter_key[1], model.ProcessedStatus.FINISHED) for iter_key in key_list])
+
+    await context.sqla_session.execute(update(attempt_table) \
+        .where(attempt_table.c.scrape_attempt_id == new_status_values.c.scrape_attempt_id) \
+        .where(attempt_table.c.furaffinity_submission_id == new_status_values.c.furaffinity_submission_id) \
+        .values(processed_status=new_status_values.c.processed_status))
+
+
+class WritePattern(abc.ABC):
+
+    name = None
+
+    async def setup_once(self, context:BenchmarkContext):
+        '''
+        called once before any measurement of this pattern, this isn't rolled back between measurements
+        '''
+        pass
+
+    async def setup_measurement(self, context:BenchmarkContext, number_of_rows:int):
+        '''
+        called before each measurement (not timed), this is rolled back after it
+        '''
+        pass
+
+    @abc.abstractmethod
+    def make_rows(self, context:BenchmarkContext, batch_size:int) -> list[dict]:
+        pass
+
+    async def write(self, method_name:str, context:BenchmarkContext, row_list:list[dict]):
+
+        await getattr(self, f"write_{method_name}")(context, row_list)
+
+
+class SimpleInsertPattern(WritePattern):
+    '''
+    a pattern that is just inserting rows into one table
+    '''
+
+    orm_class = None
+    sha512_column_name_list = []
+
+    async def write_orm(self, context:BenchmarkContext, row_list:list[dict]):
+
+        context.sqla_session.add_all([self.orm_class(**iter_row) for iter_row in row_list])
+        await context.sqla_session.flush()
+
+    async def write_core(self, context:BenchmarkContext, row_list:list[dict]):
+
+        for iter_row in row_list:
+            await context.sqla_session.execute(insert(self.orm_class.__table__), iter_row)
+
+    async def write_executemany(self, context:BenchmarkContext, row_list:list[dict]):
+
+        await context.sqla_session.execute(insert(self.orm_class.__table__), row_list)
+
+    async def write_multi_values(self, context:BenchmarkContext, row_list:list[dict]):
+
+        await context.sqla_session.execute(insert(self.orm_class.__table__).values(row_list))
+
+    async def write_copy(self, context:BenchmarkContext, row_list:list[dict]):
+
+        await copy_rows(context, self.orm_class.__table__, row_list, self.sha512_column_name_list)
+
+
+class UserUpsertPattern(WritePattern):
+
+    name = "user_upsert"
+
+    number_of_existing_users = 1000
+
+    async def setup_once(self, context:BenchmarkContext):
+
+        await context.sqla_session.execute(insert(db_model.User.__table__).on_conflict_do_nothing(), [
+            {"date_added": utils.utcnow(), "user_name": f"{BENCHMARK_IDENTITY}_existing_{i}"} for i in range(self.number_of_existing_users)])
+
+        await context.sqla_session.execute(text(
+            "CREATE TEMPORARY TABLE benchmark_user_staging (date_added timestamptz NOT NULL, user_name varchar NOT NULL)"))
+
+    def make_rows(self, context:BenchmarkContext, batch_size:int) -> list[dict]:
+
+        current_date = utils.utcnow()
+        user_name_set = set()
+
+        # half of them already exist, sorted like UserWriteBehindSink does
+        for i in range(batch_size):
+            number = context.next_number()
+
+            if i % 2 == 0:
+                user_name_set.add(f"{BENCHMARK_IDENTITY}_existing_{number % self.number_of_existing_users}")
+            else:
+                user_name_set.add(f"{BENCHMARK_IDENTITY}_new_{number}")
+
+        return [{"date_added": current_date, "user_name": iter_user_name} for iter_user_name in sorted(user_name_set)]
+
+    async def write_orm(self, context:BenchmarkContext, row_list:list[dict]):
+
+        # the ORM can't do ON CONFLICT, so look up the ones that exist first
+        existing_result = await context.sqla_session.execute(
+            select(db_model.User.user_name).where(db_model.User.user_name.in_([iter_row["user_name"] for iter_row in row_list])))
+        existing_user_name_set = set(existing_result.scalars().all())
+
+        context.sqla_session.add_all([db_model.User(**iter_row) for iter_row in row_list if iter_row["user_name"] not in existing_user_name_set])
+        await context.sqla_session.flush()
+
+    async def write_core(self, context:BenchmarkContext, row_list:list[dict]):
+
+        for iter_row in row_list:
+            await context.sqla_session.execute(
+                insert(db_model.User.__table__).on_conflict_do_nothing(index_elements=[db_model.User.__table__.c.user_name]), iter_row)
+
+    async def write_executemany(self, context:BenchmarkContext, row_list:list[dict]):
+
+        await context.sqla_session.execute(
+            insert(db_model.User.__table__).on_conflict_do_nothing(index_elements=[db_model.User.__table__.c.user_name]), row_list)
+
+    async def write_multi_values(self, context:BenchmarkContext, row_list:list[dict]):
+
+        await context.sqla_session.execute(
+            insert(db_model.User.__table__).values(row_list).on_conflict_do_nothing(index_elements=[db_model.User.__table__.c.user_name]))
+
+    async def write_copy(self, context:BenchmarkContext, row_list:list[dict]):
+
+        # COPY can't skip conflicts, so COPY into a staging table and upsert from there
+        await context.asyncpg_connection.execute("TRUNCATE benchmark_user_staging")
+        await context.asyncpg_connection.copy_records_to_table("benchmark_user_staging",
+            records=[(iter_row["date_added"], iter_row["user_name"]) for iter_row in row_list], columns=["date_added", "user_name"])
+        await context.asyncpg_connection.execute(
+            'INSERT INTO "user" (date_added, user_name) SELECT date_added, user_name FROM benchmark_user_staging '
+            'ORDER BY user_name ON CONFLICT (user_name) DO NOTHING')
+
+
+class AttemptInsertUpdatePattern(WritePattern):
+
+    name = "attempt_insert_update"
+
+    def make_rows(self, context:BenchmarkContext, batch_size:int) -> list[dict]:
+
+        current_date = utils.utcnow()
+
+        return [{
+            "furaffinity_submission_id": BENCHMARK_SUBMISSION_ID_START + (context.next_number() % BENCHMARK_SUBMISSION_ID_COUNT),
+            "date_visited": current_date,
+            "processed_status": model.ProcessedStatus.TODO,
+            "claimed_by": BENCHMARK_IDENTITY,
+        } for i in range(batch_size)]
+
+    async def write_orm(self, context:BenchmarkContext, row_list:list[dict]):
+
+        attempt_list = [db_model.FAScrapeAttempt(**iter_row) for iter_row in row_list]
+        context.sqla_session.add_all(attempt_list)
+        await context.sqla_session.flush()
+
+        for iter_attempt in attempt_list:
+            iter_attempt.processed_status = model.ProcessedStatus.FINISHED
+
+        await context.sqla_session.flush()
+
+    async def write_core(self, context:BenchmarkContext, row_list:list[dict]):
+
+        attempt_table = db_model.FAScrapeAttempt.__table__
+
+        for iter_row in row_list:
+
+            insert_result = await context.sqla_session.execute(
+                insert(attempt_table).returning(attempt_table.c.scrape_attempt_id), iter_row)
+
+            await context.sqla_session.execute(update(attempt_table) \
+                .where(attempt_table.c.scrape_attempt_id == insert_result.scalar_one()) \
+                .where(attempt_table.c.furaffinity_submission_id == iter_row["furaffinity_submission_id"]) \
+                .values(processed_status=model.ProcessedStatus.FINISHED))
+
+    async def write_executemany(self, context:BenchmarkContext, row_list:list[dict]):
+
+        attempt_table = db_model.FAScrapeAttempt.__table__
+
+        insert_result = await context.sqla_session.execute(
+            insert(attempt_table).returning(attempt_table.c.scrape_attempt_id, attempt_table.c.furaffinity_submission_id, sort_by_parameter_order=True),
+            row_list)
+
+        await context.sqla_session.execute(update(attempt_table) \
+            .where(attempt_table.c.scrape_attempt_id == bindparam("b_scrape_attempt_id")) \
+            .where(attempt_table.c.furaffinity_submission_id == bindparam("b_furaffinity_submission_id")) \
+            .values(processed_status=model.ProcessedStatus.FINISHED) \
+            .execution_options(synchronize_session=False),
+            [{"b_scrape_attempt_id": iter_row[0], "b_furaffinity_submission_id": iter_row[1]} for iter_row in insert_result.all()])
+
+    async def write_multi_values(self, context:BenchmarkContext, row_list:list[dict]):
+
+        attempt_table = db_model.FAScrapeAttempt.__table__
+
+        insert_result = await context.sqla_session.execute(
+            insert(attempt_table).values(row_list).returning(attempt_table.c.scrape_attempt_id, attempt_table.c.furaffinity_submission_id))
+
+        await update_attempts_from_values(context, [tuple(iter_row) for iter_row in insert_result.all()])
+
+    async def write_copy(self, context:BenchmarkContext, row_list:list[dict]):
+
+        # COPY can't return the ids, so take them from the sequence first
+        id_list = [iter_record[0] for iter_record in await context.asyncpg_connection.fetch(
+            "SELECT nextval(pg_get_serial_sequence('fa_scrape_attempt', 'scrape_attempt_id')) FROM generate_series(1, $1)", len(row_list))]
+
+        await copy_rows(context, db_model.FAScrapeAttempt.__table__,
+            [{"scrape_attempt_id": iter_id, **iter_row} for iter_id, iter_row in zip(id_list, row_list)])
+
+        await update_attempts_from_values(context, [(iter_id, iter_row["furaffinity_submission_id"]) for iter_id, iter_row in zip(id_list, row_list)])
+
+
+class PrescanInsertPattern(SimpleInsertPattern):
+
+    name = "prescan_insert"
+    orm_class = db_model.FuraffinityHoleStatus
+
+    def make_rows(self, context:BenchmarkContext, batch_size:int) -> list[dict]:
+
+        return [{
+            "run_id": BENCHMARK_RUN_ID,
+            "processed_status": model.ProcessedStatus.TODO,
+            "file_path": f"/{BENCHMARK_IDENTITY}/fa_item_{context.next_number()}.warc.7z",
+            "warc_sha512": None,
+            "fa_submission_status": model.FuraffinitySubmissionStatus.UNKNOWN,
+        } for i in range(batch_size)]
+
+
+class ContentInsertPattern(SimpleInsertPattern):
+
+    name = "content_insert"
+    orm_class = db_model.FAScrapeContent
+    sha512_column_name_list = ["content_sha512"]
+
+    def __init__(self, content_size:int):
+
+        self.content_binary = os.urandom(content_size)
+        self.content_sha512 = utils.sha512_hexdigest(self.content_binary)
+        self.attempt_key_list = []
+
+    async def setup_measurement(self, context:BenchmarkContext, number_of_rows:int):
+
+        # the content rows need attempts to point at
+        attempt_table = db_model.FAScrapeAttempt.__table__
+        current_date = utils.utcnow()
+
+        insert_result = await context.sqla_session.execute(
+            insert(attempt_table).returning(attempt_table.c.scrape_attempt_id, attempt_table.c.furaffinity_submission_id), [{
+                "furaffinity_submission_id": BENCHMARK_SUBMISSION_ID_START + (i % BENCHMARK_SUBMISSION_ID_COUNT),
+                "date_visited": current_date,
+                "processed_status": model.ProcessedStatus.FINISHED,
+                "claimed_by": BENCHMARK_IDENTITY,
+            } for i in range(number_of_rows)])
+
+        self.attempt_key_list = [tuple(iter_row) for iter_row in insert_result.all()]
+
+    def make_rows(self, context:BenchmarkContext, batch_size:int) -> list[dict]:
+
+        row_list = []
+
+        for i in range(batch_size):
+
+            attempt_id, furaffinity_submission_id = self.attempt_key_list.pop()
+
+            row_list.append({
+                "attempt_id": attempt_id,
+                "furaffinity_submission_id": furaffinity_submission_id,
+                "content_length": len(self.content_binary),
+                "content_sha512": self.content_sha512,
+                "content_binary": self.content_binary,
+            })
+
+        return row_list
+
+
+def percentile(sorted_value_list:list[float], percent:float) -> float:
+
+    return sorted_value_list[min(len(sorted_value_list) - 1, int(round(percent / 100 * (len(sorted_value_list) - 1))))]
+
+async def measure(
+    context:BenchmarkContext,
+    pattern:WritePattern,
+    method_name:str,
+    batch_size:int,
+    number_of_batches:int):
+
+    sqla_session = context.sqla_session
+
+    savepoint = await sqla_session.begin_nested()
+
+    try:
+
+        await pattern.setup_measurement(context, batch_size * number_of_batches)
+
+        batch_seconds_list = []
+
+        for i in range(number_of_batches):
+
+            row_list = pattern.make_rows(context, batch_size)
+
+            start = time.perf_counter()
+            await pattern.write(method_name, context, row_list)
+            batch_seconds_list.append(time.perf_counter() - start)
+
+            # don't let the ORM's identity map grow over the measurement
+            sqla_session.expunge_all()
+
+    finally:
+        await savepoint.rollback()
+
+    batch_seconds_list.sort()
+    rows_per_second = (batch_size * number_of_batches) / sum(batch_seconds_list)
+
+    logger.info("%-22s %-13s batch `%5s`: `%9.0f` rows/s, batch p50 `%8.2f` ms, p95 `%8.2f` ms, p99 `%8.2f` ms",
+        pattern.name, method_name, batch_size, rows_per_second,
+        percentile(batch_seconds_list, 50) * 1000, percentile(batch_seconds_list, 95) * 1000, percentile(batch_seconds_list, 99) * 1000)
+
+async def run_benchmark(
+    config:model.Settings,
+    pattern_name_list:list[str],
+    method_name_list:list[str],
+    batch_size_list:list[int],
+    rows_per_measurement:int,
+    min_batches:int,
+    content_size:int):
+
+    sqla_engine = utils.setup_sqlalchemy_engine(config.sqla_url, config.database_pool_settings)
+    async_sessionmaker = sessionmaker(bind=sqla_engine, expire_on_commit=False, class_=AsyncSession)
+
+    pattern_dict = {iter_pattern.name: iter_pattern for iter_pattern in [
+        UserUpsertPattern(),
+        AttemptInsertUpdatePattern(),
+        PrescanInsertPattern(),
+        ContentInsertPattern(content_size),
+    ]}
+
+    try:
+
+        async with async_sessionmaker() as sqla_session:
+
+            await sqla_session.begin()
+
+            sqla_connection = await sqla_session.connection()
+            raw_connection = await sqla_connection.get_raw_connection()
+            context = BenchmarkContext(sqla_session, raw_connection.driver_connection)
+
+            await partition_utils.PartitionUtils.ensure_submission_partitions(
+                sqla_session, BENCHMARK_SUBMISSION_ID_START, BENCHMARK_SUBMISSION_ID_START + BENCHMARK_SUBMISSION_ID_COUNT - 1)
+
+            for iter_pattern_name in pattern_name_list:
+
+                pattern = pattern_dict[iter_pattern_name]
+                await pattern.setup_once(context)
+
+                for iter_batch_size in batch_size_list:
+
+                    number_of_batches = max(min_batches, math.ceil(rows_per_measurement / iter_batch_size))
+
+                    for iter_method_name in method_name_list:
+                        await measure(context, pattern, iter_method_name, iter_batch_size, number_of_batches)
+
+            await sqla_session.rollback()
+
+    finally:
+        await sqla_engine.dispose()
+
+
+def comma_separated_list(item_type, choice_list=None):
+
+    def _parse(string_arg:str) -> list:
+
+        item_list = [item_type(iter_item.strip()) for iter_item in string_arg.split(",") if iter_item.strip()]
+
+        if choice_list is not None:
+            for iter_item in item_list:
+                if iter_item not in choice_list:
+                    raise argparse.ArgumentTypeError(f"`{iter_item}` isn't one of `{', '.join(choice_list)}`")
+
+        return item_list
+
+    return _parse
+
+
+PATTERN_NAME_LIST = [
+    UserUpsertPattern.name,
+    AttemptInsertUpdatePattern.name,
+    PrescanInsertPattern.name,
+    ContentInsertPattern.name,
+]
+
+parser = argparse.ArgumentParser(
+    description="benchmark the ways of writing rows for the write patterns of the scrapers",
+    fromfile_prefix_chars='@')
+
+parser.add_argument("--config",
+    dest="config",
+    required=True,
+    type=utils.parse_config,
+    help="the HOCON config file, for the database settings. use a local / throwaway database")
+
+parser.add_argument("--patterns",
+    dest="pattern_name_list",
+    type=comma_separated_list(str, PATTERN_NAME_LIST),
+    default=PATTERN_NAME_LIST,
+    help=f"comma separated, which write patterns to run, out of `{','.join(PATTERN_NAME_LIST)}`")
+
+parser.add_argument("--methods",
+    dest="method_name_list",
+    type=comma_separated_list(str, METHOD_NAME_LIST),
+    default=METHOD_NAME_LIST,
+    help=f"comma separated, which ways of writing to compare, out of `{','.join(METHOD_NAME_LIST)}`")
+
+parser.add_argument("--batch-sizes",
+    dest="batch_size_list",
+    type=comma_separated_list(int),
+    default=[1, 10, 100, 1000],
+    help="comma separated, the batch sizes to measure")
+
+parser.add_argument("--rows",
+    dest="rows_per_measurement",
+    type=int,
+    default=2000,
+    help="about how many rows to write per pattern / method / batch size")
+
+parser.add_argument("--min-batches",
+    dest="min_batches",
+    type=int,
+    default=20,
+    help="write at least this many batches per measurement, so the percentiles mean something")
+
+parser.add_argument("--content-size",
+    dest="content_size",
+    type=int,
+    default=64 * 1024,
+    help="the size in bytes of content_binary for the content_insert pattern")
+
+parsed_args = parser.parse_args()
+
+asyncio.run(run_benchmark(
+    parsed_args.config,
+    parsed_args.pattern_name_list,
+    parsed_args.method_name_list,
+    parsed_args.batch_size_list,
+    parsed_args.rows_per_measurement,
+    parsed_args.min_batches,
+    parsed_args.content_size))
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import logging
+import time
+import datetime
+
+from sqlalchemy import select, update, desc, or_, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from furaffinity_scrape import utils
+from furaffinity_scrape import model
+from furaffinity_scrape import db_model
+from furaffinity_scrape import partition_utils
+from furaffinity_scrape import prebuilt_statements
+
+logging.basicConfig(level="INFO")
+
+logger = logging.getLogger("main")
+
+# compares building the hot path statements on every call (how they used to be written) against
+# executing the objects in prebuilt_statements, against a real database
+#
+# everything runs in one transaction that is rolled back at the end, so nothing is written. the
+# number to look at is the cpu time per call, the wall time is mostly the database round trip
+
+BENCHMARK_SUBMISSION_ID = 999_999
+BENCHMARK_IDENTITY = "benchmark_prebuilt_statements"
+
+
+def build_claim_submission(submission_id, current_date):
+
+    insert_statement = insert(db_model.Submission).values(
+        furaffinity_submission_id=submission_id,
+        date_visited=current_date,
+        submission_status=model.SubmissionStatus.UNKNOWN,
+        processed_status=model.ProcessedStatus.TODO,
+        claimed_by=BENCHMARK_IDENTITY)
+
+    return insert_statement.on_conflict_do_update(
+        index_elements=[db_model.Submission.furaffinity_submission_id],
+        set_={
+            "date_visited": insert_statement.excluded.date_visited,
+            "claimed_by": insert_statement.excluded.claimed_by,
+        },
+        where=db_model.Submission.processed_status != model.ProcessedStatus.FINISHED) \
+        .returning(db_model.Submission)
+
+def build_latest_attempt():
+
+    return select(db_model.FAScrapeAttempt.furaffinity_submission_id) \
+        .order_by(desc(db_model.FAScrapeAttempt.furaffinity_submission_id)).limit(1)
+
+def build_claim_hole_status(now, batch_size):
+
+    hole_status_class = db_model.FuraffinityHoleStatus
+
+    claimable_select = select(hole_status_class.item_id) \
+        .where(or_(
+            hole_status_class.processed_status == model.ProcessedStatus.TODO,
+            and_(
+                hole_status_class.processed_status == model.ProcessedStatus.IN_PROGRESS,
+                hole_status_class.lease_expires < now))) \
+        .order_by(hole_status_class.item_id) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True)
+
+    return update(hole_status_class) \
+        .where(hole_status_class.item_id.in_(claimable_select)) \
+        .values(
+            processed_status=model.ProcessedStatus.IN_PROGRESS,
+            claimed_by=BENCHMARK_IDENTITY,
+            lease_expires=now + datetime.timedelta(seconds=60)) \
+        .returning(hole_status_class) \
+        .execution_options(synchronize_session=False)
+
+def build_insert_users(user_name_list, current_date):
+
+    return insert(db_model.User.__table__) \
+        .values([{"date_added": current_date, "user_name": iter_user_name} for iter_user_name in user_name_list]) \
+        .on_conflict_do_nothing(index_elements=[db_model.User.__table__.c.user_name])
+
+
+async def time_calls(name:str, iterations:int, call):
+
+    # one call to warm the compiled cache, like a long running worker would be
+    await call()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for i in range(iterations):
+        await call()
+
+    cpu_per_call = (time.process_time() - cpu_start) / iterations
+    wall_per_call = (time.perf_counter() - wall_start) / iterations
+
+    logger.info("%-40s cpu `%8.1f` us/call, wall `%8.1f` us/call", name, cpu_per_call * 1e6, wall_per_call * 1e6)
+
+    return cpu_per_call
+
+async def run_benchmark(config:model.Settings, iterations:int, number_of_users:int):
+
+    sqla_engine = utils.setup_sqlalchemy_engine(config.sqla_url, config.database_pool_settings)
+    async_sessionmaker = sessionmaker(bind=sqla_engine, expire_on_commit=False, class_=AsyncSession)
+
+    current_date = utils.utcnow()
+    user_name_list = sorted(f"{BENCHMARK_IDENTITY}_{i}" for i in range(number_of_users))
+
+    try:
+
+        async with async_sessionmaker() as sqla_session:
+
+            await sqla_session.begin()
+
+            await partition_utils.PartitionUtils.ensure_submission_partitions(
+                sqla_session, BENCHMARK_SUBMISSION_ID, BENCHMARK_SUBMISSION_ID)
+
+            pair_list = [
+                (
+                    "claim_next_submission",
+                    lambda: sqla_session.execute(build_claim_submission(BENCHMARK_SUBMISSION_ID, current_date)),
+                    lambda: sqla_session.execute(prebuilt_statements.CLAIM_SUBMISSION, {
+                        "furaffinity_submission_id": BENCHMARK_SUBMISSION_ID,
+                        "date_visited": current_date,
+                        "claimed_by": BENCHMARK_IDENTITY})
+                ),
+                (
+                    "get_latest_finished_fa_submission",
+                    lambda: sqla_session.execute(build_latest_attempt()),
+                    lambda: sqla_session.execute(prebuilt_statements.LATEST_ATTEMPT_FURAFFINITY_SUBMISSION_ID)
+                ),
+                (
+                    "FindFaHoles.claim_batch",
+                    lambda: sqla_session.execute(build_claim_hole_status(current_date, 20)),
+                    lambda: sqla_session.execute(prebuilt_statements.CLAIM_HOLE_STATUS, {
+                        "now": current_date,
+                        "batch_size": 20,
+                        "identity_string": BENCHMARK_IDENTITY,
+                        "new_lease_expires": current_date + datetime.timedelta(seconds=60)})
+                ),
+                (
+                    f"insert {number_of_users} users",
+                    lambda: sqla_session.execute(build_insert_users(user_name_list, current_date)),
+                    lambda: sqla_session.execute(prebuilt_statements.INSERT_USER_IF_MISSING,
+                        [{"date_added": current_date, "user_name": iter_user_name} for iter_user_name in user_name_list])
+                ),
+            ]
+
+            for iter_name, iter_build_every_call, iter_prebuilt in pair_list:
+
+                built_cpu = await time_calls(f"{iter_name} (built every call)", iterations, iter_build_every_call)
+                prebuilt_cpu = await time_calls(f"{iter_name} (prebuilt)", iterations, iter_prebuilt)
+
+                logger.info("%-40s prebuilt uses `%.1f%%` of the cpu time", iter_name, prebuilt_cpu / built_cpu * 100)
+
+            await sqla_session.rollback()
+
+    finally:
+        await sqla_engine.dispose()
+
+
+parser = argparse.ArgumentParser(
+    description="benchmark the per call overhead of the prebuilt statements",
+    fromfile_prefix_chars='@')
+
+parser.add_argument("--config",
+    dest="config",
+    required=True,
+    type=utils.parse_config,
+    help="the HOCON config file, for the database settings")
+
+parser.add_argument("--iterations",
+    dest="iterations",
+    type=int,
+    default=2000,
+    help="how many times to run each statement")
+
+parser.add_argument("--users",
+    dest="number_of_users",
+    type=int,
+    default=25,
+    help="how many users to insert per call for the user insert")
+
+parsed_args = parser.parse_args()
+
+asyncio.run(run_benchmark(parsed_args.config, parsed_args.iterations, parsed_args.number_of_users))